@@ -0,0 +1,417 @@
+"""
+Throughput benchmark for the detection, mitigation and automated-evaluation stages.
+
+A synthetic dataset of `--rows` rows is generated and every stage of both
+pipelines is driven over it through its library entry point:
+
+    mtraig.detection.evaluate → mtraig.mitigation.run_mitigation → mtraig.automated_eval.evaluate_mitigation
+    g_eval.detection.evaluate (both) → g_eval.mitigation.run_mitigation → g_eval.automated_eval.evaluate_mitigation
+
+LLM answers are replayed from a fixture file (`common/llm_backend.py`) with
+`--latency` seconds per call and a `--error_rate` share of retryable failures.
+The fixtures are recorded from the mock backend on the first run for a given
+size and seed, or taken from `--fixtures` (e.g. recorded from the API);
+requests missing from them are answered by the mock. The response cache and
+the claim memo are off, so every run makes the same calls.
+
+Each stage runs in its own process against a copy of the source tree in a
+scratch directory, so the repository's checkpoints are never touched. Per
+stage the benchmark reports rows/sec, startup time (process start until the
+stage module is imported), peak RSS, and bytes written and read while the
+stage ran (checkpoints, mitigation outputs and results; logging is off; reads
+include loading the dataset and the fixtures). The
+results are appended to `--history` with the commit they were measured on, and
+compared with the last entry for the same settings from another commit.
+
+Usage:
+    python -m benchmarks.pipeline_bench --rows 10000 --latency 0.002 --error_rate 0.01
+"""
+
+import argparse
+import contextlib
+import importlib
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = REPO_ROOT / ".bench"
+DEFAULT_HISTORY = REPO_ROOT / "benchmarks" / "history.jsonl"
+SOURCE_PACKAGES = ["common", "mtraig", "g_eval", "benchmarks"]
+MODEL = "gpt-4o-mini"
+SYSTEMS_PER_EXAMPLE = 3
+
+# --- synthetic data ---
+
+_TEAMS = ["Ajax", "Benfica", "Celtic", "Dynamo", "Everton", "Feyenoord", "Galatasaray", "Hajduk", "Inter", "Juventus"]
+_STATS = ["Goals", "Wins", "Losses", "Points", "Attendance"]
+
+
+def _table(rng: random.Random) -> Tuple[List[str], List[List[str]]]:
+    header = ["Year", "Team"] + rng.sample(_STATS, 2)
+    start = rng.randint(1960, 2010)
+    rows = [
+        [str(start + i), rng.choice(_TEAMS), str(rng.randint(0, 99)), str(rng.randint(0, 99))]
+        for i in range(rng.randint(5, 15))
+    ]
+    return header, rows
+
+
+def _answer(rng: random.Random, header: List[str], rows: List[List[str]]) -> str:
+    sentences = []
+    for row in rng.sample(rows, min(len(rows), rng.randint(2, 5))):
+        value = row[2] if rng.random() < 0.8 else str(int(row[2]) + rng.randint(1, 9))
+        sentences.append(f"In {row[0]}, {row[1]} recorded {value} {header[2].lower()}.")
+    return " ".join(sentences)
+
+
+def synthetic_rows(dataset: str, n: int, seed: int) -> List[dict]:
+    """
+    `n` rows in the preprocessed `model_outputs_with_scores_{dataset}.json`
+    format, SYSTEMS_PER_EXAMPLE answers per example and table.
+    """
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        if i % SYSTEMS_PER_EXAMPLE == 0:
+            header, rows = _table(rng)
+            example_id = f"bench-{i // SYSTEMS_PER_EXAMPLE}"
+            question = f"How did the teams perform between {rows[0][0]} and {rows[-1][0]}?"
+        if dataset == "fetaqa":
+            metadata = {
+                "table_page_title": f"Season summary {example_id}",
+                "table_section_title": "Results",
+                "table_array": [header] + rows,
+            }
+        else:
+            metadata = {"table": {"title": f"Season summary {example_id}", "header": header, "rows": rows}}
+        out.append({
+            "example_id": example_id,
+            "question": question,
+            "model_output": _answer(rng, header, rows),
+            "faithfulness_score": rng.choice([2, 3, 4, 5, 5]),
+            "completeness_score": rng.choice([2, 3, 4, 5, 5]),
+            "serialized_table": {"title": f"Season summary {example_id}", "header": header, "rows": rows},
+            "metadata": metadata,
+        })
+    return out
+
+
+# --- stages ---
+
+Stage = Tuple[str, Callable[[object, dict], None], Callable[[Path, dict], int]]
+
+
+def _lines(path: Path) -> int:
+    if not path.exists():
+        return 0
+    with path.open("rb") as f:
+        return sum(1 for _ in f)
+
+
+STAGES: List[Stage] = [
+    ("mtraig.detection",
+     lambda m, o: m.evaluate(o["dataset"], MODEL, max_concurrency=o["max_concurrency"]),
+     lambda run, o: o["rows"]),
+    ("mtraig.mitigation",
+     lambda m, o: m.run_mitigation(o["dataset"], MODEL),
+     lambda run, o: _lines(run / "mtraig" / "mitigation_outputs" / f"{MODEL}_{o['dataset']}.jsonl")),
+    ("mtraig.automated_eval",
+     lambda m, o: m.evaluate_mitigation(o["dataset"], MODEL, max_concurrency=o["max_concurrency"]),
+     lambda run, o: _lines(run / "mtraig" / "mitigation_outputs" / f"{MODEL}_{o['dataset']}.jsonl")),
+    ("g_eval.detection",
+     lambda m, o: m.evaluate(o["dataset"], model_name=MODEL, mode="both", workers=o["workers"]),
+     lambda run, o: o["rows"]),
+    ("g_eval.mitigation",
+     lambda m, o: m.run_mitigation(o["dataset"], "normal", MODEL),
+     lambda run, o: _lines(run / "g_eval" / "mitigation_outputs" / "normal" / f"{MODEL}_{o['dataset']}.jsonl")),
+    ("g_eval.automated_eval",
+     lambda m, o: m.evaluate_mitigation(o["dataset"], MODEL, "normal", "both"),
+     lambda run, o: _lines(run / "g_eval" / "mitigation_outputs" / "normal" / f"{MODEL}_{o['dataset']}.jsonl")),
+]
+STAGE_NAMES = [name for name, _, _ in STAGES]
+
+
+def _proc_io() -> Dict[str, int]:
+    # rchar/wchar count every read/write call, cached or not; {} off Linux
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+
+class _Discard:
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def run_child(stage: str, options: dict, out_file: str):
+    """
+    Body of one stage process: import the stage, run it with output silenced
+    and write its timings and I/O counters to `out_file`.
+    """
+    spawned = float(os.environ["BENCH_SPAWNED_AT"])
+    module = importlib.import_module(stage)
+    startup = time.time() - spawned
+    logging.disable(logging.CRITICAL)
+    _, fn, _ = STAGES[STAGE_NAMES.index(stage)]
+    io_before = _proc_io()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(_Discard()):
+        fn(module, options)
+    elapsed = time.perf_counter() - started
+    io_after = _proc_io()
+    result = {
+        "startup_s": startup,
+        "elapsed_s": elapsed,
+        "write_bytes": io_after["wchar"] - io_before["wchar"] if io_after else None,
+        "read_bytes": io_after["rchar"] - io_before["rchar"] if io_after else None,
+    }
+    with open(out_file, "w") as f:
+        json.dump(result, f)
+
+
+# --- driver ---
+
+def _copy_tree(run_dir: Path):
+    def ignore(directory: str, names: List[str]) -> List[str]:
+        # sources only: no checkpoints, outputs or bytecode from the working tree
+        return [
+            n for n in names
+            if n == "__pycache__" or (not os.path.isdir(os.path.join(directory, n)) and not n.endswith(".py"))
+        ]
+    for package in SOURCE_PACKAGES:
+        shutil.copytree(REPO_ROOT / package, run_dir / package, ignore=ignore)
+
+
+def _env(run_dir: Path, backend: str, fixtures: Path, latency: float, error_rate: float) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": str(run_dir),
+        "LLM_BACKEND": backend,
+        "LLM_FIXTURES": str(fixtures),
+        "LLM_RECORD_FROM": "mock",
+        "LLM_REPLAY_FALLBACK": "mock",
+        "LLM_MOCK_LATENCY": str(latency),
+        "LLM_MOCK_ERROR_RATE": str(error_rate),
+        "LLM_CACHE_DISABLE": "1",
+        "CLAIM_MEMO_DISABLE": "1",
+        "LLM_TRACE_DISABLE": "1",
+        "DATASET_CACHE_DIR": str(run_dir / ".dataset_cache"),
+        "RETRY_BASE_DELAY": os.getenv("RETRY_BASE_DELAY", "0.05"),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "bench"),
+    })
+    return env
+
+
+def _run_stage(stage: str, run_dir: Path, env: Dict[str, str], options: dict) -> dict:
+    out_file = run_dir / f".{stage}.bench.json"
+    log_file = run_dir / f".{stage}.log"
+    env = {**env, "BENCH_SPAWNED_AT": repr(time.time())}
+    with log_file.open("w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.pipeline_bench", "--child", stage,
+             "--child_options", json.dumps(options), "--child_out", str(out_file)],
+            cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{stage} exited with {process.returncode}; see {log_file}:\n{log_file.read_text()[-2000:]}")
+    with out_file.open() as f:
+        result = json.load(f)
+    # ru_maxrss is in KiB on Linux
+    result["peak_rss_mb"] = usage.ru_maxrss / 1024
+    return result
+
+
+def _prepare(run_dir: Path, data: List[dict], dataset: str):
+    _copy_tree(run_dir)
+    data_dir = run_dir / "data" / "outputs"
+    data_dir.mkdir(parents=True)
+    with (data_dir / f"model_outputs_with_scores_{dataset}.json").open("w") as f:
+        json.dump(data, f)
+
+
+def run_benchmark(
+    rows: int,
+    dataset: str = "fetaqa",
+    stages: Optional[List[str]] = None,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    max_concurrency: int = 8,
+    workers: int = 8,
+    seed: int = 0,
+    fixtures: Optional[Path] = None,
+    keep: bool = False
+) -> Dict[str, dict]:
+    """
+    Run the selected stages (in pipeline order; upstream stages always run
+    because later ones read their outputs) and return per-stage metrics.
+    """
+    stages = stages or STAGE_NAMES
+    needed = [
+        s for s in STAGE_NAMES
+        if any(t.split(".")[0] == s.split(".")[0] and STAGE_NAMES.index(s) <= STAGE_NAMES.index(t) for t in stages)
+    ]
+    options = {"dataset": dataset, "rows": rows, "max_concurrency": max_concurrency, "workers": workers}
+    data = synthetic_rows(dataset, rows, seed)
+    BENCH_DIR.mkdir(exist_ok=True)
+
+    if fixtures is None:
+        fixtures = BENCH_DIR / f"fixtures_{dataset}_{rows}_{seed}.jsonl"
+        if not fixtures.exists():
+            print(f"Recording fixtures for {rows} rows to {fixtures} ...")
+            record_dir = Path(tempfile.mkdtemp(prefix="record_", dir=BENCH_DIR))
+            try:
+                _prepare(record_dir, data, dataset)
+                env = _env(record_dir, "record", fixtures, 0.0, 0.0)
+                for stage in STAGE_NAMES:
+                    _run_stage(stage, record_dir, env, options)
+            finally:
+                shutil.rmtree(record_dir, ignore_errors=True)
+
+    run_dir = Path(tempfile.mkdtemp(prefix="run_", dir=BENCH_DIR))
+    results = {}
+    try:
+        _prepare(run_dir, data, dataset)
+        env = _env(run_dir, "replay", fixtures, latency, error_rate)
+        for stage in needed:
+            result = _run_stage(stage, run_dir, env, options)
+            n = _stage_rows(stage, run_dir, options)
+            result["rows"] = n
+            result["rows_per_s"] = n / result["elapsed_s"] if result["elapsed_s"] > 0 else None
+            if stage in stages:
+                results[stage] = result
+                print(format_row(stage, result))
+    finally:
+        if keep:
+            print(f"Run directory kept at {run_dir}")
+        else:
+            shutil.rmtree(run_dir, ignore_errors=True)
+    return results
+
+
+def _stage_rows(stage: str, run_dir: Path, options: dict) -> int:
+    _, _, count = STAGES[STAGE_NAMES.index(stage)]
+    return count(run_dir, options)
+
+
+HEADER = f"{'stage':<24} {'rows':>7} {'rows/s':>9} {'startup s':>9} {'peak RSS MB':>11} {'write MB':>9} {'read MB':>9}"
+
+
+def _mb(value: Optional[int]) -> str:
+    return f"{value / 1e6:>9.2f}" if value is not None else f"{'-':>9}"
+
+
+def format_row(stage: str, r: dict) -> str:
+    rate = f"{r['rows_per_s']:>9.1f}" if r["rows_per_s"] is not None else f"{'-':>9}"
+    return (
+        f"{stage:<24} {r['rows']:>7} {rate} {r['startup_s']:>9.3f} {r['peak_rss_mb']:>11.1f} "
+        f"{_mb(r['write_bytes'])} {_mb(r['read_bytes'])}"
+    )
+
+
+# --- history ---
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def load_history(path: Path) -> List[dict]:
+    if not path.exists():
+        return []
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_lines(current: Dict[str, dict], baseline: dict) -> List[str]:
+    """
+    Relative change of rows/sec, startup, peak RSS and bytes written against `baseline`.
+    """
+    lines = [f"vs {baseline['commit'][:10]} ({baseline['date']}):"]
+    for stage, r in current.items():
+        old = baseline["stages"].get(stage)
+        if old is None:
+            continue
+        parts = []
+        for key, label in [("rows_per_s", "rows/s"), ("startup_s", "startup"), ("peak_rss_mb", "RSS"), ("write_bytes", "written")]:
+            if r.get(key) and old.get(key):
+                parts.append(f"{label} {(r[key] / old[key] - 1) * 100:+.1f}%")
+        lines.append(f"  {stage:<24} " + ", ".join(parts))
+    return lines
+
+
+def record_history(path: Path, settings: dict, results: Dict[str, dict]):
+    history = load_history(path)
+    commit = _git("rev-parse", "HEAD")
+    entry = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "settings": settings,
+        "stages": results,
+    }
+    baseline = next(
+        (e for e in reversed(history) if e["settings"] == settings and e["commit"] != commit),
+        None
+    )
+    if baseline is not None:
+        print("\n".join(compare_lines(results, baseline)))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+    print(f"Results appended to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pipeline throughput on synthetic data with replayed LLM responses.")
+    parser.add_argument('--rows', type=int, default=10_000, help="Synthetic dataset rows (e.g. 10000 to 100000)")
+    parser.add_argument('--dataset', type=str, default='fetaqa', choices=['fetaqa', 'qtsumm'], help="Dataset format to generate")
+    parser.add_argument('--stages', nargs='+', default=None, choices=STAGE_NAMES, help="Stages to report (default: all); upstream stages still run")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds each replayed call takes")
+    parser.add_argument('--error_rate', type=float, default=0.0, help="Fraction of calls that fail with a retryable server error")
+    parser.add_argument('--max_concurrency', type=int, default=8, help="Claim verifications in flight per row (MT-RAIG)")
+    parser.add_argument('--workers', type=int, default=8, help="Rows scored concurrently (G-Eval detection)")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic dataset")
+    parser.add_argument('--fixtures', type=Path, default=None, help="Recorded responses to replay (default: recorded from the mock on first use)")
+    parser.add_argument('--history', type=Path, default=DEFAULT_HISTORY, help="JSONL file the results are appended to")
+    parser.add_argument('--no_history', action='store_true', help="Do not record or compare results")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch run directory")
+    parser.add_argument('--child', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--child_options', type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--child_out', type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, json.loads(args.child_options), args.child_out)
+        sys.exit(0)
+
+    settings = {
+        "rows": args.rows, "dataset": args.dataset, "latency": args.latency, "error_rate": args.error_rate,
+        "max_concurrency": args.max_concurrency, "workers": args.workers, "seed": args.seed,
+        "fixtures": str(args.fixtures) if args.fixtures else None,
+    }
+    print(HEADER)
+    results = run_benchmark(
+        args.rows, args.dataset, args.stages, args.latency, args.error_rate,
+        args.max_concurrency, args.workers, args.seed, args.fixtures, args.keep
+    )
+    if not args.no_history:
+        record_history(args.history, settings, results)
@@ -0,0 +1,102 @@
+"""
+Single command-line entry point for both pipelines.
+
+    python -m cli mtraig detection --dataset fetaqa --model gpt-4o-mini
+    python -m cli g_eval automated_eval --type normal --mode both
+    python -m cli run_all --jobs 4
+    python -m cli summary --datasets fetaqa --models gpt-4o-mini
+
+`mtraig`/`g_eval` commands take the same options as `python -m <pipeline>.<step>`.
+A command's module is imported only when that command runs, and the modules
+load pandas, numpy, pydantic and openai only where they use them, so `--help`
+and `summary` return without importing any of them.
+"""
+
+import argparse
+import importlib
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+from run_all import DATASETS, METRICS, MODELS, PIPELINES, REPO_ROOT
+
+STEPS = ("detection", "mitigation", "automated_eval", "pipeline")
+
+
+def result_files(pipeline: str, dataset: str, model: str) -> List[tuple]:
+    """
+    (title, results file, command that writes it) for one pipeline and tag.
+    """
+    tag = f"{model}_{dataset}"
+    base = f"--dataset {dataset} --model {model}"
+    results = REPO_ROOT / "results"
+    if pipeline == "mtraig":
+        return [
+            ("MT-RAIG detection", results / "mtraig_correlation" / f"{tag}.txt", f"mtraig detection {base}"),
+            ("MT-RAIG automated eval", results / "mtraig_automated_eval" / f"{tag}.txt", f"mtraig automated_eval {base}"),
+        ]
+    files = [
+        (f"G-Eval {m} detection", results / f"g_eval_{m}_correlation" / f"{tag}.txt", f"g_eval detection {base} --mode {m}")
+        for m in METRICS
+    ]
+    files += [
+        (f"G-Eval {kind} {m} automated eval", results / "geval_automated_eval" / kind / m / f"{tag}.txt",
+         f"g_eval automated_eval {base} --type {kind} --mode {m}")
+        for kind in ("normal", "oracle") for m in METRICS
+    ]
+    return files
+
+
+def summary(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m cli summary", description="Print the stored detection and automated-eval results.")
+    parser.add_argument('--datasets', nargs='+', default=DATASETS, choices=DATASETS, help="Datasets to show")
+    parser.add_argument('--models', nargs='+', default=MODELS, help="Models to show")
+    parser.add_argument('--pipelines', nargs='+', default=PIPELINES, choices=PIPELINES, help="Pipelines to show")
+    args = parser.parse_args(argv)
+    missing = []
+    for pipeline in args.pipelines:
+        for dataset in args.datasets:
+            for model in args.models:
+                for title, path, command in result_files(pipeline, dataset, model):
+                    if not path.exists():
+                        missing.append(f"python -m cli {command}")
+                        continue
+                    print(f"=== {title} – {model} on {dataset} ({path.relative_to(REPO_ROOT)})")
+                    print(path.read_text().rstrip() + "\n")
+    if missing:
+        print("Not computed yet:")
+        print("".join(f"  {command}\n" for command in missing), end="")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Run a pipeline step, all jobs, or show stored results.",
+        epilog=f"pipeline steps: {', '.join(STEPS)}; see 'python -m cli <pipeline> <step> --help'"
+    )
+    parser.add_argument('command', choices=PIPELINES + ["run_all", "summary"], help="mtraig or g_eval (followed by a step), run_all or summary")
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Step and options of the command")
+    # only the command word is parsed here; everything after it goes to the command
+    if not argv or argv[0] in ("-h", "--help"):
+        parser.print_help()
+        return 0
+    args = parser.parse_args(argv[:1])
+    rest = argv[1:]
+    if args.command == "summary":
+        return summary(rest)
+    if args.command == "run_all":
+        module, prog = "run_all", "python -m cli run_all"
+    else:
+        if not rest or rest[0] not in STEPS:
+            parser.error(f"{args.command} needs a step: {', '.join(STEPS)}")
+        module, prog = f"{args.command}.{rest[0]}", f"python -m cli {args.command} {rest[0]}"
+        rest = rest[1:]
+    # argparse in the step's main() names itself after argv[0]
+    sys.argv[0] = prog
+    return importlib.import_module(module).main(rest) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Offline batch submission for chat-completion requests.
+
+Pending requests are written as a JSONL batch file, submitted through a
+pluggable backend, polled until done and returned keyed by `custom_id` so
+each stage can merge them into its usual checkpoint files. The batch id is
+recorded next to the input file, so an interrupted run resumes polling the
+same batch instead of paying for it twice.
+
+Backends (`--batch_backend`):
+
+    openai   the OpenAI Batch API
+    local    a file-based stand-in that answers every request at submit time
+             through the selected LLM backend (`--llm_backend`), e.g. mock or
+             replay for offline runs
+
+Responses are cached under `llm_backend.cache_key` for the openai batch
+backend; the local stand-in's responses are kept apart, so they are never
+returned to a later API run.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from common import llm_backend, llm_cache
+from common.llm_backend import Completion, completion_text
+
+BATCH_DIR = Path("batch_jobs")
+BATCH_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchBackend:
+    """
+    Interface implemented by batch providers.
+    """
+    name = "base"
+
+    def submit(self, input_path: Path) -> str:
+        raise NotImplementedError
+
+    def status(self, batch_id: str) -> str:
+        raise NotImplementedError
+
+    def download(self, batch_id: str, dest: Path) -> Optional[Path]:
+        """
+        Write the provider's output JSONL to `dest`; return None if there is none.
+        """
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    name = "openai"
+
+    def __init__(self, client=None, completion_window: str = "24h"):
+        if client is None:
+            from common.llm_backend import load_env
+            from common.openai_client import get_client
+            load_env()
+            client = get_client()
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path: Path) -> str:
+        with open(input_path, "rb") as f:
+            batch_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, dest: Path) -> Optional[Path]:
+        batch = self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return None
+        dest.write_bytes(self.client.files.content(batch.output_file_id).content)
+        return dest
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for a batch provider.
+
+    Each submitted batch gets a directory under `root` holding `input.jsonl`.
+    The batch is complete once `output.jsonl` appears there, either moved into
+    place by an external process or produced immediately by `responder`, which maps
+    a request body to a chat-completion response body. A request the
+    responder raises on is reported as failed, like a provider-side error.
+    Without a responder, a batch with no output after `expire_after` seconds
+    reports "expired", so the caller falls back to synchronous calls.
+    """
+    name = "local"
+
+    def __init__(
+        self,
+        root: Path = BATCH_DIR / "local",
+        responder: Optional[Callable[[Dict], Dict]] = None,
+        expire_after: Optional[float] = None
+    ):
+        self.root = Path(root)
+        self.responder = responder
+        self.expire_after = expire_after
+
+    def submit(self, input_path: Path) -> str:
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        batch_dir = self.root / batch_id
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(input_path, batch_dir / "input.jsonl")
+        if self.responder is not None:
+            with open(batch_dir / "input.jsonl") as fin, open(batch_dir / "output.jsonl.tmp", "w") as fout:
+                for line in fin:
+                    req = json.loads(line)
+                    try:
+                        item = {"response": {"status_code": 200, "body": self.responder(req["body"])}, "error": None}
+                    except Exception as err:
+                        item = {"response": None, "error": {"message": str(err)}}
+                    fout.write(json.dumps({"custom_id": req["custom_id"], **item}) + "\n")
+            os.replace(batch_dir / "output.jsonl.tmp", batch_dir / "output.jsonl")
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        batch_dir = self.root / batch_id
+        if not batch_dir.exists():
+            return "failed"
+        if (batch_dir / "output.jsonl").exists():
+            return "completed"
+        if self.expire_after is not None and time.time() - (batch_dir / "input.jsonl").stat().st_mtime > self.expire_after:
+            return "expired"
+        return "in_progress"
+
+    def download(self, batch_id: str, dest: Path) -> Optional[Path]:
+        src = self.root / batch_id / "output.jsonl"
+        if not src.exists():
+            return None
+        shutil.copyfile(src, dest)
+        return dest
+
+
+def completion_body(completion: Completion) -> Dict:
+    """
+    Chat-completion response body for `completion`, as a batch output line holds it.
+    """
+    choices = []
+    for i, content in enumerate(completion.samples or [completion.content]):
+        message: Dict[str, Any] = {"role": "assistant", "content": content}
+        if i == 0 and completion.function_arguments is not None:
+            message["function_call"] = {"name": "", "arguments": completion.function_arguments}
+        choice: Dict[str, Any] = {"index": i, "message": message}
+        if i == 0 and completion.logprobs is not None:
+            choice["logprobs"] = {"content": [
+                {
+                    "token": t["token"],
+                    "logprob": t["top_logprobs"].get(t["token"], 0.0),
+                    "top_logprobs": [{"token": alt, "logprob": lp} for alt, lp in t["top_logprobs"].items()]
+                }
+                for t in completion.logprobs
+            ]}
+        choices.append(choice)
+    return {"object": "chat.completion", "choices": choices}
+
+
+def llm_responder(body: Dict) -> Dict:
+    """
+    Answer a batch request through the selected LLM backend.
+    """
+    return completion_body(llm_backend.get_backend().complete(body))
+
+
+def get_backend(name: str) -> BatchBackend:
+    if name == "openai":
+        return OpenAIBatchBackend()
+    if name == "local":
+        return LocalBatchBackend(responder=llm_responder)
+    raise ValueError(f"Unknown batch backend: {name}")
+
+
+def run_batch(
+    requests: Dict[str, Dict],
+    backend: BatchBackend,
+    tag: str,
+    poll_interval: float = 60.0,
+    work_dir: Path = BATCH_DIR
+) -> Dict[str, Dict]:
+    """
+    Submit `requests` (custom_id -> chat-completion body) as one batch and
+    block until it finishes. Returns custom_id -> response body for every
+    request that succeeded; failed requests are simply absent.
+    """
+    if not requests:
+        return {}
+    work_dir.mkdir(parents=True, exist_ok=True)
+    input_path = work_dir / f"{tag}.input.jsonl"
+    id_path = work_dir / f"{tag}.batch_id"
+    output_path = work_dir / f"{tag}.output.jsonl"
+
+    if id_path.exists():
+        batch_id = id_path.read_text().strip()
+        logging.info(f"[batch] resuming {tag} ({batch_id})")
+    else:
+        with input_path.open("w", encoding="utf-8") as f:
+            for custom_id, body in requests.items():
+                f.write(json.dumps({
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body
+                }, ensure_ascii=False) + "\n")
+        batch_id = backend.submit(input_path)
+        id_path.write_text(batch_id)
+        logging.info(f"[batch] submitted {len(requests)} requests for {tag} ({batch_id})")
+
+    status = backend.status(batch_id)
+    while status not in TERMINAL_STATES:
+        logging.info(f"[batch] {tag} is {status}; polling again in {poll_interval:.0f}s")
+        time.sleep(poll_interval)
+        status = backend.status(batch_id)
+    logging.info(f"[batch] {tag} finished with status {status}")
+
+    results: Dict[str, Dict] = {}
+    if backend.download(batch_id, output_path) is not None:
+        with output_path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                response = item.get("response") or {}
+                if item.get("custom_id") in requests and response.get("status_code") == 200:
+                    results[item["custom_id"]] = response["body"]
+    # the batch has been consumed; the next run submits whatever is still pending
+    id_path.rename(work_dir / f"{tag}.{batch_id}.done")
+    logging.info(f"[batch] {len(results)}/{len(requests)} requests succeeded for {tag}")
+    return results
+
+
+def message_content(body: Dict) -> str:
+    return body["choices"][0]["message"]["content"]
+
+
+def function_arguments(body: Dict) -> str:
+    return body["choices"][0]["message"]["function_call"]["arguments"]
+
+
+def sampled_content(body: Dict) -> str:
+    """
+    Every choice of an n > 1 response, in the text form the response cache keeps.
+    """
+    samples = [choice["message"]["content"] for choice in body["choices"]]
+    return completion_text(Completion(samples[0], None, samples), "samples")
+
+
+def logprobs_content(body: Dict) -> str:
+    """
+    Content and per-token top logprobs of the first choice, in the text form
+    the response cache keeps.
+    """
+    choice = body["choices"][0]
+    logprobs = [
+        {"token": t["token"], "top_logprobs": {alt["token"]: alt["logprob"] for alt in t.get("top_logprobs") or []}}
+        for t in choice["logprobs"]["content"]
+    ]
+    return completion_text(Completion(choice["message"]["content"], None, logprobs=logprobs), "logprobs")
+
+
+def batch_cache_key(body: Dict, backend: BatchBackend) -> str:
+    """
+    Response cache key of a batch request: the synchronous key for the OpenAI
+    Batch API, a key of its own for any other batch backend.
+    """
+    if backend.name == "openai":
+        return llm_backend.cache_key(body)
+    return llm_cache.make_key(batch_backend=backend.name, **body)
+
+
+def run_cached_batch(
+    requests: Dict[str, Dict],
+    extract: Callable[[Dict], str],
+    parse: Callable[[str], Any],
+    backend: BatchBackend,
+    tag: str,
+    poll_interval: float = 60.0
+) -> Dict[str, Any]:
+    """
+    Like `run_batch`, but answers requests from the LLM response cache where
+    possible and stores new responses in it. `extract` pulls the raw text out
+    of a response body and `parse` validates it; responses that fail to parse
+    are dropped so the caller can retry them synchronously.
+    """
+    results: Dict[str, Any] = {}
+    pending: Dict[str, Dict] = {}
+    keys: Dict[str, str] = {}
+    for custom_id, body in requests.items():
+        key = batch_cache_key(body, backend)
+        cached = llm_cache.lookup(key)
+        if cached is not None:
+            results[custom_id] = parse(cached)
+        else:
+            pending[custom_id] = body
+            keys[custom_id] = key
+    if results:
+        logging.info(f"[batch] {len(results)} requests for {tag} answered from cache")
+    for custom_id, body in run_batch(pending, backend, tag, poll_interval=poll_interval).items():
+        try:
+            raw = extract(body)
+            results[custom_id] = parse(raw)
+        except Exception as err:
+            logging.warning(f"[batch] {custom_id}: unusable response ({err})")
+            continue
+        llm_cache.store(keys[custom_id], raw)
+    return results
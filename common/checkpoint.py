@@ -0,0 +1,140 @@
+"""
+Incremental checkpoint store.
+
+Each update is appended as one line to `<checkpoint>.journal.jsonl` instead of
+rewriting the whole checkpoint, so saving a row costs O(1) I/O. Every
+`compact_every` updates (and on close) the full state is written to the usual
+checkpoint JSON through a temp file and `os.replace`, then the journal is
+truncated. The JSON keeps its existing shape, so the evaluation scripts and
+`load_*_from_ckpt` helpers read it unchanged.
+
+Loading reads the JSON, replays the journal on top and ignores a torn last
+line. A crash between the replace and the truncation only leaves updates that
+replay to the same state.
+"""
+
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+DEFAULT_COMPACT_EVERY = 100
+
+
+def journal_path(path: Union[str, Path]) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + ".journal.jsonl")
+
+
+def has_pending_journal(path: Union[str, Path]) -> bool:
+    """
+    True when updates to the checkpoint at `path` have not been compacted into
+    its JSON yet (e.g. after an interrupted run).
+    """
+    return journal_path(path).exists()
+
+
+class CheckpointStore:
+    """
+    Key -> value state persisted as checkpoint JSON plus an append-only journal.
+    `load` turns the checkpoint JSON into entries and `dump` turns entries back
+    into that JSON. Keys are strings; insertion order is preserved.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        load: Callable[[Any], Dict[str, Any]],
+        dump: Callable[[Dict[str, Any]], Any],
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        indent: Optional[int] = None
+    ):
+        self.path = Path(path)
+        self.journal_path = journal_path(self.path)
+        self.dump = dump
+        self.compact_every = compact_every
+        self.indent = indent
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.entries: Dict[str, Any] = {}
+        if self.path.exists():
+            with self.path.open() as f:
+                self.entries = load(json.load(f))
+        self._journal = None
+        if self.journal_path.exists():
+            # fold the journal in right away, so a torn line is never followed by new appends
+            logging.info(f"Replayed {self._replay()} journal updates into {self.path}")
+            self.compact()
+
+    def _replay(self) -> int:
+        replayed = 0
+        with self.journal_path.open() as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn write from a crash; nothing after it was committed
+                self.entries[record["key"]] = record["value"]
+                replayed += 1
+        return replayed
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.entries.get(key, default)
+
+    def put(self, key: str, value: Any):
+        """
+        Record one update durably and compact when enough have accumulated.
+        """
+        self.put_many({key: value})
+
+    def put_many(self, updates: Dict[str, Any]):
+        if not updates:
+            return
+        with self._lock:
+            if self._journal is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._journal = self.journal_path.open("a")
+            for key, value in updates.items():
+                self._journal.write(json.dumps({"key": key, "value": value}) + "\n")
+                self.entries[key] = value
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._pending += len(updates)
+            if self._pending >= self.compact_every:
+                self._compact()
+
+    def compact(self):
+        """
+        Write the full state to the checkpoint JSON atomically and reset the journal.
+        """
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(self.dump(self.entries), f, indent=self.indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.journal_path.exists():
+            self.journal_path.unlink()
+        self._pending = 0
+
+    def close(self):
+        self.compact()
+
+    def __enter__(self) -> "CheckpointStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
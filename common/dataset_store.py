@@ -0,0 +1,324 @@
+"""
+Cached columnar store for the preprocessed dataset files.
+
+`data/outputs/model_outputs_with_scores_{dataset}.json` is parsed once and
+split into one file per column under DATASET_CACHE_DIR: numeric columns as
+.npy arrays opened memory-mapped, everything else pickled. Later loads only
+read the columns they touch, on first access. Columns derived from the raw
+ones (e.g. the MT-RAIG table dicts) are cached next to them, keyed on the
+deriving function's code so an edited function is recomputed. The cache is
+rebuilt when the source file's mtime or size changes, or its SHA-256 with
+DATASET_CACHE_VALIDATE=hash. Builds and manifest updates hold a file lock,
+so parallel processes (e.g. run_all jobs) share one cache without removing
+each other's column files.
+
+Environment variables:
+    DATASET_CACHE_DIR       cache location (default .dataset_cache)
+    DATASET_CACHE_DISABLE   set to 1 to parse the JSON on every load
+    DATASET_CACHE_VALIDATE  mtime (default) or hash
+"""
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+import pickle
+import threading
+import uuid
+from contextlib import contextmanager
+from numbers import Number
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+MANIFEST = "manifest.json"
+
+_stores: Dict[str, "DatasetStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def _cache_root() -> Path:
+    return Path(os.getenv("DATASET_CACHE_DIR", ".dataset_cache"))
+
+
+def _disabled() -> bool:
+    return os.getenv("DATASET_CACHE_DISABLE", "") == "1"
+
+
+def _validate_by_hash() -> bool:
+    return os.getenv("DATASET_CACHE_VALIDATE", "mtime") == "hash"
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_numeric(values: List[Any]) -> bool:
+    return bool(values) and all(isinstance(v, Number) and not isinstance(v, bool) for v in values)
+
+
+def _parse(path: Path) -> Tuple[int, Dict[str, List[Any]], Dict[str, List[int]]]:
+    """
+    Parse the JSON list of entries into columns. Keys absent from an entry hold
+    None in the column and are listed per column in `missing`.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        entries = json.load(f)
+    names: Dict[str, None] = {}
+    for entry in entries:
+        names.update(dict.fromkeys(entry))
+    columns = {name: [entry.get(name) for entry in entries] for name in names}
+    missing = {
+        name: [i for i, entry in enumerate(entries) if name not in entry]
+        for name in names
+    }
+    return len(entries), columns, {name: rows for name, rows in missing.items() if rows}
+
+
+def _derived_prefix(name: str, fn: Callable, source: str) -> str:
+    return f"{name}:{source}:{fn.__module__}.{fn.__qualname__}:"
+
+
+def _derived_key(name: str, fn: Callable, source: str) -> str:
+    # builtins have no code object; their name is the version
+    code = getattr(fn, "__code__", None)
+    return _derived_prefix(name, fn, source) + (hashlib.sha1(marshal.dumps(code)).hexdigest()[:12] if code else "")
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """
+    Exclusive lock on `path` across processes (a no-op where fcntl is missing).
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with path.open("a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class DatasetStore:
+    """
+    Column access to one dataset file. Columns load lazily and are memoized;
+    numeric columns are read-only memory-mapped numpy arrays, the others lists.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        if not self.path.exists():
+            raise FileNotFoundError(f"Data file not found: {self.path}")
+        self._lock = threading.Lock()
+        self._columns: Dict[str, Sequence] = {}
+        self._stat = self.path.stat()
+        if _disabled():
+            self._dir = None
+            n_rows, columns, missing = _parse(self.path)
+            self._columns.update(columns)
+            self._manifest = {"n_rows": n_rows, "columns": {name: {} for name in columns}, "missing": missing, "derived": {}}
+        else:
+            digest = hashlib.sha1(str(self.path.resolve()).encode()).hexdigest()[:10]
+            self._dir = _cache_root() / f"{self.path.stem}-{digest}"
+            self._manifest = self._open()
+
+    # --- cache maintenance ---
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with (self._dir / MANIFEST).open() as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _fresh(self, manifest: Optional[Dict]) -> bool:
+        if manifest is None:
+            return False
+        if _validate_by_hash():
+            return manifest.get("sha256") == _sha256(self.path)
+        return manifest.get("mtime_ns") == self._stat.st_mtime_ns and manifest.get("size") == self._stat.st_size
+
+    def _locked(self):
+        self._dir.parent.mkdir(parents=True, exist_ok=True)
+        return _file_lock(self._dir.parent / f"{self._dir.name}.lock")
+
+    def _write_manifest(self, manifest: Dict):
+        # callers hold the cache lock: files outside the manifest are unused
+        tmp = self._dir / f"{MANIFEST}.{uuid.uuid4().hex[:8]}.tmp"
+        with tmp.open("w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._dir / MANIFEST)
+        keep = {MANIFEST} | {c["file"] for c in manifest["columns"].values()} | {c["file"] for c in manifest["derived"].values()}
+        for p in self._dir.iterdir():
+            if p.name not in keep and not p.name.endswith(".tmp"):
+                p.unlink(missing_ok=True)
+
+    def _save_column(self, values: List[Any], token: str, numeric: bool) -> Dict[str, str]:
+        if numeric:
+            file = f"{token}.npy"
+            import numpy as np
+            np.save(self._dir / file, np.asarray(values))
+            return {"file": file, "kind": "npy"}
+        file = f"{token}.pkl"
+        with (self._dir / file).open("wb") as f:
+            pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return {"file": file, "kind": "pickle"}
+
+    def _open(self) -> Dict:
+        manifest = self._read_manifest()
+        if self._fresh(manifest):
+            return manifest
+        with self._locked():
+            # another process may have built it while we waited
+            manifest = self._read_manifest()
+            if self._fresh(manifest):
+                return manifest
+            return self._build()
+
+    def _build(self) -> Dict:
+        logging.info(f"Building dataset cache for {self.path} in {self._dir}")
+        self._dir.mkdir(parents=True, exist_ok=True)
+        n_rows, columns, missing = _parse(self.path)
+        token = uuid.uuid4().hex[:8]
+        manifest = {
+            "source": str(self.path),
+            "mtime_ns": self._stat.st_mtime_ns,
+            "size": self._stat.st_size,
+            "sha256": _sha256(self.path),
+            "n_rows": n_rows,
+            "columns": {
+                name: self._save_column(values, f"{i}.{token}", _is_numeric(values) and name not in missing)
+                for i, (name, values) in enumerate(columns.items())
+            },
+            "missing": missing,
+            "derived": {},
+        }
+        self._write_manifest(manifest)
+        self._columns.update(columns)  # already parsed, no need to read them back
+        return manifest
+
+    def _load(self, spec: Dict) -> Sequence:
+        path = self._dir / spec["file"]
+        if spec["kind"] == "npy":
+            import numpy as np
+            return np.load(path, mmap_mode="r")
+        with path.open("rb") as f:
+            return pickle.load(f)
+
+    # --- access ---
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._manifest["columns"])
+
+    def __len__(self) -> int:
+        return self._manifest["n_rows"]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._manifest["columns"]
+
+    def column(self, name: str) -> Sequence:
+        """
+        All values of one column; None where an entry lacks the key.
+        """
+        if name not in self:
+            raise KeyError(f"Column '{name}' not found in {self.path}")
+        with self._lock:
+            if name not in self._columns:
+                self._columns[name] = self._load(self._manifest["columns"][name])
+            return self._columns[name]
+
+    __getitem__ = column
+
+    def tolist(self, name: str) -> List[Any]:
+        """
+        One column as a list of plain Python values.
+        """
+        col = self.column(name)
+        # numeric columns are memory-mapped numpy arrays
+        return col.tolist() if hasattr(col, "tolist") else list(col)
+
+    def derived_column(self, name: str, fn: Callable[[Any], Any], source: str = "metadata") -> List[Any]:
+        """
+        `fn` applied to every value of `source`, cached until the source file
+        or the code of `fn` changes. Helpers `fn` calls are not part of the
+        key; clear DATASET_CACHE_DIR after editing one.
+        """
+        key = _derived_key(name, fn, source)
+        with self._lock:
+            if key in self._columns:
+                return self._columns[key]
+            spec = self._manifest["derived"].get(key)
+            if spec is not None:
+                self._columns[key] = self._load(spec)
+                return self._columns[key]
+        values = [fn(v) for v in self.column(source)]
+        with self._lock:
+            self._columns[key] = values
+            if self._dir is not None:
+                with self._locked():
+                    # re-read so derived columns added by another process are kept
+                    manifest = self._read_manifest()
+                    if manifest is not None and manifest.get("sha256") != self._manifest["sha256"]:
+                        # rebuilt for a newer source file: keep this column in memory only
+                        return values
+                    if manifest is None:
+                        manifest = self._manifest
+                    if key in manifest["derived"]:
+                        # another process cached it meanwhile; replacing its file could
+                        # pull it from under a reader
+                        self._manifest = manifest
+                        return values
+                    # drop the column cached for an earlier version of fn
+                    prefix = _derived_prefix(name, fn, source)
+                    manifest["derived"] = {k: v for k, v in manifest["derived"].items() if not k.startswith(prefix)}
+                    manifest["derived"][key] = self._save_column(values, f"d.{uuid.uuid4().hex[:8]}", numeric=False)
+                    self._write_manifest(manifest)
+                    self._manifest = manifest
+        return values
+
+    def records(self, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        The entries as dicts, like `json.load` of the source, restricted to
+        `columns` when given.
+        """
+        names = columns if columns is not None else self.columns
+        values = {name: self.tolist(name) for name in names}
+        missing = {name: set(self._manifest["missing"].get(name, ())) for name in names}
+        return [
+            {name: values[name][i] for name in names if i not in missing[name]}
+            for i in range(len(self))
+        ]
+
+    def frame(self, columns: Optional[List[str]] = None):
+        """
+        A pandas DataFrame of `columns` (default: all).
+        """
+        import pandas as pd
+        names = columns if columns is not None else self.columns
+        return pd.DataFrame({name: self.column(name) for name in names})
+
+
+def load_dataset(path: Union[str, Path]) -> DatasetStore:
+    """
+    The store for a dataset file, shared within the process while the file is unchanged.
+    """
+    path = Path(path)
+    key = str(path.resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is not None and path.exists():
+            st = path.stat()
+            if (st.st_mtime_ns, st.st_size) == (store._stat.st_mtime_ns, store._stat.st_size):
+                return store
+        store = DatasetStore(path)
+        _stores[key] = store
+        return store
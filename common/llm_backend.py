@@ -0,0 +1,523 @@
+"""
+Pluggable LLM backends behind the MT-RAIG and G-Eval helpers.
+
+The helpers build OpenAI chat-completion request bodies and hand them to the
+active backend through one of these calls:
+
+    structured(request)     JSON message content for a response_format schema (G-Eval scores)
+    sampled(request)        the content of every choice of an n > 1 request (sampled G-Eval scores)
+    with_logprobs(request)  content plus per-token top logprobs (probability-weighted G-Eval scores)
+    function_call(request)  arguments of the forced function call (claim decomposition/verification)
+    json_rewrite(request)   JSON object message content (mitigation rewrites)
+
+Caching, retries and rate limiting stay in the helpers, so every backend gets
+them. Backends report token usage to `common.llm_trace`; the API backends pass
+on the server's counts, including prompt tokens read from the provider's
+prompt cache, replay and mock estimate the completion tokens. Available backends:
+
+    openai   the OpenAI API through the shared client (default; needs OPENAI_API_KEY)
+    local    an OpenAI-compatible server (vLLM, llama.cpp, Ollama, ...) at LLM_BASE_URL
+    replay   responses recorded in LLM_FIXTURES, looked up by the request hash
+    record   the openai (or LLM_RECORD_FROM) backend, appending every response to LLM_FIXTURES
+    mock     deterministic synthetic responses derived from the request; no fixtures needed
+
+Other backends plug in with `register_backend(name, factory)` or by setting
+LLM_BACKEND to "package.module:factory".
+
+.env is read when the first backend is built (`load_env`), not at import.
+
+Environment variables:
+    LLM_BACKEND           backend name (default openai); the CLIs' --llm_backend sets it
+    LLM_FIXTURES          fixture JSONL for replay/record (default fixtures/llm_responses.jsonl)
+    LLM_REPLAY_FALLBACK   error (default) or mock: what replay does for unrecorded requests
+    LLM_RECORD_FROM       backend that record wraps (default openai)
+    LLM_MOCK_LATENCY      seconds each replay/mock call sleeps, to load-test concurrency (default 0)
+    LLM_MOCK_ERROR_RATE   fraction of replay/mock calls that fail with a retryable server error (default 0)
+    LLM_BASE_URL          local server URL, e.g. http://localhost:8000/v1
+    LLM_API_KEY           API key sent to the local server (default "local")
+    LLM_LOCAL_MODEL       model name sent to the local server instead of the requested one
+"""
+
+import hashlib
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from common import llm_cache, llm_trace
+from common.table_serialization import estimate_tokens
+
+DEFAULT_BACKEND = "openai"
+DEFAULT_FIXTURES = "fixtures/llm_responses.jsonl"
+
+
+class Completion(NamedTuple):
+    content: Optional[str]             # message content
+    function_arguments: Optional[str]  # arguments of the function call, if any
+    samples: Optional[List[str]] = None        # content of every choice, when n > 1
+    logprobs: Optional[List[Dict]] = None      # [{"token", "top_logprobs": {token: logprob}}] of the first choice
+
+
+class BackendError(RuntimeError):
+    """
+    A failure retrying cannot fix, e.g. a request with no recorded response.
+    """
+    retryable = False
+
+
+class SimulatedServerError(ConnectionError):
+    """
+    Injected by the offline backends at LLM_MOCK_ERROR_RATE; retried like a 5xx.
+    """
+
+
+def request_key(request: Dict) -> str:
+    return llm_cache.make_key(**request)
+
+
+class LLMBackend:
+    """
+    Base class: implement `complete`; the typed calls pick the part of the
+    completion each pipeline step parses.
+    """
+    name = "base"
+
+    def complete(self, request: Dict) -> Completion:
+        raise NotImplementedError
+
+    def structured(self, request: Dict) -> str:
+        return self._require(self.complete(request).content, "message content")
+
+    def sampled(self, request: Dict) -> List[str]:
+        completion = self.complete(request)
+        return completion.samples or [self._require(completion.content, "message content")]
+
+    def with_logprobs(self, request: Dict) -> Completion:
+        completion = self.complete(request)
+        self._require(completion.content, "message content")
+        if completion.logprobs is None:
+            raise BackendError(f"{self.name} backend returned no logprobs")
+        return completion
+
+    def function_call(self, request: Dict) -> str:
+        return self._require(self.complete(request).function_arguments, "function call")
+
+    def json_rewrite(self, request: Dict) -> str:
+        return self._require(self.complete(request).content, "message content")
+
+    def _require(self, value: Optional[str], what: str) -> str:
+        if value is None:
+            # parse-class failure: retried a few times like a malformed response
+            raise ValueError(f"{self.name} backend returned no {what}")
+        return value
+
+
+def _from_chat_response(response) -> Completion:
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        # prompt-cache hits on the provider side; absent on servers without prompt caching
+        details = getattr(usage, "prompt_tokens_details", None)
+        llm_trace.report_usage(usage.prompt_tokens, usage.completion_tokens, getattr(details, "cached_tokens", None))
+    choice = response.choices[0]
+    function_call = getattr(choice.message, "function_call", None)
+    samples = [c.message.content for c in response.choices] if len(response.choices) > 1 else None
+    token_logprobs = getattr(getattr(choice, "logprobs", None), "content", None)
+    logprobs = None
+    if token_logprobs is not None:
+        logprobs = [
+            {"token": t.token, "top_logprobs": {alt.token: alt.logprob for alt in (t.top_logprobs or [])}}
+            for t in token_logprobs
+        ]
+    return Completion(
+        choice.message.content,
+        function_call.arguments if function_call is not None else None,
+        samples,
+        logprobs
+    )
+
+
+class OpenAIBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self):
+        if not os.getenv("OPENAI_API_KEY"):
+            logging.error("OPENAI_API_KEY not set in environment")
+            raise ValueError("OPENAI_API_KEY not set in environment")
+        from common.openai_client import get_client
+        self.client = get_client()
+
+    def complete(self, request: Dict) -> Completion:
+        return _from_chat_response(self.client.chat.completions.create(**request))
+
+
+class LocalServerBackend(LLMBackend):
+    """
+    An OpenAI-compatible chat-completions server. Servers that lack function
+    calling or JSON-schema output can be wrapped in a custom backend instead.
+    """
+    name = "local"
+
+    def __init__(self, base_url: Optional[str] = None, model: Optional[str] = None):
+        import httpx
+        from openai import OpenAI
+        base_url = base_url or os.getenv("LLM_BASE_URL")
+        if not base_url:
+            raise ValueError("LLM_BASE_URL must be set for the local backend")
+        self.model = model or os.getenv("LLM_LOCAL_MODEL")
+        self.client = OpenAI(
+            base_url=base_url,
+            api_key=os.getenv("LLM_API_KEY", "local"),
+            timeout=float(os.getenv("OPENAI_TIMEOUT", "600")),
+            # retries are left to common/retry.py, as for the shared API client
+            max_retries=int(os.getenv("OPENAI_CLIENT_RETRIES", "0")),
+            http_client=httpx.Client(limits=httpx.Limits(max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "32"))))
+        )
+
+    def complete(self, request: Dict) -> Completion:
+        if self.model:
+            request = {**request, "model": self.model}
+        return _from_chat_response(self.client.chat.completions.create(**request))
+
+
+# --- deterministic mock ---
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_NUMBERED_RE = re.compile(r"^\d+\.\s", re.M)
+
+
+def _digest(*parts: str) -> int:
+    return int.from_bytes(hashlib.sha256("\x1f".join(parts).encode("utf-8")).digest()[:8], "big")
+
+
+def _section(text: str, start: str, end: str) -> str:
+    i = text.rfind(start)
+    if i < 0:
+        return ""
+    text = text[i + len(start):]
+    j = text.find(end)
+    return (text[:j] if j >= 0 else text).strip()
+
+
+class _SimulatedCall:
+    """
+    Latency and transient failures for the offline backends.
+    """
+
+    def __init__(self, latency: Optional[float], error_rate: Optional[float]):
+        self.latency = float(os.getenv("LLM_MOCK_LATENCY", "0")) if latency is None else latency
+        self.error_rate = float(os.getenv("LLM_MOCK_ERROR_RATE", "0")) if error_rate is None else error_rate
+        self._random = random.Random()
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise SimulatedServerError("simulated server error")
+
+
+def _report_estimated_usage(request: Dict, completion: Completion) -> Completion:
+    # no server counts offline: the prompt side is estimated by the caller
+    if completion.samples:
+        text = "".join(completion.samples)
+    else:
+        text = completion.content if completion.content is not None else completion.function_arguments or ""
+    llm_trace.report_usage(None, estimate_tokens(text, request.get("model", "gpt-4o")))
+    return completion
+
+
+def _user_prompt(request: Dict) -> str:
+    return next((m["content"] for m in reversed(request.get("messages", [])) if m.get("role") == "user"), "")
+
+
+class MockBackend(LLMBackend):
+    """
+    Synthetic but well-formed responses, a pure function of the request:
+    claims are the insight's sentences, about four in five claims verify as
+    faithful, scores fall in 3–5 and rewrites drop the answer's last sentence.
+    """
+    name = "mock"
+
+    def __init__(self, latency: Optional[float] = None, error_rate: Optional[float] = None):
+        self.simulated = _SimulatedCall(latency, error_rate)
+
+    def complete(self, request: Dict) -> Completion:
+        self.simulated.wait()
+        return _report_estimated_usage(request, self._respond(request))
+
+    def _respond(self, request: Dict) -> Completion:
+        prompt = _user_prompt(request)
+        function = (request.get("function_call") or {}).get("name")
+        if function == "decompose_claims":
+            insight = _section(prompt, "Insight:", "\nOutput:")
+            claims = [s.strip() for s in _SENTENCE_RE.split(insight) if s.strip()]
+            return Completion(None, json.dumps({"claims": claims}))
+        if function == "verify_claim":
+            claim = _section(prompt, "Claim:", "\nEvaluation Form")
+            return Completion(None, json.dumps({"faithfulness": int(_digest(claim) % 5 != 0)}))
+        if function == "verify_claims":
+            claims = _section(prompt, "Claims:", "\nEvaluation Form")
+            verdicts = [int(_digest(line) % 5 != 0) for line in claims.splitlines() if _NUMBERED_RE.match(line)]
+            return Completion(None, json.dumps({"verdicts": verdicts}))
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            properties = response_format["json_schema"]["schema"].get("properties", {})
+            key = request_key(request)
+            scores = {name: 3 + _digest(key, name) % 3 for name in properties}
+            n = request.get("n") or 1
+            if n > 1:
+                # samples scatter one point around the greedy score
+                samples = [
+                    json.dumps({name: min(5, max(1, s + (-1, 0, 0, 0, 1)[_digest(key, name, str(i)) % 5])) for name, s in scores.items()})
+                    for i in range(n)
+                ]
+                return Completion(samples[0], None, samples)
+            if request.get("logprobs"):
+                return Completion(json.dumps(scores), None, logprobs=_mock_score_logprobs(key, scores))
+            return Completion(json.dumps(scores), None)
+        if response_format.get("type") == "json_object":
+            answer = _section(prompt, "### Original Answer", "\n\n#") or _section(prompt, "Original Answer", "\n\n")
+            answer = answer.split("\n\nPlease output")[0].strip()
+            sentences = [s for s in _SENTENCE_RE.split(answer) if s]
+            return Completion(json.dumps({"answer": " ".join(sentences[:-1]) if len(sentences) > 1 else answer}), None)
+        return Completion("", None)
+
+
+def _mock_score_logprobs(key: str, scores: Dict[str, int]) -> List[Dict]:
+    """
+    Token logprobs for a JSON score object, with most of the mass on each
+    score and the rest on its neighbours.
+    """
+    tokens = []
+    for i, (name, score) in enumerate(scores.items()):
+        tokens += [{"token": '{"' if i == 0 else ',"', "top_logprobs": {}}, {"token": name, "top_logprobs": {}}, {"token": '":', "top_logprobs": {}}]
+        weights = {d: 1.0 for d in range(1, 6)}
+        weights[score] = 20.0 + _digest(key, name, "lp") % 40
+        for d in (score - 1, score + 1):
+            if d in weights:
+                weights[d] = 2.0 + _digest(key, name, str(d)) % 10
+        total = sum(weights.values())
+        tokens.append({"token": str(score), "top_logprobs": {str(d): math.log(w / total) for d, w in weights.items()}})
+    tokens.append({"token": "}", "top_logprobs": {}})
+    return tokens
+
+
+# --- recorded fixtures ---
+
+class FixtureStore:
+    """
+    Append-only JSONL of {"key", "model", "content", "function_arguments"}
+    lines (plus "samples"/"logprobs" for sampled and logprob requests),
+    indexed in memory by request key. Later lines win.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Completion] = {}
+        if self.path.exists():
+            with self.path.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line of an interrupted recording
+                    self._entries[e["key"]] = Completion(e.get("content"), e.get("function_arguments"), e.get("samples"), e.get("logprobs"))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Completion]:
+        return self._entries.get(key)
+
+    def put(self, key: str, request: Dict, completion: Completion):
+        with self._lock:
+            self._entries[key] = completion
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            entry = {
+                "key": key,
+                "model": request.get("model"),
+                "content": completion.content,
+                "function_arguments": completion.function_arguments,
+            }
+            # only sampled / logprob requests carry these
+            if completion.samples is not None:
+                entry["samples"] = completion.samples
+            if completion.logprobs is not None:
+                entry["logprobs"] = completion.logprobs
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+class ReplayBackend(LLMBackend):
+    name = "replay"
+
+    def __init__(
+        self,
+        fixtures: Optional[str] = None,
+        fallback: Optional[str] = None,
+        latency: Optional[float] = None,
+        error_rate: Optional[float] = None
+    ):
+        self.store = FixtureStore(fixtures or os.getenv("LLM_FIXTURES", DEFAULT_FIXTURES))
+        fallback = fallback or os.getenv("LLM_REPLAY_FALLBACK", "error")
+        self.fallback = MockBackend(latency=0.0, error_rate=0.0) if fallback == "mock" else None
+        self.simulated = _SimulatedCall(latency, error_rate)
+        self.hits = 0
+        self.misses = 0
+        logging.info(f"Replaying {len(self.store)} recorded responses from {self.store.path}")
+
+    def complete(self, request: Dict) -> Completion:
+        self.simulated.wait()
+        completion = self.store.get(request_key(request))
+        if completion is not None:
+            self.hits += 1
+            return _report_estimated_usage(request, completion)
+        self.misses += 1
+        if self.fallback is None:
+            raise BackendError(f"no recorded response for this {request.get('model')} request in {self.store.path}")
+        return self.fallback.complete(request)
+
+
+class RecordingBackend(LLMBackend):
+    name = "record"
+
+    def __init__(self, inner: Optional[LLMBackend] = None, fixtures: Optional[str] = None):
+        self.inner = inner or create_backend(os.getenv("LLM_RECORD_FROM", DEFAULT_BACKEND))
+        self.store = FixtureStore(fixtures or os.getenv("LLM_FIXTURES", DEFAULT_FIXTURES))
+
+    def complete(self, request: Dict) -> Completion:
+        completion = self.inner.complete(request)
+        self.store.put(request_key(request), request, completion)
+        return completion
+
+
+# --- selection ---
+
+_factories: Dict[str, Callable[[], LLMBackend]] = {
+    "openai": OpenAIBackend,
+    "local": LocalServerBackend,
+    "replay": ReplayBackend,
+    "record": RecordingBackend,
+    "mock": MockBackend,
+}
+BACKENDS = tuple(_factories)
+
+_backend: Optional[LLMBackend] = None
+_lock = threading.Lock()
+
+
+_env_loaded = False
+
+
+def load_env():
+    """
+    Read .env into the environment once (OPENAI_API_KEY and any other settings
+    kept there). Existing environment variables win.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def register_backend(name: str, factory: Callable[[], LLMBackend]):
+    _factories[name] = factory
+
+
+def create_backend(name: str) -> LLMBackend:
+    load_env()
+    if name in _factories:
+        return _factories[name]()
+    if ":" in name:
+        module, attr = name.split(":", 1)
+        return getattr(importlib.import_module(module), attr)()
+    raise ValueError(f"Unknown LLM backend '{name}'; expected one of {', '.join(_factories)} or module:factory")
+
+
+def backend_name() -> str:
+    return os.getenv("LLM_BACKEND", DEFAULT_BACKEND)
+
+
+def get_backend() -> LLMBackend:
+    """
+    The process-wide backend selected by LLM_BACKEND, built on first use.
+    """
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = create_backend(backend_name())
+        return _backend
+
+
+def set_backend(name: Optional[str]):
+    """
+    Select the backend for this process (and the subprocesses it starts).
+    None keeps the LLM_BACKEND setting.
+    """
+    global _backend
+    if name is None:
+        return
+    with _lock:
+        os.environ["LLM_BACKEND"] = name
+        _backend = None
+
+
+def cache_key(request: Dict) -> str:
+    """
+    LLM response cache key. Responses from backends other than openai are kept
+    apart, so a mock or local run never feeds the API results cache.
+    """
+    name = backend_name()
+    if name == "record":
+        name = os.getenv("LLM_RECORD_FROM", DEFAULT_BACKEND)
+    if name == DEFAULT_BACKEND:
+        return llm_cache.make_key(**request)
+    return llm_cache.make_key(backend=name, **request)
+
+
+def cached(request: Dict, field: str = "content", label: str = "OpenAI call") -> Tuple[str, Optional[str]]:
+    """
+    Cache key and cached response text for `request`. A hit is recorded in the
+    LLM trace under `label`. While recording, a cache hit is written to the
+    fixtures too (as the completion's `field`), so a recording is complete even
+    for requests answered from the cache.
+    """
+    key = cache_key(request)
+    value = llm_cache.lookup(key)
+    if value is not None:
+        llm_trace.record_cache_hit(request.get("model", ""), label)
+    if value is not None and backend_name() == "record":
+        backend = get_backend()
+        backend.store.put(request_key(request), request, completion_from_text(value, field))
+    return key, value
+
+
+def completion_text(completion: Completion, field: str) -> str:
+    """
+    The part of `completion` a helper caches, as text: "content",
+    "function_arguments", "samples" (a JSON list of the choices' content) or
+    "logprobs" (JSON {"content", "logprobs"}).
+    """
+    if field == "samples":
+        return json.dumps(completion.samples or [completion.content], ensure_ascii=False)
+    if field == "logprobs":
+        return json.dumps({"content": completion.content, "logprobs": completion.logprobs}, ensure_ascii=False)
+    return getattr(completion, field)
+
+
+def completion_from_text(text: str, field: str) -> Completion:
+    if field == "samples":
+        samples = json.loads(text)
+        return Completion(samples[0], None, samples)
+    if field == "logprobs":
+        data = json.loads(text)
+        return Completion(data["content"], None, logprobs=data["logprobs"])
+    return Completion(text, None) if field == "content" else Completion(None, text)
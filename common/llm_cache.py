@@ -0,0 +1,151 @@
+"""
+Content-addressed on-disk cache for LLM responses.
+
+Responses are keyed by a hash of the full request (model, temperature,
+messages and the function/response schema) and stored in SQLite, so the
+MT-RAIG and G-Eval stages, re-runs and parallel processes all share them.
+
+Environment variables:
+    LLM_CACHE_PATH         SQLite file (default: .llm_cache/responses.sqlite)
+    LLM_CACHE_DISABLE      set to 1 to bypass the cache
+    LLM_CACHE_MAX_ENTRIES  keep at most this many entries (least recently used evicted)
+    LLM_CACHE_TTL          drop entries older than this many seconds
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+DEFAULT_CACHE_PATH = ".llm_cache/responses.sqlite"
+EVICT_EVERY = 500
+
+
+def make_key(**request) -> str:
+    """
+    Hash a request description into a stable cache key.
+    """
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path: str, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._conn.commit()
+            self._puts += 1
+            if self._puts % EVICT_EVERY == 0:
+                self._evict()
+
+    def evict(self):
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        if s["hits"] or s["misses"]:
+            logging.info(f"LLM cache: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.1%} hit rate)")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ResponseCache]:
+    """
+    Return the process-wide cache, or None when disabled via LLM_CACHE_DISABLE.
+    """
+    global _cache
+    if os.getenv("LLM_CACHE_DISABLE", "0") == "1":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            max_entries = os.getenv("LLM_CACHE_MAX_ENTRIES")
+            ttl = os.getenv("LLM_CACHE_TTL")
+            _cache = ResponseCache(
+                os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+                max_entries=int(max_entries) if max_entries else None,
+                ttl_seconds=float(ttl) if ttl else None,
+            )
+            atexit.register(_cache.log_stats)
+        return _cache
+
+
+def lookup(key: str) -> Optional[str]:
+    cache = get_cache()
+    return cache.get(key) if cache is not None else None
+
+
+def store(key: str, value: str):
+    cache = get_cache()
+    if cache is not None:
+        cache.put(key, value)
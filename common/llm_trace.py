@@ -0,0 +1,353 @@
+"""
+Per-call trace of LLM usage: tokens, latency, retries, cache hits and cost.
+
+Every call through `retry.call_with_retry` and every response-cache hit is
+recorded with the model, the stage (the script or pipeline stage, set with
+`scope(stage=...)` or `start_run`), the call label ("claim verification",
+"G-Eval scoring", ...) and the dataset row being processed (`scope(row=idx)`).
+Token counts come from the API usage when the backend reports it and are
+estimated otherwise; prompt tokens the provider served from its prompt cache
+are recorded separately (`tokens_cached`) and priced at the cached-input rate.
+
+Records are appended to a JSONL trace per run, and at exit a per-stage
+summary (p50/p95 latency, tokens per row, estimated cost) is logged and
+written next to the trace as `<trace>.summary.json`.
+
+A cost budget (`set_cost_budget`, every script's --max_cost, or
+LLM_COST_BUDGET) stops a run before its next call once the estimated spend of
+the calls recorded so far reaches it. Calls to unpriced models count as free.
+
+Environment variables:
+    LLM_COST_BUDGET    USD budget for the estimated spend of one run (default: none)
+    LLM_TRACE_DIR      directory for trace files (default .llm_trace)
+    LLM_TRACE_DISABLE  set to 1 to keep only the in-memory summary
+    LLM_PRICES         JSON {"model": [usd_per_1M_input, usd_per_1M_output]} to
+                       add or override prices used for the cost estimate; a third
+                       entry sets the cached-input price (default: the input price)
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# USD per 1M tokens (input, output, cached input); response-cache hits cost nothing
+DEFAULT_PRICES: Dict[str, Tuple[float, ...]] = {
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4": (30.00, 60.00, 30.00),
+}
+
+_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_trace_stage", default=None)
+_row: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("llm_trace_row", default=None)
+# usage reported by the backend for the attempt running in this thread
+_usage = threading.local()
+
+
+def prices() -> Dict[str, Tuple[float, ...]]:
+    table = dict(DEFAULT_PRICES)
+    override = os.getenv("LLM_PRICES")
+    if override:
+        table.update({model: tuple(p) for model, p in json.loads(override).items()})
+    return table
+
+
+def price_for(model: str) -> Optional[Tuple[float, ...]]:
+    table = prices()
+    if model in table:
+        return table[model]
+    # dated snapshots ("gpt-4o-2024-08-06") fall back to the longest matching family
+    families = [m for m in table if model.startswith(m + "-")]
+    return table[max(families, key=len)] if families else None
+
+
+def call_cost(model: str, tokens_in: int, tokens_out: int, tokens_cached: int = 0) -> Optional[float]:
+    """
+    USD for one call; `tokens_cached` of the `tokens_in` are billed at the cached-input price.
+    """
+    price = price_for(model)
+    if price is None:
+        return None
+    cached_price = price[2] if len(price) > 2 else price[0]
+    return ((tokens_in - tokens_cached) * price[0] + tokens_cached * cached_price + tokens_out * price[1]) / 1_000_000
+
+
+@contextmanager
+def scope(stage: Optional[str] = None, row: Optional[int] = None):
+    """
+    Attribute the LLM calls made inside the block to `stage` and/or dataset row `row`.
+    """
+    tokens = []
+    if stage is not None:
+        tokens.append((_stage, _stage.set(stage)))
+    if row is not None:
+        tokens.append((_row, _row.set(int(row))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def report_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int], cached_tokens: Optional[int] = None):
+    """
+    Called by a backend with the token usage of the response it just returned.
+    `cached_tokens` is the part of the prompt served from the provider's prompt cache.
+    """
+    _usage.value = (prompt_tokens, completion_tokens, cached_tokens)
+
+
+def take_usage() -> Optional[Tuple[Optional[int], Optional[int], Optional[int]]]:
+    value = getattr(_usage, "value", None)
+    _usage.value = None
+    return value
+
+
+def add_usage(
+    total: Optional[Tuple[Optional[int], Optional[int], Optional[int]]],
+    usage: Optional[Tuple[Optional[int], Optional[int], Optional[int]]]
+) -> Optional[Tuple[Optional[int], Optional[int], Optional[int]]]:
+    """
+    Sum two usage tuples, e.g. over the attempts of one call; a count stays
+    None only when neither side reported it.
+    """
+    if total is None or usage is None:
+        return usage if total is None else total
+    return tuple(
+        None if x is None and y is None else (x or 0) + (y or 0)
+        for x, y in zip(total, usage)
+    )
+
+
+class CostBudgetExceeded(BaseException):
+    """
+    Raised before a call once the estimated spend reached the cost budget.
+    Derives from BaseException, like KeyboardInterrupt, so the per-row
+    fallbacks that catch Exception do not turn it into default scores: the
+    run stops, and its checkpoints let it resume.
+    """
+
+
+class Trace:
+    def __init__(self, run: str, path: Optional[Path]):
+        self.run = run
+        self.path = path
+        self.started = time.time()
+        self.spent = 0.0
+        self._lock = threading.Lock()
+        self._records: List[dict] = []
+        self._file = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = path.open("a", encoding="utf-8")
+
+    def record(self, entry: dict):
+        with self._lock:
+            self._records.append(entry)
+            self.spent += entry["cost"] or 0.0
+            if self._file is not None:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                self._file.flush()
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        Per "stage / label" aggregates, plus a "total" entry.
+        """
+        with self._lock:
+            records = list(self._records)
+        groups: Dict[str, List[dict]] = defaultdict(list)
+        for r in records:
+            groups[f"{r['stage']} / {r['label']}"].append(r)
+        out = {name: _aggregate(rs) for name, rs in sorted(groups.items())}
+        if records:
+            out["total"] = _aggregate(records)
+        return out
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def finish(self):
+        summary = self.summary()
+        self.close()
+        if not summary:
+            return
+        for line in summary_lines(summary):
+            logging.info(line)
+        if self.path is not None:
+            with self.path.with_name(self.path.name + ".summary.json").open("w") as f:
+                json.dump({"run": self.run, "started": self.started, "stages": summary}, f, indent=2)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    pos = (len(values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def _aggregate(records: List[dict]) -> dict:
+    calls = [r for r in records if not r["cache_hit"]]
+    latencies = [r["latency"] for r in calls if r["ok"]]
+    rows = {r["row"] for r in records if r["row"] is not None}
+    tokens_in = sum(r["tokens_in"] for r in calls)
+    tokens_out = sum(r["tokens_out"] for r in calls)
+    # traces written before cached tokens were recorded lack the field
+    tokens_cached = sum(r.get("tokens_cached", 0) for r in calls)
+    costs = [r["cost"] for r in calls if r["cost"] is not None]
+    unpriced = any(r["cost"] is None for r in calls)
+    return {
+        "calls": len(calls),
+        "cache_hits": len(records) - len(calls),
+        "failed": sum(not r["ok"] for r in calls),
+        "retries": sum(r["attempts"] - 1 for r in calls),
+        "rows": len(rows),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_cached": tokens_cached,
+        "cached_input_share": round(tokens_cached / tokens_in, 4) if tokens_in else None,
+        "tokens_per_row": (tokens_in + tokens_out) / len(rows) if rows else None,
+        "latency_p50": round(_percentile(latencies, 0.5), 3),
+        "latency_p95": round(_percentile(latencies, 0.95), 3),
+        # None when some calls went to a model without a price
+        "cost_usd": None if unpriced else round(sum(costs), 4),
+        "estimated_tokens": any(r["estimated"] for r in calls),
+    }
+
+
+def summary_lines(summary: Dict[str, dict]) -> List[str]:
+    lines = [f"{'LLM usage by stage':<48} {'calls':>6} {'cached':>6} {'retries':>7} {'tok/row':>8} {'in cached':>9} {'p50 s':>6} {'p95 s':>6} {'cost $':>8}"]
+    for name, s in summary.items():
+        per_row = f"{s['tokens_per_row']:.0f}" if s["tokens_per_row"] is not None else "-"
+        share = f"{s['cached_input_share']:.0%}" if s["cached_input_share"] is not None else "-"
+        cost = f"{s['cost_usd']:.4f}" if s["cost_usd"] is not None else "-"
+        lines.append(
+            f"{name:<48} {s['calls']:>6} {s['cache_hits']:>6} {s['retries']:>7} {per_row:>8} {share:>9} "
+            f"{s['latency_p50']:>6.2f} {s['latency_p95']:>6.2f} {cost:>8}"
+        )
+    return lines
+
+
+_trace: Optional[Trace] = None
+_trace_lock = threading.Lock()
+_budget: Optional[float] = None
+
+
+def set_cost_budget(usd: Optional[float]):
+    """
+    Stop starting LLM calls once the run's estimated spend reaches `usd`;
+    None falls back to LLM_COST_BUDGET.
+    """
+    global _budget
+    _budget = usd
+
+
+def check_budget():
+    budget = _budget
+    if budget is None and os.getenv("LLM_COST_BUDGET"):
+        budget = float(os.environ["LLM_COST_BUDGET"])
+    if budget is None:
+        return
+    spent = get_trace().spent
+    if spent >= budget:
+        raise CostBudgetExceeded(f"estimated LLM spend ${spent:.4f} reached the budget of ${budget:.4f}")
+
+
+def start_run(run: str) -> Trace:
+    """
+    Name this process's trace after the script (e.g. "mtraig.detection"),
+    which is also the default stage of its calls.
+    """
+    global _trace
+    with _trace_lock:
+        if _trace is not None:
+            _trace.close()
+        path = None
+        if os.getenv("LLM_TRACE_DISABLE", "0") != "1":
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            path = Path(os.getenv("LLM_TRACE_DIR", ".llm_trace")) / f"{run}_{stamp}_{os.getpid()}.jsonl"
+        _trace = Trace(run, path)
+        return _trace
+
+
+def get_trace() -> Trace:
+    global _trace
+    with _trace_lock:
+        if _trace is None:
+            # library use without start_run: summarize in memory only
+            _trace = Trace("llm", None)
+        return _trace
+
+
+def record_call(
+    model: str,
+    label: str,
+    latency: float,
+    attempts: int,
+    ok: bool,
+    estimated_in: int,
+    usage: Optional[Tuple[Optional[int], Optional[int], Optional[int]]] = None
+):
+    prompt_tokens, completion_tokens, cached_tokens = usage or (None, None, None)
+    estimated = prompt_tokens is None or completion_tokens is None
+    tokens_in = prompt_tokens if prompt_tokens is not None else estimated_in
+    tokens_out = completion_tokens if completion_tokens is not None else 0
+    tokens_cached = cached_tokens or 0
+    trace = get_trace()
+    trace.record({
+        "ts": round(time.time(), 3),
+        "stage": _stage.get() or trace.run,
+        "label": label,
+        "model": model,
+        "row": _row.get(),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_cached": tokens_cached,
+        "estimated": estimated,
+        "latency": round(latency, 4),
+        "attempts": attempts,
+        "ok": ok,
+        "cache_hit": False,
+        # a failed call is still billed for the tokens its attempts reported
+        "cost": call_cost(model, tokens_in, tokens_out, tokens_cached) if ok or usage else 0.0,
+    })
+
+
+def record_cache_hit(model: str, label: str):
+    trace = get_trace()
+    trace.record({
+        "ts": round(time.time(), 3),
+        "stage": _stage.get() or trace.run,
+        "label": label,
+        "model": model,
+        "row": _row.get(),
+        "tokens_in": 0,
+        "tokens_out": 0,
+        "tokens_cached": 0,
+        "estimated": False,
+        "latency": 0.0,
+        "attempts": 0,
+        "ok": True,
+        "cache_hit": True,
+        "cost": 0.0,
+    })
+
+
+@atexit.register
+def _finish():
+    if _trace is not None:
+        _trace.finish()
@@ -0,0 +1,141 @@
+"""
+Process-wide OpenAI clients with a shared, keep-alive HTTP connection pool.
+
+Every helper gets its client from `get_client` (or `get_async_client` for
+asyncio code) instead of constructing one per call, so TLS handshakes and
+connection setup are paid once per connection rather than once per request.
+An asyncio client's connections belong to the event loop it was built on:
+`get_async_client` builds a new one for each loop, and `reset_clients` closes
+it on that loop while the loop is still open.
+
+Environment variables:
+    OPENAI_API_KEY            API key (read once, when the client is built)
+    OPENAI_TIMEOUT            total request timeout in seconds (default 120)
+    OPENAI_CONNECT_TIMEOUT    connect timeout in seconds (default 10)
+    OPENAI_MAX_CONNECTIONS    connection pool size (default 32)
+    OPENAI_MAX_KEEPALIVE      idle connections kept open (default 32)
+    OPENAI_KEEPALIVE_EXPIRY   seconds an idle connection is kept (default 60)
+    OPENAI_CLIENT_RETRIES     SDK-level retries per request (default 0: retries and
+                              Retry-After handling belong to common/retry.py, which
+                              would otherwise never see the 429s the SDK absorbs)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional, Set
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+_client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+# close() tasks scheduled on a running loop, kept until done
+_closing: Set[asyncio.Task] = set()
+_lock = threading.Lock()
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        _env_float("OPENAI_TIMEOUT", 120.0),
+        connect=_env_float("OPENAI_CONNECT_TIMEOUT", 10.0)
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_env_int("OPENAI_MAX_CONNECTIONS", 32),
+        max_keepalive_connections=_env_int("OPENAI_MAX_KEEPALIVE", 32),
+        keepalive_expiry=_env_float("OPENAI_KEEPALIVE_EXPIRY", 60.0)
+    )
+
+
+def get_client() -> OpenAI:
+    """
+    Return the shared synchronous client, building it on first use.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=_timeout(),
+                max_retries=_env_int("OPENAI_CLIENT_RETRIES", 0),
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout())
+            )
+        return _client
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Return the shared asyncio client of the running event loop, building it on
+    first use. Call it from a coroutine; a client left from an earlier loop is
+    closed and replaced.
+    """
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if _async_client is not None and _async_loop is not loop:
+            _close_async(_async_client, _async_loop)
+            _async_client = None
+        if _async_client is None:
+            _async_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                timeout=_timeout(),
+                max_retries=_env_int("OPENAI_CLIENT_RETRIES", 0),
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout())
+            )
+            _async_loop = loop
+        return _async_client
+
+
+def _close_async(client: AsyncOpenAI, loop: asyncio.AbstractEventLoop):
+    """
+    Close `client` on the loop that owns its connections: scheduled when that
+    loop runs in this thread, waited for when it runs in another one, and run
+    to completion when it is idle. A closed loop took its sockets with it.
+    """
+    if loop.is_closed():
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    try:
+        if running is loop:
+            task = loop.create_task(client.close())
+            _closing.add(task)
+            task.add_done_callback(_closing.discard)
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=10)
+        else:
+            loop.run_until_complete(client.close())
+    except Exception as err:
+        logging.debug(f"closing the async OpenAI client failed: {err}")
+
+
+def reset_clients():
+    """
+    Close and forget the shared clients, e.g. after changing the environment.
+    """
+    global _client, _async_client, _async_loop
+    with _lock:
+        if _client is not None:
+            _client.close()
+        if _async_client is not None:
+            _close_async(_async_client, _async_loop)
+        _client = None
+        _async_client = None
+        _async_loop = None
@@ -0,0 +1,85 @@
+"""
+Prompt assembly that keeps the long shared content at the front of every request.
+
+Providers with prompt caching (OpenAI, vLLM with prefix caching) reuse the
+longest prefix a request shares with recent ones, once it reaches about 1024
+tokens, and bill the cached input tokens at a discount. As written, each
+template opens with its own instructions under its helper's own system
+message, so requests about the same table only share a prefix within one
+helper and mode.
+
+With PROMPT_LAYOUT=prefix a request is sent as
+
+    system  SHARED_SYSTEM_PROMPT, the same for every helper and mode
+    user    the template's table section, plus the question where it follows the table
+    user    the helper's system message, the template's instructions and the
+            per-claim or per-answer sections
+
+so all requests about the same table start with the same bytes and only the
+last message varies. The template text is unchanged, only reordered. The
+default layout sends every template as written, which keeps results and the
+LLM response cache comparable with earlier runs. Tables pruned per claim
+(TABLE_PRUNE=1) differ between claims, so they leave only the system message
+shared.
+
+Environment variables:
+    PROMPT_LAYOUT  template (default) or prefix
+"""
+
+import os
+from typing import Dict, List, NamedTuple, Union
+
+PROMPT_LAYOUTS = ("template", "prefix")
+DEFAULT_PROMPT_LAYOUT = "template"
+
+SHARED_SYSTEM_PROMPT = (
+    "You are a careful assistant that checks and revises answers about tabular data. "
+    "The data comes first; the task, its instructions and the required output format follow it."
+)
+
+
+class Prompt(NamedTuple):
+    text: str    # the template as written
+    shared: str  # the table section (and question), identical for every request about the table
+    task: str    # the instructions followed by the per-claim or per-answer sections
+
+
+def prompt_layout() -> str:
+    layout = os.getenv("PROMPT_LAYOUT", DEFAULT_PROMPT_LAYOUT)
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown PROMPT_LAYOUT: {layout} (expected one of {', '.join(PROMPT_LAYOUTS)})")
+    return layout
+
+
+def render(template: str, shared_from: str, task_from: str, **fields) -> Prompt:
+    """
+    Format `template` in both layouts. The sections from the heading
+    `shared_from` (e.g. "Table:\\n") up to the heading `task_from` (e.g.
+    "Claim:\\n") are the shared part; the text before them is instructions.
+    """
+    start = template.index(shared_from)
+    end = template.index(task_from, start)
+    instructions, shared, item = template[:start], template[start:end], template[end:]
+    return Prompt(
+        text=template.format(**fields),
+        shared=shared.format(**fields).rstrip(),
+        task=f"{instructions.rstrip()}\n\n{item}".format(**fields),
+    )
+
+
+def messages(system: str, prompt: Union[str, Prompt]) -> List[Dict[str, str]]:
+    """
+    Chat messages for `prompt` in the active layout, with `system` as the
+    helper's system message. A plain string is always sent as written.
+    """
+    if isinstance(prompt, str) or prompt_layout() == "template":
+        text = prompt if isinstance(prompt, str) else prompt.text
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": text}
+        ]
+    return [
+        {"role": "system", "content": SHARED_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt.shared},
+        {"role": "user", "content": f"{system}\n\n{prompt.task}"}
+    ]
@@ -0,0 +1,183 @@
+"""
+Per-model request rate limiting shared by the MT-RAIG and G-Eval pipelines.
+
+By default each process keeps its own buckets. With RATE_LIMIT_DIR set, the
+buckets live in files there instead (one per model and limit, updated under
+an exclusive file lock), so every process pointed at the same directory
+draws from one budget per model. `run_all` starts its jobs this way.
+
+Environment variables:
+    RATE_LIMIT_DIR  directory of the buckets shared between processes
+                    (default: none, per-process buckets)
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens are added per second up to
+    `capacity`; `acquire()` blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket whose state is kept in a JSON file and changed under an
+    exclusive lock, so processes sharing the file share the budget. Same
+    rate/capacity semantics as TokenBucket; wall-clock time is used because
+    monotonic clocks are per process.
+    """
+
+    def __init__(self, path: Path, rate: float, capacity: Optional[float] = None):
+        import fcntl  # noqa: F401 -- fail at setup, not on the first request
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _take(self, tokens: float) -> float:
+        """
+        Take `tokens` if available; otherwise return the seconds to wait.
+        """
+        import fcntl
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                now = time.time()
+                available = min(
+                    self.capacity,
+                    state.get("tokens", self.capacity) + max(0.0, now - state.get("updated", now)) * self.rate
+                )
+                wait = 0.0
+                if available >= tokens:
+                    available -= tokens
+                else:
+                    wait = (tokens - available) / self.rate
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": available, "updated": now}))
+                # written before the lock is released, not when the file closes
+                f.flush()
+                return wait
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return
+            # other processes may take the refill first; check again soon
+            time.sleep(min(wait, 1.0))
+
+
+Bucket = Union[TokenBucket, SharedTokenBucket]
+
+_buckets: Dict[str, Bucket] = {}
+_token_buckets: Dict[str, Bucket] = {}
+_paused_until: Dict[str, float] = {}
+_buckets_lock = threading.Lock()
+
+
+def set_rate_limit(model: str, requests_per_minute: Optional[float], tokens_per_minute: Optional[float] = None):
+    """
+    Configure the request (and optionally prompt-token) budget for `model`.
+    Passing None removes that limit.
+    """
+    with _buckets_lock:
+        if requests_per_minute is None:
+            _buckets.pop(model, None)
+        else:
+            _buckets[model] = _bucket(model, "requests", rate=requests_per_minute / 60.0)
+        if tokens_per_minute is None:
+            _token_buckets.pop(model, None)
+        else:
+            _token_buckets[model] = _bucket(model, "tokens", rate=tokens_per_minute / 60.0, capacity=tokens_per_minute)
+
+
+def shared_limits_supported() -> bool:
+    """
+    Whether SharedTokenBucket can lock its file here (fcntl is POSIX only).
+    """
+    try:
+        import fcntl  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _bucket(model: str, kind: str, rate: float, capacity: Optional[float] = None) -> Bucket:
+    shared_dir = os.getenv("RATE_LIMIT_DIR")
+    if not shared_dir or not shared_limits_supported():
+        return TokenBucket(rate=rate, capacity=capacity)
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", model)
+    return SharedTokenBucket(Path(shared_dir) / f"{name}.{kind}.json", rate=rate, capacity=capacity)
+
+
+def has_token_limit(model: str) -> bool:
+    return model in _token_buckets
+
+
+def pause(model: str, seconds: float):
+    """
+    Hold back every request to `model` for `seconds`, e.g. after a 429, so
+    concurrent workers back off together instead of each hitting the limit.
+    """
+    with _buckets_lock:
+        _paused_until[model] = max(_paused_until.get(model, 0.0), time.monotonic() + seconds)
+
+
+def acquire(model: str, tokens: float = 0.0):
+    """
+    Block until a request to `model` (of about `tokens` prompt tokens) is
+    allowed. No-op for unlimited, unpaused models.
+    """
+    while True:
+        wait = _paused_until.get(model, 0.0) - time.monotonic()
+        if wait <= 0:
+            break
+        time.sleep(wait)
+    bucket = _buckets.get(model)
+    if bucket is not None:
+        bucket.acquire()
+    token_bucket = _token_buckets.get(model)
+    if token_bucket is not None and tokens > 0:
+        token_bucket.acquire(min(tokens, token_bucket.capacity))
@@ -0,0 +1,244 @@
+"""
+Central retry and backoff controller for LLM calls.
+
+Failures are classified before deciding how to wait:
+    rate_limit  429s; honors Retry-After and pauses every worker on the model
+    server      5xx and connection errors; exponential backoff
+    timeout     request timeouts; exponential backoff
+    parse       malformed or schema-invalid responses; short fixed delay, few attempts
+    fatal       auth, bad request, not found; not retried
+
+Backoff uses full jitter, each wait is capped, and so is the total time spent
+waiting on one call. Retry counts and backoff time are kept as process-wide
+metrics and logged at exit. Each call is also recorded in the LLM trace
+(`common.llm_trace`) with its latency, attempts and the token usage of all its
+attempts, including the failed ones (a response that fails to parse was still
+billed), whether it succeeds or gives up.
+
+Environment variables:
+    RETRY_BASE_DELAY      first backoff step in seconds (default 1)
+    RETRY_MAX_WAIT        longest single wait in seconds (default 60)
+    RETRY_MAX_TOTAL_WAIT  give up once this many seconds were spent waiting (default 600)
+    RETRY_MAX_PARSE       attempts allowed for parse failures (default 3)
+"""
+
+import atexit
+import email.utils
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Optional, TypeVar
+
+from common import llm_trace, rate_limit
+from common.table_serialization import estimate_tokens
+
+T = TypeVar("T")
+
+PARSE_RETRY_DELAY = 0.5
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def classify(err: BaseException) -> str:
+    """
+    Map an exception to one of: rate_limit, server, timeout, parse, fatal.
+    """
+    try:
+        import openai
+    except ImportError:
+        openai = None
+    if openai is not None:
+        if isinstance(err, openai.RateLimitError):
+            return "rate_limit"
+        if isinstance(err, openai.APITimeoutError):
+            return "timeout"
+        if isinstance(err, openai.APIConnectionError):
+            return "server"
+        if isinstance(err, openai.APIStatusError):
+            if err.status_code == 429:
+                return "rate_limit"
+            if err.status_code in (408, 409) or err.status_code >= 500:
+                return "server"
+            return "fatal"
+    if getattr(err, "retryable", True) is False:
+        return "fatal"
+    if isinstance(err, TimeoutError):
+        return "timeout"
+    if isinstance(err, (ConnectionError, OSError)):
+        return "server"
+    if isinstance(err, (ValueError, json.JSONDecodeError, AttributeError, KeyError, IndexError)):
+        # pydantic.ValidationError is a ValueError; missing fields on the
+        # response surface as AttributeError/KeyError/IndexError
+        return "parse"
+    return "server"
+
+
+def retry_after(err: BaseException) -> Optional[float]:
+    """
+    Seconds the server asked us to wait, from `retry-after-ms` or `retry-after`.
+    """
+    response = getattr(err, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries: Dict[str, int] = defaultdict(int)
+        self.backoff_seconds = 0.0
+        self.gave_up = 0
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def record_retry(self, kind: str, wait: float):
+        with self._lock:
+            self.retries[kind] += 1
+            self.backoff_seconds += wait
+
+    def record_give_up(self):
+        with self._lock:
+            self.gave_up += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": dict(self.retries),
+                "backoff_seconds": self.backoff_seconds,
+                "gave_up": self.gave_up,
+            }
+
+    def log_stats(self):
+        s = self.snapshot()
+        if s["retries"] or s["gave_up"]:
+            detail = ", ".join(f"{k}={v}" for k, v in sorted(s["retries"].items()))
+            logging.info(
+                f"LLM retries: {sum(s['retries'].values())} over {s['calls']} calls ({detail}), "
+                f"{s['backoff_seconds']:.1f}s backing off, {s['gave_up']} given up"
+            )
+
+
+_stats = RetryStats()
+atexit.register(_stats.log_stats)
+
+
+def stats() -> dict:
+    """
+    Process-wide retry metrics: calls, retries per error class, seconds spent
+    backing off and calls that gave up.
+    """
+    return _stats.snapshot()
+
+
+def request_tokens(request: Dict) -> int:
+    """
+    Estimated prompt tokens of a chat-completion request body.
+    """
+    text = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+    return estimate_tokens(text, request.get("model", "gpt-4o"))
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Full-jitter exponential backoff for the given 1-based attempt.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def call_with_retry(
+    fn: Callable[[], T],
+    model: str,
+    max_attempts: int = 5,
+    request: Optional[Dict] = None,
+    label: str = "OpenAI call"
+) -> T:
+    """
+    Run `fn` (one request plus parsing) until it succeeds, waiting between
+    attempts according to the failure class. Every attempt first passes the
+    model's shared rate limit, charged with the prompt tokens of `request`
+    when a token limit is set, and the run's cost budget
+    (`llm_trace.CostBudgetExceeded`). Re-raises the last error once attempts
+    or the total wait budget run out, or immediately for fatal errors.
+    """
+    prompt_tokens = request_tokens(request) if request is not None else 0
+    tokens = prompt_tokens if rate_limit.has_token_limit(model) else 0.0
+    max_attempts = max(1, max_attempts)
+    base = _env_float("RETRY_BASE_DELAY", 1.0)
+    cap = _env_float("RETRY_MAX_WAIT", 60.0)
+    max_total_wait = _env_float("RETRY_MAX_TOTAL_WAIT", 600.0)
+    max_parse = int(_env_float("RETRY_MAX_PARSE", 3))
+    _stats.record_call()
+    waited = 0.0
+    attempts: Dict[str, int] = defaultdict(int)
+    usage = None
+    llm_trace.take_usage()
+    for attempt in range(1, max_attempts + 1):
+        llm_trace.check_budget()
+        rate_limit.acquire(model, tokens)
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as err:
+            usage = llm_trace.add_usage(usage, llm_trace.take_usage())
+            kind = classify(err)
+            attempts[kind] += 1
+            if kind == "parse":
+                wait = PARSE_RETRY_DELAY
+                out_of_attempts = attempts[kind] >= max_parse
+            else:
+                wait = backoff_delay(attempt, base, cap)
+                out_of_attempts = False
+            if kind == "rate_limit":
+                hint = retry_after(err)
+                if hint is not None:
+                    wait = min(cap, hint) + random.uniform(0, base)
+                rate_limit.pause(model, wait)
+            if (
+                kind == "fatal"
+                or out_of_attempts
+                or attempt == max_attempts
+                or waited + wait > max_total_wait
+            ):
+                _stats.record_give_up()
+                llm_trace.record_call(
+                    model, label, time.perf_counter() - started, attempt, False, prompt_tokens, usage
+                )
+                logging.warning(f"{label} failed ({kind}) after {attempt} attempts: {err}")
+                raise
+            logging.warning(f"{label} attempt {attempt}/{max_attempts} failed ({kind}): {err} – waiting {wait:.1f}s")
+            _stats.record_retry(kind, wait)
+            waited += wait
+            time.sleep(wait)
+            continue
+        usage = llm_trace.add_usage(usage, llm_trace.take_usage())
+        llm_trace.record_call(model, label, time.perf_counter() - started, attempt, True, prompt_tokens, usage)
+        return result
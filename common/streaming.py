@@ -0,0 +1,102 @@
+"""
+Bounded-queue stage runner for streaming pipelines.
+
+Each stage runs on its own worker threads and hands items to the next stage
+through a bounded queue, so a row can be mitigated and re-evaluated while
+later rows are still being detected. A stage function returns the item for
+the next stage, or None to stop the row there (e.g. nothing to mitigate).
+The bounded queues keep a fast stage from running far ahead of a slow one.
+"""
+
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+DEFAULT_QUEUE_SIZE = 16
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[Any], Optional[Any]]
+    workers: int = 1
+
+
+def run_stages(source: Iterable[Any], stages: List[Stage], queue_size: int = DEFAULT_QUEUE_SIZE) -> Dict[str, int]:
+    """
+    Push every item of `source` through `stages` in order and block until all
+    of them drained. An exception in a stage is logged and drops that item;
+    a BaseException stops all stages once their current items are done and
+    is re-raised. Returns the number of items each stage handled.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    handled = {stage.name: 0 for stage in stages}
+    stop = threading.Event()
+    lock = threading.Lock()
+    aborted: List[BaseException] = []
+
+    def put(q: queue.Queue, item: Any):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def worker(i: int, stage: Stage):
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        while not stop.is_set():
+            try:
+                item = inbox.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                inbox.put(_DONE)  # let sibling workers see it too
+                return
+            try:
+                result = stage.fn(item)
+            except Exception as err:
+                logging.warning(f"[{stage.name}] dropped item: {err}")
+                result = None
+            except BaseException as err:
+                # e.g. llm_trace.CostBudgetExceeded: the other workers finish the
+                # item they hold, then the caller re-raises
+                aborted.append(err)
+                stop.set()
+                return
+            with lock:
+                handled[stage.name] += 1
+            if result is not None and outbox is not None:
+                put(outbox, result)
+
+    threads_by_stage = []
+    for i, stage in enumerate(stages):
+        threads = [
+            threading.Thread(target=worker, args=(i, stage), name=f"{stage.name}-{n}", daemon=True)
+            for n in range(max(1, stage.workers))
+        ]
+        for t in threads:
+            t.start()
+        threads_by_stage.append(threads)
+
+    try:
+        for item in source:
+            if stop.is_set():
+                break
+            put(queues[0], item)
+        # close stages front to back: a stage is finished once all its workers exited
+        for i, threads in enumerate(threads_by_stage):
+            put(queues[i], _DONE)
+            for t in threads:
+                while t.is_alive():
+                    t.join(timeout=0.5)
+    except BaseException:
+        stop.set()
+        raise
+    if aborted:
+        raise aborted[0]
+    return handled
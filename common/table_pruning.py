@@ -0,0 +1,136 @@
+"""
+Offline, question-aware table pruning.
+
+Before a table is sent with a claim or question, the rows and columns the
+text refers to are picked out by lexical matching against an inverted index
+over cell values (words and normalized numbers). The header is always kept,
+together with the first column, which usually names the row entity. When
+nothing matches, or the text asks about the table as a whole (totals,
+averages, superlatives), the full table is kept instead.
+
+Environment variables:
+    TABLE_PRUNE  set to 1 to prune tables in verification and scoring prompts
+"""
+
+import os
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from common.table_serialization import serialize_table
+
+_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?|\d[\d,]*(?:\.\d+)?")
+STOPWORDS = frozenset("""
+a an and are as at be been but by did do does for from had has have he her his
+in into is it its of on or she than that the their them there these they this
+those to was were which while who whom with
+""".split())
+# words that make a claim depend on rows it does not name
+WHOLE_TABLE_WORDS = frozenset("""
+all every each total overall average mean sum most least highest lowest largest
+smallest biggest best worst majority rank ranked ranking top bottom maximum minimum
+""".split())
+
+
+def _normalize(token: str) -> str:
+    if token[0].isdigit():
+        token = token.replace(",", "")
+        if "." in token:
+            token = token.rstrip("0").rstrip(".")
+    return token
+
+
+def tokenize(text: Any) -> Set[str]:
+    """
+    Lower-cased content words and normalized numbers in `text`.
+    """
+    tokens = set()
+    for t in _WORD_RE.findall(str(text).lower()):
+        t = _normalize(t)
+        if t and t not in STOPWORDS and (len(t) > 1 or t.isdigit()):
+            tokens.add(t)
+    return tokens
+
+
+class TableIndex:
+    """
+    Inverted index from cell and header tokens to table positions, built once
+    per table and reused for every claim checked against it.
+    """
+
+    def __init__(self, table: Dict):
+        self.table = table
+        self.header: List = list(table.get("header", []))
+        self.rows: List = list(table.get("rows", []))
+        self.cells: Dict[str, Set[Tuple[int, int]]] = defaultdict(set)
+        self.columns: Dict[str, Set[int]] = defaultdict(set)
+        for j, name in enumerate(self.header):
+            for t in tokenize(name):
+                self.columns[t].add(j)
+        for i, row in enumerate(self.rows):
+            for j, value in enumerate(row):
+                for t in tokenize(value):
+                    self.cells[t].add((i, j))
+
+    def match(self, tokens: Iterable[str]) -> Tuple[Dict[int, int], Set[int]]:
+        """
+        Row idx -> number of distinct query tokens found in it, and the set
+        of columns named in the header or holding a matched cell.
+        """
+        row_hits: Dict[int, int] = defaultdict(int)
+        cols: Set[int] = set()
+        for t in tokens:
+            cols |= self.columns.get(t, set())
+            rows_for_token = set()
+            for i, j in self.cells.get(t, ()):
+                rows_for_token.add(i)
+                cols.add(j)
+            for i in rows_for_token:
+                row_hits[i] += 1
+        return row_hits, cols
+
+
+def prune_table(table: Any, text: str, index: Optional[TableIndex] = None) -> Tuple[Any, Optional[List[int]]]:
+    """
+    Return (table with only the rows relevant to `text`, columns to keep).
+    Columns is None when every column is kept. Falls back to the unchanged
+    table when `table` is not a dict or nothing in `text` matches it.
+    """
+    if not isinstance(table, dict) or not table.get("rows"):
+        return table, None
+    index = index or TableIndex(table)
+    tokens = tokenize(text)
+    row_hits, cols = index.match(tokens)
+    if not row_hits and not cols:
+        return table, None
+
+    if tokens & WHOLE_TABLE_WORDS or not row_hits:
+        rows = index.rows
+    else:
+        best = max(row_hits.values())
+        # a row must share at least half as many tokens as the best one
+        keep = sorted(i for i, hits in row_hits.items() if 2 * hits >= best)
+        rows = [index.rows[i] for i in keep]
+
+    if not cols or len(cols) + 1 >= len(index.header):
+        columns = None
+    else:
+        columns = sorted(cols | {0})
+    return {**table, "rows": rows}, columns
+
+
+def pruning_enabled() -> bool:
+    return os.getenv("TABLE_PRUNE", "0") == "1"
+
+
+def render_for_query(table: Any, text: str, index: Optional[TableIndex] = None, prune: Optional[bool] = None) -> str:
+    """
+    Serialize `table` for a prompt about `text`, pruned to the relevant rows
+    and columns when pruning is on (`prune`, or TABLE_PRUNE when unset).
+    """
+    if prune is None:
+        prune = pruning_enabled()
+    if not prune:
+        return serialize_table(table)
+    pruned, columns = prune_table(table, text, index)
+    return serialize_table(pruned, columns=columns)
@@ -0,0 +1,171 @@
+"""
+Compact table serialization for prompts.
+
+Tables reach the pipelines as dicts with `title`, `header` and `rows` (or as
+an already-serialized string, which is passed through unchanged). Every
+prompt builder renders them through `serialize_table`, which replaces the
+Python repr with a compact text format and can truncate oversized tables to
+a token budget.
+
+Formats:
+    markdown  title line plus a markdown table (default)
+    pipe      title line, then one `a | b | c` line for the header and each row
+    pruned    like pipe, but drops columns that are empty in every row
+    repr      the original Python dict repr, for reproducing earlier runs
+
+Environment variables:
+    TABLE_FORMAT      one of the formats above
+    TABLE_MAX_TOKENS  truncate tables whose serialization exceeds this many tokens
+    TABLE_TRUNCATION  `head` (keep the first rows, default) or `sample` (evenly spaced rows)
+"""
+
+import os
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+TABLE_FORMATS = ("markdown", "pipe", "pruned", "repr")
+TRUNCATION_STRATEGIES = ("head", "sample")
+DEFAULT_TABLE_FORMAT = "markdown"
+DEFAULT_TRUNCATION = "head"
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def estimate_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Token count of `text` for `model`. Uses tiktoken when it is installed and
+    falls back to a characters-per-token estimate otherwise.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text))
+
+
+def _cell(value: Any) -> str:
+    return " ".join(str(value).split()) if value is not None else ""
+
+
+def _title(table: Dict) -> str:
+    title = table.get("title", "")
+    if isinstance(title, (list, tuple)):
+        title = " - ".join(_cell(t) for t in title if _cell(t))
+    return _cell(title)
+
+
+def _select_columns(header: Sequence, rows: List[Sequence], columns: Optional[Sequence[int]]):
+    if columns is None:
+        return list(header), [list(r) for r in rows]
+    return [header[i] for i in columns], [[r[i] if i < len(r) else "" for i in columns] for r in rows]
+
+
+def _non_empty_columns(header: Sequence, rows: List[Sequence]) -> List[int]:
+    return [
+        i for i in range(len(header))
+        if any(i < len(r) and _cell(r[i]) for r in rows)
+    ]
+
+
+def _render_markdown(title: str, header: Sequence, rows: List[Sequence]) -> str:
+    def line(cells: Sequence) -> str:
+        return "| " + " | ".join(_cell(c).replace("|", "\\|") for c in cells) + " |"
+    lines = [f"Title: {title}"] if title else []
+    lines.append(line(header))
+    lines.append("|" + "---|" * len(header))
+    lines.extend(line(r) for r in rows)
+    return "\n".join(lines)
+
+
+def _render_pipe(title: str, header: Sequence, rows: List[Sequence]) -> str:
+    lines = [f"Title: {title}"] if title else []
+    lines.append(" | ".join(_cell(c) for c in header))
+    lines.extend(" | ".join(_cell(c) for c in r) for r in rows)
+    return "\n".join(lines)
+
+
+def _render(table: Dict, fmt: str, rows: List[Sequence], columns: Optional[Sequence[int]]) -> str:
+    if fmt == "repr":
+        if columns is None:
+            return str({**table, "rows": rows})
+        header, rows = _select_columns(table.get("header", []), rows, columns)
+        return str({**table, "header": header, "rows": rows})
+    header, rows = _select_columns(table.get("header", []), rows, columns)
+    if fmt == "pruned":
+        keep = _non_empty_columns(header, rows)
+        header, rows = _select_columns(header, rows, keep)
+    render: Callable = _render_markdown if fmt == "markdown" else _render_pipe
+    return render(_title(table), header, rows)
+
+
+def _pick_rows(rows: List[Sequence], n: int, truncation: str) -> List[Sequence]:
+    if n >= len(rows):
+        return rows
+    if truncation == "head" or n <= 0:
+        return rows[:n]
+    step = len(rows) / n
+    return [rows[int(i * step)] for i in range(n)]
+
+
+def table_settings() -> str:
+    """
+    The TABLE_* settings that shape `serialize_table` output, for cache keys.
+    """
+    return ",".join([
+        os.getenv("TABLE_FORMAT", DEFAULT_TABLE_FORMAT),
+        os.getenv("TABLE_MAX_TOKENS", ""),
+        os.getenv("TABLE_TRUNCATION", DEFAULT_TRUNCATION),
+    ])
+
+
+def serialize_table(
+    table: Any,
+    fmt: Optional[str] = None,
+    max_tokens: Optional[int] = None,
+    truncation: Optional[str] = None,
+    columns: Optional[Sequence[int]] = None,
+    model: str = "gpt-4o"
+) -> str:
+    """
+    Render a `{title, header, rows}` table as prompt text.
+    `columns` keeps only those column indices. When the result exceeds
+    `max_tokens`, rows are dropped (per `truncation`) until it fits and a
+    note with the number of rows shown is appended.
+    Unset arguments fall back to the TABLE_* environment variables.
+    """
+    if not isinstance(table, dict):
+        return str(table)
+    fmt = fmt or os.getenv("TABLE_FORMAT", DEFAULT_TABLE_FORMAT)
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format: {fmt}")
+    if max_tokens is None and os.getenv("TABLE_MAX_TOKENS"):
+        max_tokens = int(os.getenv("TABLE_MAX_TOKENS"))
+    truncation = truncation or os.getenv("TABLE_TRUNCATION", DEFAULT_TRUNCATION)
+    if truncation not in TRUNCATION_STRATEGIES:
+        raise ValueError(f"Unknown truncation strategy: {truncation}")
+
+    rows = list(table.get("rows", []))
+    text = _render(table, fmt, rows, columns)
+    if max_tokens is None or estimate_tokens(text, model) <= max_tokens:
+        return text
+
+    # largest row count whose rendering fits the budget
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(_render(table, fmt, _pick_rows(rows, mid, truncation), columns), model) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    kept = _pick_rows(rows, lo, truncation)
+    return _render(table, fmt, kept, columns) + f"\n({len(kept)} of {len(rows)} rows shown)"
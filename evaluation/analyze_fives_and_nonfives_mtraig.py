@@ -2,25 +2,20 @@ import json
 import os
 import argparse
 from pathlib import Path
+from common.dataset_store import load_dataset
+from common.stats import non5_confusion
 
 def analyze_fives_and_nonfives(human_scores, model_scores, label):
-    assert len(human_scores) == len(model_scores), "Mismatch in data length"
-    total = len(human_scores)
-    human_5_indices = {i for i, s in enumerate(human_scores) if s == 5}
-    model_5_indices = {i for i, s in enumerate(model_scores) if s == 5}
-    human_non5_indices = {i for i in range(total)} - human_5_indices
-    model_non5_indices = {i for i in range(total)} - model_5_indices
-    matched_non5 = human_non5_indices & model_non5_indices
-    missed_non5 = human_non5_indices - model_non5_indices
-    wrong_non5 = model_non5_indices - human_non5_indices
+    c = non5_confusion(human_scores, model_scores)
     print(f"\n--- {label} ---")
-    print(f"Total datapoints: {total}")
+    print(f"Total datapoints: {c['total']}")
     print(f"\nNon-5-score analysis:")
-    print(f"  Human non-5s: {len(human_non5_indices)}")
-    print(f"  Model non-5s: {len(model_non5_indices)}")
-    print(f"    Matched non-5s: {len(matched_non5)}")
-    print(f"    Missed (Human non-5s predicted as 5): {len(missed_non5)}")
-    print(f"    Wrongly predicted as non-5: {len(wrong_non5)}")
+    print(f"  Human non-5s: {c['human_non5']}")
+    print(f"  Model non-5s: {c['model_non5']}")
+    print(f"    Matched non-5s: {c['matched_non5']}")
+    print(f"    Missed (Human non-5s predicted as 5): {c['missed_non5']}")
+    print(f"    Wrongly predicted as non-5: {c['wrong_non5']}")
+    print(f"    Matched 5s: {c['matched_5']}")
 
 def run_analysis_for_model(model_name: str):
     repo_root = Path(__file__).parent.parent
@@ -29,9 +24,8 @@ def run_analysis_for_model(model_name: str):
     datasets = ["qtsumm", "fetaqa"]
     for dataset in datasets:
         print(f"\n{dataset.upper()} Dataset")
-        with open(data_outputs_dir / f"model_outputs_with_scores_{dataset}.json", 'r') as f:
-            human_entries = json.load(f)
-        human_scores = [entry['faithfulness_score'] for entry in human_entries]
+        human_entries = load_dataset(data_outputs_dir / f"model_outputs_with_scores_{dataset}.json")
+        human_scores = human_entries.tolist('faithfulness_score')
         mtraig_path = mtraig_dir / f"{model_name}_{dataset}.json"
         with open(mtraig_path, 'r') as f:
             mtraig_data = json.load(f)
@@ -0,0 +1,86 @@
+import json
+import argparse
+from pathlib import Path
+from g_eval.helpers.automated_eval_utils import load_coarse_scores, load_oracle_coarse_scores
+from common.stats import paired_bootstrap_ci, paired_permutation_test, DEFAULT_RESAMPLES
+
+def full_dataset_change(old_scores, new_scores):
+    """
+    Per-row change after mitigation over the full dataset; rows without a
+    re-evaluated score keep their old score (change 0).
+    """
+    changes = [0.0] * len(old_scores)
+    for idx, new in new_scores.items():
+        changes[idx] = new - old_scores[idx]
+    return changes
+
+def load_mtraig_changes(repo_root: Path, model: str, dataset: str):
+    with open(repo_root / "mtraig" / "faithfulness_scores" / f"{model}_{dataset}.json") as f:
+        old_scores = [e["faithfulness_score"] for e in json.load(f)["detailed_results"]]
+    with open(repo_root / "mtraig" / "automated_eval_checkpoints" / f"{model}_{dataset}.json") as f:
+        new_scores = {e["original_idx"]: e["new_score"] for e in json.load(f)}
+    return full_dataset_change(old_scores, new_scores)
+
+def load_geval_changes(repo_root: Path, model: str, dataset: str, type: str, metric: str):
+    # oracle mitigation starts from the human scores, normal from the model's own
+    old_scores = load_coarse_scores(dataset, model, metric) if type == "normal" else load_oracle_coarse_scores(dataset, metric)
+    with open(repo_root / "g_eval" / "automated_eval_checkpoints" / type / metric / f"{model}_{dataset}.json") as f:
+        new_scores = {int(k): v for k, v in json.load(f)["all_new_scores"].items()}
+    return full_dataset_change(old_scores, new_scores)
+
+def compare(changes_a, changes_b, model_a: str, model_b: str, title: str, out_file: Path, n_resamples: int):
+    """
+    Paired comparison of the per-row improvement of two models on the same rows.
+    Each model both mitigates and scores its own answers, so the comparison is
+    of improvements, not of raw scores.
+    """
+    assert len(changes_a) == len(changes_b), "Mismatch in data length"
+    diff, lo, hi = paired_bootstrap_ci(changes_b, changes_a, n_resamples)
+    p = paired_permutation_test(changes_b, changes_a, n_resamples)
+    mean_a = sum(changes_a) / len(changes_a)
+    mean_b = sum(changes_b) / len(changes_b)
+    lines = [
+        f"{title} – {model_a} vs {model_b}",
+        f"examples total             : {len(changes_a)}",
+        f"improvement {model_a:<15}: {mean_a / 5 * 100:+.2f}%",
+        f"improvement {model_b:<15}: {mean_b / 5 * 100:+.2f}%",
+        f"difference                 : {diff / 5 * 100:+.2f}%",
+        f"95% CI (bootstrap)         : [{lo / 5 * 100:+.2f}%, {hi / 5 * 100:+.2f}%]",
+        f"p-value (permutation)      : {p:.4f}",
+        f"resamples                  : {n_resamples}",
+    ]
+    print("\n" + "\n".join(lines))
+    out_file.parent.mkdir(parents=True, exist_ok=True)
+    out_file.write_text("\n".join(lines) + "\n")
+
+def run_comparison(model_a: str, model_b: str, n_resamples: int):
+    repo_root = Path(__file__).parent.parent
+    results_dir = repo_root / "results"
+    for dataset in ["qtsumm", "fetaqa"]:
+        name = f"{model_a}_vs_{model_b}_{dataset}.txt"
+        compare(
+            load_mtraig_changes(repo_root, model_a, dataset),
+            load_mtraig_changes(repo_root, model_b, dataset),
+            model_a, model_b, f"{dataset.upper()} MT-RAIG faithfulness",
+            results_dir / "mtraig_automated_eval" / name, n_resamples
+        )
+        for type in ["normal", "oracle"]:
+            for metric in ["faithfulness", "completeness"]:
+                try:
+                    changes_a = load_geval_changes(repo_root, model_a, dataset, type, metric)
+                    changes_b = load_geval_changes(repo_root, model_b, dataset, type, metric)
+                except FileNotFoundError as err:
+                    print(f"\nSkipping G-Eval {type} {metric} on {dataset}: {err}")
+                    continue
+                compare(
+                    changes_a, changes_b, model_a, model_b, f"{dataset.upper()} G-Eval {type} {metric}",
+                    results_dir / "geval_automated_eval" / type / metric / name, n_resamples
+                )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test whether two models' mitigation improvements differ.")
+    parser.add_argument('--model_a', type=str, default="gpt-4o", help='First model (e.g., gpt-4o)')
+    parser.add_argument('--model_b', type=str, default="gpt-4o-mini", help='Second model (e.g., gpt-4o-mini)')
+    parser.add_argument('--resamples', type=int, default=DEFAULT_RESAMPLES, help='Bootstrap resamples and permutations')
+    args = parser.parse_args()
+    run_comparison(args.model_a, args.model_b, args.resamples)
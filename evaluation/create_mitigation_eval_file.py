@@ -3,6 +3,7 @@ import json
 import csv
 from pathlib import Path
 import argparse
+from common.dataset_store import load_dataset
 
 def create_mitigation_eval_file(model_name: str, dataset: str, num_points: int = 50):
     """
@@ -20,8 +21,7 @@ def create_mitigation_eval_file(model_name: str, dataset: str, num_points: int =
     json_path   = out_dir / f"{model_name}_{dataset}.json"
     csv_path    = out_dir / f"{model_name}_{dataset}.csv"
     # load base examples
-    with data_file.open() as f:
-        full_data = json.load(f)
+    full_data = load_dataset(data_file).records()
     # load mitigation entries
     lftqa_entries  = [json.loads(line) for line in lftqa_file.open()]
     mtraig_entries = [json.loads(line) for line in mtraig_file.open()]
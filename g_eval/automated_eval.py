@@ -1,3 +1,4 @@
+import sys
 import logging
 import json
 from pathlib import Path
@@ -9,49 +10,120 @@ from g_eval.helpers.automated_eval_utils import (
     RESULTS_DIR_NORMAL_FAITH, RESULTS_DIR_NORMAL_COMP,
     RESULTS_DIR_ORACLE_FAITH, RESULTS_DIR_ORACLE_COMP
 )
-from g_eval.helpers.prompts import FAITH_PROMPT_TEMPLATE, COMP_PROMPT_TEMPLATE
-from g_eval.helpers.schemas import FaithfulnessScore, CompletenessScore
-from g_eval.helpers.openai_utils import call_openai_structured
+from g_eval.helpers.scoring_modes import SCORING_MODES, format_scoring_prompt
+from g_eval.helpers.mitigation_utils import mitigation_path, mitigation_tag, needs_mitigation
+from g_eval.helpers.openai_utils import (
+    SCORING_METHODS, DEFAULT_SAMPLES, DEFAULT_SAMPLE_TEMPERATURE, GREEDY, Scoring,
+    batch_extractor, build_structured_request, call_openai_scores, parse_scores
+)
+from common import rate_limit, llm_backend, llm_trace
+from common.prompt_layout import Prompt
+from common.checkpoint import CheckpointStore
+from common.batch import BatchBackend, get_backend, run_cached_batch
+from typing import Optional, List, Dict
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 MAX_API_RETRY = 20
+# checkpoint entry holding the last processed line; score entries are keyed by row idx
+LAST_LINE_KEY = "last_line"
+AE_CKPT_DIRS = {
+    ("normal", "faithfulness"): AE_CKPT_DIR_NORMAL_FAITH,
+    ("normal", "completeness"): AE_CKPT_DIR_NORMAL_COMP,
+    ("oracle", "faithfulness"): AE_CKPT_DIR_ORACLE_FAITH,
+    ("oracle", "completeness"): AE_CKPT_DIR_ORACLE_COMP
+}
+RESULTS_DIRS = {
+    ("normal", "faithfulness"): RESULTS_DIR_NORMAL_FAITH,
+    ("normal", "completeness"): RESULTS_DIR_NORMAL_COMP,
+    ("oracle", "faithfulness"): RESULTS_DIR_ORACLE_FAITH,
+    ("oracle", "completeness"): RESULTS_DIR_ORACLE_COMP
+}
 
-def evaluate_mitigation(dataset: str, model: str, type: str, mode: str):
-    assert mode in {"faithfulness", "completeness"}, "Invalid mode"
+def evaluate_mitigation(
+    dataset: str,
+    model: str,
+    type: str,
+    mode: str,
+    batch_backend: Optional[BatchBackend] = None,
+    poll_interval: float = 60.0,
+    scoring: Scoring = GREEDY,
+    mitigation_model: Optional[str] = None
+):
+    """
+    Re-score the answers `mitigation_model` (default: `model`) revised. Mode "both" scores faithfulness and completeness
+    in one request per answer and updates both checkpoints and summaries.
+    Normal re-evaluation reads the detection scores and mitigation outputs of
+    the same `scoring`, so before/after scores are comparable; the checkpoints
+    and summaries of non-greedy methods are named with its tag, and those of
+    another mitigation model with its mitigation_tag.
+    """
+    assert mode in SCORING_MODES, "Invalid mode"
     assert type in {"normal", "oracle"}, "Invalid type"
-    mit_file = (MITIG_DIR if type == "normal" else ORACLE_MIT_DIR) / f"{model}_{dataset}.jsonl"
-    ae_ck_dir = {
-        ("normal", "faithfulness"): AE_CKPT_DIR_NORMAL_FAITH,
-        ("normal", "completeness"): AE_CKPT_DIR_NORMAL_COMP,
-        ("oracle", "faithfulness"): AE_CKPT_DIR_ORACLE_FAITH,
-        ("oracle", "completeness"): AE_CKPT_DIR_ORACLE_COMP
-    }[(type, mode)]
-    results_dir = {
-        ("normal", "faithfulness"): RESULTS_DIR_NORMAL_FAITH,
-        ("normal", "completeness"): RESULTS_DIR_NORMAL_COMP,
-        ("oracle", "faithfulness"): RESULTS_DIR_ORACLE_FAITH,
-        ("oracle", "completeness"): RESULTS_DIR_ORACLE_COMP
-    }[(type, mode)]
-    ae_ck_file = ae_ck_dir / f"{model}_{dataset}.json"
-    summary_file = results_dir / f"{model}_{dataset}.txt"
+    prompt_template, schema, fields = SCORING_MODES[mode]
+    # the scores that picked the mitigated rows: detection's, or the human ones
+    old_scoring = scoring if type == "normal" else GREEDY
+    mit_file = mitigation_path(MITIG_DIR if type == "normal" else ORACLE_MIT_DIR, dataset, model, old_scoring, mitigation_model)
+    tag = f"{model}_{dataset}{scoring.tag}{mitigation_tag(model, mitigation_model)}"
+    ae_ck_files = {m: AE_CKPT_DIRS[(type, m)] / f"{tag}.json" for m in fields}
+    summary_files = {m: RESULTS_DIRS[(type, m)] / f"{tag}.txt" for m in fields}
     if not mit_file.exists():
         raise FileNotFoundError(mit_file)
     if type == "normal":
-        old_scores = load_coarse_scores(dataset, model, mode)
+        old_scores = {m: load_coarse_scores(dataset, model, m, scoring.tag) for m in fields}
     else:
-        old_scores = load_oracle_coarse_scores(dataset, mode)
+        old_scores = {m: load_oracle_coarse_scores(dataset, m) for m in fields}
     rows = load_dataset_rows(dataset)
-    all_new_scores = {}
-    last_line = -1
-    if ae_ck_file.exists():
-        ck = json.load(ae_ck_file.open())
-        all_new_scores = ck.get("all_new_scores", {})
-        last_line = ck.get("last_line", -1)
-        logging.info(f"[{dataset}] resume {mode} eval at line {last_line + 1}")
-    prompt_template = FAITH_PROMPT_TEMPLATE if mode == "faithfulness" else COMP_PROMPT_TEMPLATE
-    schema = FaithfulnessScore if mode == "faithfulness" else CompletenessScore
-    field = "faithfulness" if mode == "faithfulness" else "completeness"
+    for m in fields:
+        if type == "normal" and len(old_scores[m]) != len(rows):
+            raise ValueError(f"{len(old_scores[m])} {m} scores for {len(rows)} rows; finish detection first")
+    # Scores are journaled one line at a time; each checkpoint JSON keeps the
+    # {"last_line", "all_new_scores"} shape and is rewritten on compaction.
+    stores = {m: open_automated_eval_store(ae_ck_files[m]) for m in fields}
+    last_lines = {m: stores[m].get(LAST_LINE_KEY, -1) for m in fields}
+    for m in fields:
+        if ae_ck_files[m].exists():
+            logging.info(f"[{dataset}] resume {m} eval at line {last_lines[m] + 1}")
+    last_line = min(last_lines.values())
+
+    def save_scores(scores: Dict[str, Dict[str, float]]):
+        for m in fields:
+            stores[m].put_many({**scores.get(m, {}), LAST_LINE_KEY: max(last_line, last_lines[m])})
+
+    def metrics_to_score(idx: int) -> List[str]:
+        return [m for m in fields if needs_mitigation(old_scores[m][idx], old_scoring) and str(idx) not in stores[m]]
+
+    def build_prompt(idx: int, revised_answer: str) -> Prompt:
+        return format_scoring_prompt(prompt_template, rows[idx], revised_answer)
+
+    # Score pending lines through an offline batch first; the loop below picks up the rest
+    if batch_backend is not None:
+        requests = {}
+        with mit_file.open() as f:
+            for ln, raw in enumerate(f):
+                if ln <= last_line:
+                    continue
+                e = json.loads(raw)
+                idx = e["original_idx"]
+                if not metrics_to_score(idx):
+                    continue
+                requests[str(idx)] = build_structured_request(build_prompt(idx, e["revised_answer"].strip()), schema, model=model, scoring=scoring)
+        batch_scores = run_cached_batch(
+            requests,
+            extract=batch_extractor(scoring),
+            parse=lambda raw: parse_scores(raw, schema, fields, scoring),
+            backend=batch_backend,
+            tag=f"g_eval_automated_eval_{type}_{mode}{scoring.tag}_{model}_{dataset}{mitigation_tag(model, mitigation_model)}",
+            poll_interval=poll_interval
+        )
+        merged = {m: {} for m in fields}
+        for idx_str, scores in batch_scores.items():
+            for m in metrics_to_score(int(idx_str)):
+                merged[m][idx_str] = scores[m]
+        if batch_scores:
+            save_scores(merged)
+            logging.info(f"[{dataset}] merged {len(batch_scores)} batch scores into {', '.join(map(str, ae_ck_files.values()))}")
+
     with mit_file.open() as f:
         for ln, raw in enumerate(f):
             if ln <= last_line:
@@ -59,37 +131,57 @@ def evaluate_mitigation(dataset: str, model: str, type: str, mode: str):
             e = json.loads(raw)
             idx = e["original_idx"]
             revised_answer = e["revised_answer"].strip()
-            old = old_scores[idx]
-            if old >= 5:
+            pending = metrics_to_score(idx)
+            if not pending:
                 last_line = ln
                 continue
-            r = rows[idx]
-            serialized_table = r["serialized_table"]
-            prompt = prompt_template.format(
-                table=serialized_table,
-                question=r["question"],
-                gen_answer=revised_answer
-            )
+            prompt = build_prompt(idx, revised_answer)
             try:
-                new_score = call_openai_structured(
-                    prompt,
-                    schema=schema,
-                    field=field,
-                    model=model,
-                    temperature=0.0,
-                    max_retries=MAX_API_RETRY
-                )
+                with llm_trace.scope(row=idx):
+                    new_scores = call_openai_scores(
+                        prompt,
+                        schema=schema,
+                        fields=fields,
+                        model=model,
+                        temperature=0.0,
+                        max_retries=MAX_API_RETRY,
+                        scoring=scoring
+                    )
             except Exception as err:
                 logging.warning(f"{idx}: {err}; keeping old score")
-                new_score = old
-            all_new_scores[str(idx)] = new_score
+                new_scores = {m: old_scores[m][idx] for m in fields}
             last_line = ln
-            json.dump({
-                "last_line": last_line,
-                "all_new_scores": all_new_scores
-            }, ae_ck_file.open("w"), indent=2)
+            save_scores({m: {str(idx): new_scores[m]} for m in pending})
+    for m in fields:
+        stores[m].close()
+        write_summary(dataset, m, old_scores[m], _dump_scores(stores[m].entries)["all_new_scores"], summary_files[m], scoring)
+
+def open_automated_eval_store(ae_ck_file: Path) -> CheckpointStore:
+    """
+    Re-evaluation scores of one metric keyed by row idx, plus the last processed
+    mitigation line under LAST_LINE_KEY.
+    """
+    return CheckpointStore(ae_ck_file, load=_load_scores, dump=_dump_scores, indent=2)
+
+def _load_scores(ck: dict) -> dict:
+    return {**ck.get("all_new_scores", {}), LAST_LINE_KEY: ck.get("last_line", -1)}
+
+def _dump_scores(entries: dict) -> dict:
+    return {
+        "last_line": entries.get(LAST_LINE_KEY, -1),
+        "all_new_scores": {k: v for k, v in entries.items() if k != LAST_LINE_KEY}
+    }
+
+def write_summary(
+    dataset: str,
+    mode: str,
+    old_scores: List[float],
+    all_new_scores: Dict[str, float],
+    summary_file: Path,
+    scoring: Scoring = GREEDY
+):
     if not all_new_scores:
-        logging.warning("Nothing processed")
+        logging.warning(f"Nothing processed for {mode}")
         return
     new_scores_full = old_scores.copy()
     for idx_str, new_score in all_new_scores.items():
@@ -102,24 +194,61 @@ def evaluate_mitigation(dataset: str, model: str, type: str, mode: str):
     avg_old_affected = sum(affected_old) / len(affected_old)
     avg_new_affected = sum(affected_new) / len(affected_new)
     pct_impr_affected = (avg_new_affected - avg_old_affected) / 5 * 100
+    # numpy is only needed for the significance lines
+    from common.stats import significance_lines
+    summary_file.parent.mkdir(parents=True, exist_ok=True)
     with summary_file.open("w") as sf:
         sf.write(f"{dataset.upper()} – coarse {mode}\n")
+        if scoring.method != "greedy":
+            sf.write(f"scoring               : {scoring.description}\n")
         sf.write(f"examples total        : {len(old_scores)}\n")
         sf.write(f"mitigated datapoints  : {len(all_new_scores)}\n")
         sf.write(f"average before (total): {avg_old_total:.3f}\n")
         sf.write(f"average after  (total): {avg_new_total:.3f}\n")
-        sf.write(f"change total          : {pct_impr_total:+.1f}%\n\n")
+        sf.write(f"change total          : {pct_impr_total:+.1f}%\n")
+        sf.write("".join(line + "\n" for line in significance_lines(old_scores, new_scores_full, width=22)))
+        sf.write("\n")
         sf.write(f"average before (affected): {avg_old_affected:.3f}\n")
         sf.write(f"average after  (affected): {avg_new_affected:.3f}\n")
         sf.write(f"change affected          : {pct_impr_affected:+.1f}%\n")
+        sf.write("".join(line + "\n" for line in significance_lines(affected_old, affected_new, width=25)))
     logging.info(f"[{dataset}] summary written to {summary_file}")
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
     import argparse
     parser = argparse.ArgumentParser(description="Automated evaluation of G-Eval mitigation.")
     parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
     parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
+    parser.add_argument('--mitigation_model', type=str, default=None, help="Model that wrote the revised answers to score (default: --model)")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
     parser.add_argument('--type', type=str, default='normal', choices=['normal', 'oracle'], help="Mitigation type")
-    parser.add_argument('--mode', type=str, default='faithfulness', choices=['faithfulness', 'completeness'], help="Evaluation mode")
-    args = parser.parse_args()
-    evaluate_mitigation(args.dataset, args.model, args.type, args.mode) 
\ No newline at end of file
+    parser.add_argument('--mode', type=str, default='faithfulness', choices=list(SCORING_MODES), help="Evaluation mode; 'both' scores faithfulness and completeness in one request")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--batch', action='store_true', help="Submit pending lines through the batch API before any synchronous calls")
+    parser.add_argument('--batch_backend', type=str, default='openai', choices=['openai', 'local'], help="Batch backend used with --batch")
+    parser.add_argument('--poll_interval', type=float, default=60.0, help="Seconds between batch status polls")
+    parser.add_argument('--scoring', type=str, default='greedy', choices=list(SCORING_METHODS), help="Score read-out: greedy integer, mean of sampled scores, or logprob-weighted expected score")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="Samples per answer with --scoring samples (one request with n samples)")
+    parser.add_argument('--sample_temperature', type=float, default=DEFAULT_SAMPLE_TEMPERATURE, help="Sampling temperature with --scoring samples")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("g_eval.automated_eval")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.model, args.rpm, args.tpm)
+    try:
+        evaluate_mitigation(
+            args.dataset, args.model, args.type, args.mode,
+            batch_backend=get_backend(args.batch_backend) if args.batch else None,
+            poll_interval=args.poll_interval,
+            scoring=Scoring(args.scoring, args.samples, args.sample_temperature),
+            mitigation_model=args.mitigation_model
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; scored lines are checkpointed, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,25 @@ Refactored to use modular helpers.
 import os
 import json
 import logging
-import pandas as pd
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Dict, List, Union
+import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from g_eval.helpers.prompts import FAITH_PROMPT_TEMPLATE, COMP_PROMPT_TEMPLATE
-from g_eval.helpers.schemas import FaithfulnessScore, CompletenessScore
-from g_eval.helpers.openai_utils import call_openai_structured
+from g_eval.helpers.scoring_modes import SCORING_MODES, format_scoring_prompt
+from g_eval.helpers.openai_utils import (
+    SCORING_METHODS, DEFAULT_SAMPLES, DEFAULT_SAMPLE_TEMPERATURE, GREEDY, Scoring,
+    batch_extractor, build_structured_request, call_openai_scores, parse_scores
+)
 from g_eval.helpers.correlation import calculate_correlation
+from common import rate_limit, llm_backend, llm_trace
+from common.prompt_layout import Prompt
+from common.checkpoint import CheckpointStore
+from common.dataset_store import load_dataset
+from common.batch import BatchBackend, get_backend, run_cached_batch
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
@@ -23,100 +34,231 @@ def evaluate(
     mode: str = "faithfulness",
     data_dir: Optional[str] = None,
     checkpoint_dir: Optional[str] = None,
-    results_dir: Optional[str] = None
-) -> float:
+    results_dir: Optional[str] = None,
+    workers: int = 1,
+    batch_backend: Optional[BatchBackend] = None,
+    poll_interval: float = 60.0,
+    scoring: Scoring = GREEDY
+) -> Union[float, Dict[str, float]]:
     """
-    Evaluate either faithfulness or completeness scores using OpenAI structured output.
-    Saves checkpoints and results in the specified directories.
+    Evaluate faithfulness, completeness, or both scores using OpenAI structured output.
+    Mode "both" scores each row once with a combined prompt, writes the faithfulness
+    and completeness checkpoints/results in the same pass and returns r per metric.
+    Up to `workers` rows are scored concurrently. With `batch_backend`, pending rows
+    are first scored through an offline batch and only the leftovers are called directly.
+    `scoring` picks greedy, sampled or logprob-weighted scores (see openai_utils);
+    non-greedy checkpoints and results are named with its tag, so each method
+    resumes only its own scores. Saves checkpoints and results in the specified
+    directories.
     """
-    assert mode in {"faithfulness", "completeness"}, "Mode must be 'faithfulness' or 'completeness'"
+    assert mode in SCORING_MODES, "Mode must be 'faithfulness', 'completeness' or 'both'"
+    prompt_template, schema_class, fields = SCORING_MODES[mode]
+
+    def metric_dir(base: Optional[str], default: str, metric: str) -> str:
+        if base is None:
+            return os.path.join(os.path.dirname(__file__), default.format(metric=metric))
+        return os.path.join(base, metric) if mode == "both" else base
+
     if data_dir is None:
         data_dir = os.path.join(os.path.dirname(__file__), '../data/outputs')
-    if checkpoint_dir is None:
-        checkpoint_dir = os.path.join(os.path.dirname(__file__), f'../g_eval/{mode}_scores')
-    if results_dir is None:
-        results_dir = os.path.join(os.path.dirname(__file__), f'../results/g_eval_{mode}_correlation')
-    os.makedirs(checkpoint_dir, exist_ok=True)
-    os.makedirs(results_dir, exist_ok=True)
+    checkpoint_dirs = {m: metric_dir(checkpoint_dir, '../g_eval/{metric}_scores', m) for m in fields}
+    results_dirs    = {m: metric_dir(results_dir, '../results/g_eval_{metric}_correlation', m) for m in fields}
+    for d in (*checkpoint_dirs.values(), *results_dirs.values()):
+        os.makedirs(d, exist_ok=True)
 
     data_filename    = f"model_outputs_with_scores_{dataset}.json"
     tag              = f"{model_name}_{dataset}"
-    checkpoint_fname = f"{tag}.json"
-    results_fname    = f"{tag}.txt"
+    checkpoint_fname = f"{tag}{scoring.tag}.json"
+    results_fname    = f"{tag}{scoring.tag}.txt"
 
-    checkpoint_path = os.path.join(checkpoint_dir, checkpoint_fname)
-    results_path    = os.path.join(results_dir, results_fname)
+    checkpoint_paths = {m: os.path.join(checkpoint_dirs[m], checkpoint_fname) for m in fields}
+    results_paths    = {m: os.path.join(results_dirs[m], results_fname) for m in fields}
 
     # --- load data ---
     data_path = os.path.join(data_dir, data_filename)
-    if not os.path.exists(data_path):
-        raise FileNotFoundError(f"Data file not found: {data_path}")
-    with open(data_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    df = pd.DataFrame(data)
-    if 'faithfulness_score' not in df.columns or 'completeness_score' not in df.columns:
+    store = load_dataset(data_path)
+    if 'faithfulness_score' not in store or 'completeness_score' not in store:
         raise KeyError("Missing required columns: 'faithfulness_score' or 'completeness_score'.")
-    human_scores = df['faithfulness_score'].tolist() if mode == "faithfulness" else df['completeness_score'].tolist()
+    df = store.frame()
+    human_scores = {m: df[f'{m}_score'].tolist() for m in fields}
 
-    # --- model config for prompt/schema/field ---
-    prompt_template = FAITH_PROMPT_TEMPLATE if mode == "faithfulness" else COMP_PROMPT_TEMPLATE
-    schema_class    = FaithfulnessScore if mode == "faithfulness" else CompletenessScore
-    field_name      = "faithfulness" if mode == "faithfulness" else "completeness"
+    total = len(df)
 
     # --- resume from checkpoint if exists ---
-    start_idx = 0
-    model_scores = []
-    if os.path.exists(checkpoint_path):
-        logging.info(f"Loading checkpoint from {checkpoint_path}")
-        with open(checkpoint_path, "r") as f:
-            ck = json.load(f)
-        start_idx     = ck.get("last_idx", -1) + 1
-        model_scores  = ck.get(f"{mode}_scores", [])
-        logging.info(f"Resuming from index {start_idx}")
-    else:
-        logging.info("No checkpoint found, starting fresh.")
+    stores = {m: open_detection_store(checkpoint_paths[m], m) for m in fields}
+    for m in fields:
+        logging.info(f"Resuming {m} with {len(stores[m].entries)} rows already scored")
 
-    # --- evaluation loop ---
-    total = len(df)
-    for idx in range(start_idx, total):
+    def record_many(scores_by_row: Dict[int, Dict[str, float]]):
+        # with "both", keep a metric that was already scored on resume
+        for m in fields:
+            stores[m].put_many({
+                str(idx): scores[m] for idx, scores in scores_by_row.items() if str(idx) not in stores[m]
+            })
+
+    def build_prompt(idx: int) -> Prompt:
         row = df.iloc[idx]
-        prompt = prompt_template.format(
-            table=row["serialized_table"],
-            question=row["question"],
-            gen_answer=row.get("model_output")
+        return format_scoring_prompt(prompt_template, row, row.get("model_output"))
+
+    def needs_scoring(idx: int) -> bool:
+        return any(str(idx) not in stores[m] for m in fields)
+
+    # --- offline batch ---
+    if batch_backend is not None:
+        requests = {
+            str(idx): build_structured_request(build_prompt(idx), schema_class, model=model_name, scoring=scoring)
+            for idx in range(total) if needs_scoring(idx)
+        }
+        batch_scores = run_cached_batch(
+            requests,
+            extract=batch_extractor(scoring),
+            parse=lambda raw: parse_scores(raw, schema_class, fields, scoring),
+            backend=batch_backend,
+            tag=f"g_eval_detection_{mode}{scoring.tag}_{tag}",
+            poll_interval=poll_interval
         )
-        logging.info(f"idx={idx} ({idx+1}/{total}) example_id={row.get('example_id')}, model={model_name}")
-        try:
-            score = call_openai_structured(prompt, schema_class, field_name, model=model_name)
-        except Exception:
-            logging.warning(f"  → call failed at idx={idx}, defaulting to 1.0")
-            score = 1.0
-        model_scores.append(score)
-        # checkpoint every 10 examples
-        if idx % 10 == 0:
-            with open(checkpoint_path, "w") as f:
-                json.dump({"last_idx": idx, f"{mode}_scores": model_scores}, f)
-            logging.info(f"Checkpoint saved at idx={idx}")
-    # --- final checkpoint ---
-    with open(checkpoint_path, "w") as f:
-        json.dump({"last_idx": total - 1, f"{mode}_scores": model_scores}, f)
+        record_many({int(i): scores for i, scores in batch_scores.items()})
+        logging.info(f"Merged {len(batch_scores)} batch scores into {', '.join(checkpoint_paths.values())}")
+
+    # --- evaluation loop ---
+    todo = [idx for idx in range(total) if needs_scoring(idx)]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {
+                pool.submit(score_row, df.iloc[idx], idx, total, mode, model_name, scoring): idx for idx in todo
+            }
+            try:
+                for n_done, fut in enumerate(as_completed(futures), start=1):
+                    record_many({futures[fut]: fut.result()})
+                    if n_done % 10 == 0:
+                        logging.info(f"{n_done}/{len(todo)} pending rows scored")
+            except BaseException:
+                # keep finished rows and drop queued ones so an interrupt stops promptly
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        for store in stores.values():
+            store.close()
     logging.info("Final checkpoint written")
     # --- correlation calculation ---
-    df = df.copy()
-    df["score_metric"] = model_scores
-    df["score_human"]  = human_scores
-    instance_r = calculate_correlation(df)
-    logging.info(f"Instance-level Pearson r for {mode}: {instance_r:.4f}")
+    correlations = {
+        m: write_correlation(df, human_scores[m], stores[m], m, results_paths[m], scoring) for m in fields
+    }
+    return correlations if mode == "both" else correlations[mode]
+
+
+def _load_scores(metric: str):
+    # Rows may finish out of order when workers > 1: the contiguous prefix is
+    # kept in `{metric}_scores`/`last_idx` and finished rows beyond it are kept
+    # in `pending_scores`, keyed by row index.
+    def load(ck: dict) -> Dict[str, float]:
+        last_idx = ck.get("last_idx", -1)
+        entries = {str(i): s for i, s in enumerate(ck.get(f"{metric}_scores", [])[:last_idx + 1])}
+        entries.update(ck.get("pending_scores", {}))
+        return entries
+    return load
+
+
+def _dump_scores(metric: str):
+    def dump(entries: Dict[str, float]) -> dict:
+        prefix = []
+        while str(len(prefix)) in entries:
+            prefix.append(entries[str(len(prefix))])
+        pending = {str(i): entries[str(i)] for i in sorted(map(int, entries)) if i >= len(prefix)}
+        ck = {"last_idx": len(prefix) - 1, f"{metric}_scores": prefix}
+        if pending:
+            ck["pending_scores"] = pending
+        return ck
+    return dump
+
+
+def open_detection_store(checkpoint_path: str, metric: str) -> CheckpointStore:
+    """
+    Checkpoint of one metric's row scores, keyed by row index as a string. The
+    JSON keeps the {"last_idx", "<metric>_scores", "pending_scores"} shape.
+    """
+    if os.path.exists(checkpoint_path):
+        logging.info(f"Loading checkpoint from {checkpoint_path}")
+    else:
+        logging.info(f"No {metric} checkpoint found, starting fresh.")
+    return CheckpointStore(checkpoint_path, load=_load_scores(metric), dump=_dump_scores(metric))
+
+
+def score_row(row: "pd.Series", idx: int, total: int, mode: str, model_name: str, scoring: Scoring = GREEDY) -> Dict[str, float]:
+    """
+    Score one model answer for every field of `mode`; a failed call scores 1.0.
+    """
+    prompt_template, schema_class, fields = SCORING_MODES[mode]
+    prompt = format_scoring_prompt(prompt_template, row, row.get("model_output"))
+    logging.info(f"idx={idx} ({idx+1}/{total}) example_id={row.get('example_id')}, model={model_name}")
+    try:
+        with llm_trace.scope(row=idx):
+            return call_openai_scores(prompt, schema_class, fields, model=model_name, scoring=scoring)
+    except Exception:
+        logging.warning(f"  → call failed at idx={idx}, defaulting to 1.0")
+        return {m: 1.0 for m in fields}
+
+
+def write_correlation(
+    df: "pd.DataFrame",
+    human_scores: List[float],
+    store: CheckpointStore,
+    metric: str,
+    results_path: str,
+    scoring: Scoring = GREEDY
+) -> float:
+    """
+    Instance-level Pearson r between the stored metric scores and the human
+    scores; rows without a score count as 1.0. Written to `results_path`, with
+    the scoring method unless it is greedy.
+    """
+    scored = df.copy()
+    scored["score_metric"] = [store.get(str(idx), 1.0) for idx in range(len(df))]
+    scored["score_human"]  = human_scores
+    instance_r = calculate_correlation(scored)
+    logging.info(f"Instance-level Pearson r for {metric}: {instance_r:.4f}")
+    from common.stats import correlation_report_lines
     with open(results_path, "w") as f:
         f.write(f"Instance-level Pearson r: {instance_r:.4f}\n")
+        if scoring.method != "greedy":
+            f.write(f"Scoring: {scoring.description}\n")
+        f.write("".join(line + "\n" for line in correlation_report_lines(scored["score_metric"], scored["score_human"], scored["example_id"])))
     return instance_r
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
     parser = argparse.ArgumentParser(description="Run G-Eval detection pipeline.")
     parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
     parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
-    parser.add_argument('--mode', type=str, default='faithfulness', choices=['faithfulness', 'completeness'], help="Evaluation mode")
-    args = parser.parse_args()
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--mode', type=str, default='faithfulness', choices=list(SCORING_MODES), help="Evaluation mode; 'both' scores faithfulness and completeness in one request")
+    parser.add_argument('--workers', type=int, default=1, help="Number of rows scored concurrently")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--batch', action='store_true', help="Submit pending rows through the batch API before any synchronous calls")
+    parser.add_argument('--batch_backend', type=str, default='openai', choices=['openai', 'local'], help="Batch backend used with --batch")
+    parser.add_argument('--poll_interval', type=float, default=60.0, help="Seconds between batch status polls")
+    parser.add_argument('--scoring', type=str, default='greedy', choices=list(SCORING_METHODS), help="Score read-out: greedy integer, mean of sampled scores, or logprob-weighted expected score")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="Samples per row with --scoring samples (one request with n samples)")
+    parser.add_argument('--sample_temperature', type=float, default=DEFAULT_SAMPLE_TEMPERATURE, help="Sampling temperature with --scoring samples")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("g_eval.detection")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.model, args.rpm, args.tpm)
+
+    print(f"Running detection for dataset={args.dataset}, model={args.model}, mode={args.mode}, scoring={args.scoring}")
+    try:
+        evaluate(
+            args.dataset, model_name=args.model, mode=args.mode, workers=args.workers,
+            batch_backend=get_backend(args.batch_backend) if args.batch else None,
+            poll_interval=args.poll_interval,
+            scoring=Scoring(args.scoring, args.samples, args.sample_temperature)
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; scored rows are checkpointed, rerun with a higher --max_cost to continue")
+        sys.exit(1)
 
-    print(f"Running detection for dataset={args.dataset}, model={args.model}, mode={args.mode}")
-    evaluate(args.dataset, model_name=args.model, mode=args.mode) 
\ No newline at end of file
+
+if __name__ == "__main__":
+    main()
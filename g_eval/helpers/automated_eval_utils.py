@@ -1,6 +1,7 @@
 import pathlib
 import json
 from typing import List, Dict
+from common.dataset_store import load_dataset
 
 DATA_DIR = pathlib.Path("data/outputs")
 CKPT_DIR_FAITH = pathlib.Path("g_eval/faithfulness_scores")
@@ -18,33 +19,49 @@ RESULTS_DIR_NORMAL_COMP = pathlib.Path("results/geval_automated_eval/normal/comp
 RESULTS_DIR_ORACLE_FAITH = pathlib.Path("results/geval_automated_eval/oracle/faithfulness")
 RESULTS_DIR_ORACLE_COMP = pathlib.Path("results/geval_automated_eval/oracle/completeness")
 
-for p in (
-    AE_CKPT_DIR_NORMAL_FAITH, AE_CKPT_DIR_NORMAL_COMP,
-    AE_CKPT_DIR_ORACLE_FAITH, AE_CKPT_DIR_ORACLE_COMP,
-    RESULTS_DIR_NORMAL_FAITH, RESULTS_DIR_NORMAL_COMP,
-    RESULTS_DIR_ORACLE_FAITH, RESULTS_DIR_ORACLE_COMP
-):
-    p.mkdir(parents=True, exist_ok=True)
+# the directories are created on first write (checkpoint store, write_summary)
 
-def load_coarse_scores(dataset: str, model: str, mode: str = "faithfulness") -> list:
+def load_coarse_scores(dataset: str, model: str, mode: str = "faithfulness", scoring_tag: str = "") -> list:
+    """
+    Detection scores of one metric; `scoring_tag` (Scoring.tag) picks the
+    checkpoint of a non-greedy scoring method.
+    """
     assert mode in {"faithfulness", "completeness"}, "Invalid mode"
     ckpt_dir = CKPT_DIR_FAITH if mode == "faithfulness" else CKPT_DIR_COMP
-    ckpt_file = ckpt_dir / f"{model}_{dataset}.json"
+    ckpt_file = ckpt_dir / f"{model}_{dataset}{scoring_tag}.json"
     with ckpt_file.open() as f:
         ck = json.load(f)
+    return checkpoint_scores(ck, mode, ckpt_file)
+
+def checkpoint_scores(ck: Dict, mode: str, ckpt_file: pathlib.Path) -> list:
+    """
+    Row scores of a detection checkpoint: the contiguous `{mode}_scores`
+    prefix followed by the rows concurrent workers finished out of order
+    (`pending_scores`). Raises if a row in between has no score yet.
+    """
     key = f"{mode}_scores"
-    if key not in ck:
+    scores = ck.get(key)
+    if scores is None and mode == "faithfulness":
+        scores = ck.get("faith_scores")
+    if scores is None:
         raise KeyError(f"'{key}' not found in {ckpt_file}")
-    return ck[key]
+    scores = list(scores)
+    pending = ck.get("pending_scores", {})
+    for idx in range(len(scores), max(map(int, pending), default=-1) + 1):
+        if str(idx) not in pending:
+            raise ValueError(f"{ckpt_file} is incomplete: row {idx} has no {mode} score; finish detection first")
+        scores.append(pending[str(idx)])
+    return scores
 
 def load_dataset_rows(dataset: str) -> list:
     file_path = DATA_DIR / f"model_outputs_with_scores_{dataset}.json"
-    return json.load(file_path.open())
+    return load_dataset(file_path).records()
 
 def load_oracle_coarse_scores(dataset: str, mode: str = "faithfulness") -> list:
     assert mode in {"faithfulness", "completeness"}, "Invalid mode"
     file_path = DATA_DIR / f"model_outputs_with_scores_{dataset}.json"
-    with file_path.open() as f:
-        entries = json.load(f)
+    store = load_dataset(file_path)
     score_key = f"{mode}_score"
-    return [entry[score_key] for entry in entries if score_key in entry] 
\ No newline at end of file
+    if score_key not in store:
+        return []
+    return [entry[score_key] for entry in store.records([score_key]) if score_key in entry] 
\ No newline at end of file
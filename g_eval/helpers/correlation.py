@@ -2,19 +2,15 @@
 Correlation calculation utility for G-Eval detection.
 """
 
-import pandas as pd
-import numpy as np
-from scipy.stats import pearsonr
+from typing import TYPE_CHECKING
 
-def calculate_correlation(df: pd.DataFrame) -> float:
+if TYPE_CHECKING:
+    import pandas as pd
+
+def calculate_correlation(df: "pd.DataFrame", method: str = "pearson") -> float:
     """
-    Compute the "instance-level" Pearson correlation as in the LFTQA-Eval paper.
+    Compute the "instance-level" Pearson correlation as in the LFTQA-Eval paper
+    (or Spearman/Kendall with `method`), vectorized over example_ids.
     """
-    taus = []
-    for example_id, group in df.groupby("example_id"):
-        if len(group) < 2:
-            continue
-        r, _ = pearsonr(group["score_metric"], group["score_human"])
-        if not np.isnan(r):
-            taus.append(r)
-    return float(np.mean(taus)) if taus else float("nan") 
\ No newline at end of file
+    from common.stats import instance_correlation
+    return instance_correlation(df["score_metric"], df["score_human"], df["example_id"], method)
@@ -1,40 +1,63 @@
 import logging
 import json
-from typing import Dict
+from typing import Dict, Optional
 from pathlib import Path
+from common import prompt_layout
+from common.table_serialization import serialize_table
+from .openai_utils import GREEDY, Scoring
 from .prompts import (
     MITIGATE_BOTH_PROMPT_TEMPLATE,
     MITIGATE_FAITH_ONLY_PROMPT_TEMPLATE,
     MITIGATE_COMP_ONLY_PROMPT_TEMPLATE,
 )
 
-def build_mitigation_prompt(example: Dict) -> str:
+# rows scored below this are mitigated; greedy and human scores (which may be
+# fractional averages) keep the original "below 5" rule
+MITIGATION_THRESHOLD = 5.0
+# expected (sampled or logprob-weighted) scores are mitigated when closer to 4
+# than to 5: an answer the judge rates 5 with high probability stays as is
+EXPECTED_SCORE_THRESHOLD = 4.5
+
+
+def needs_mitigation(score: float, scoring: Scoring = GREEDY) -> bool:
+    """
+    Whether a score from `scoring` (GREEDY for human scores) calls for mitigation.
+    """
+    threshold = MITIGATION_THRESHOLD if scoring.method == "greedy" else EXPECTED_SCORE_THRESHOLD
+    return score < threshold
+
+
+def build_mitigation_prompt(example: Dict) -> prompt_layout.Prompt:
     """
-    Given an example from load_examples(), return the appropriate mitigation prompt string.
+    Given an example from load_examples(), return the appropriate mitigation prompt.
     """
     f = example["faithfulness_score"]
     c = example["completeness_score"]
-    if f < 5 and c < 5:
+    scoring = example.get("scoring", GREEDY)
+    if needs_mitigation(f, scoring) and needs_mitigation(c, scoring):
         template = MITIGATE_BOTH_PROMPT_TEMPLATE
-        return template.format(
-            table=example["table"],
+        return prompt_layout.render(
+            template, "### Table\n", "### Original Answer\n",
+            table=serialize_table(example["table"]),
             question=example["question"],
             model_answer=example["full_answer"],
             faith_score=f,
             comp_score=c
         )
-    elif f < 5:
+    elif needs_mitigation(f, scoring):
         template = MITIGATE_FAITH_ONLY_PROMPT_TEMPLATE
-        return template.format(
-            table=example["table"],
+        return prompt_layout.render(
+            template, "### Table\n", "### Original Answer\n",
+            table=serialize_table(example["table"]),
             question=example["question"],
             model_answer=example["full_answer"],
             faith_score=f
         )
-    elif c < 5:
+    elif needs_mitigation(c, scoring):
         template = MITIGATE_COMP_ONLY_PROMPT_TEMPLATE
-        return template.format(
-            table=example["table"],
+        return prompt_layout.render(
+            template, "### Table\n", "### Original Answer\n",
+            table=serialize_table(example["table"]),
             question=example["question"],
             model_answer=example["full_answer"],
             comp_score=c
@@ -42,12 +65,27 @@ def build_mitigation_prompt(example: Dict) -> str:
     else:
         raise ValueError("This example does not need mitigation.")
 
-def processed_ids(out_dir: Path, dataset: str, model: str) -> set:
+def mitigation_tag(model: str, mitigation_model: Optional[str] = None) -> str:
+    """
+    Suffix for the mitigation outputs and their automated-eval files when the
+    revisions come from another model than the detection run's.
+    """
+    return f"_by_{mitigation_model}" if mitigation_model and mitigation_model != model else ""
+
+def mitigation_path(out_dir: Path, dataset: str, model: str, scoring: Scoring = GREEDY, mitigation_model: Optional[str] = None) -> Path:
+    """
+    {model}_{dataset}.jsonl in the output folder, with the scoring tag of the
+    detection scores that picked the rows (GREEDY for oracle mitigation) and
+    the mitigation_tag of the model that wrote the revisions.
+    """
+    return out_dir / f"{model}_{dataset}{scoring.tag}{mitigation_tag(model, mitigation_model)}.jsonl"
+
+def processed_ids(out_dir: Path, dataset: str, model: str, scoring: Scoring = GREEDY, mitigation_model: Optional[str] = None) -> set:
     """
-    Reads {model}_{dataset}.jsonl from the output folder and returns
+    Reads the mitigation outputs (see mitigation_path) and returns
     the set of original_idx values that have already been mitigated.
     """
-    out_path = out_dir / f"{model}_{dataset}.jsonl"
+    out_path = mitigation_path(out_dir, dataset, model, scoring, mitigation_model)
     if not out_path.exists():
         return set()
     done = set()
@@ -59,4 +97,21 @@ def processed_ids(out_dir: Path, dataset: str, model: str) -> set:
             except Exception:
                 continue
     logging.info(f"[{dataset}] Found {len(done)} examples already mitigated.")
-    return done 
\ No newline at end of file
+    return done 
+
+def revised_answers(out_dir: Path, dataset: str, model: str, scoring: Scoring = GREEDY, mitigation_model: Optional[str] = None) -> Dict[int, str]:
+    """
+    Like processed_ids, but maps each already mitigated original_idx to its revised answer.
+    """
+    out_path = mitigation_path(out_dir, dataset, model, scoring, mitigation_model)
+    if not out_path.exists():
+        return {}
+    revised = {}
+    with out_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                obj = json.loads(line)
+                revised[obj["original_idx"]] = obj["revised_answer"]
+            except Exception:
+                continue
+    return revised
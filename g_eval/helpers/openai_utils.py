@@ -1,80 +1,257 @@
 """
 OpenAI structured output call utility for G-Eval detection.
+Requests go to the backend selected by LLM_BACKEND (see common/llm_backend.py).
+
+A score is read from the model in one of three ways (`Scoring.method`):
+
+    greedy    one response at temperature 0; the score is the integer it gives
+    samples   `samples` responses from a single request (n=samples) at
+              `temperature`, averaged, as in the original G-Eval
+    logprobs  one response at temperature 0 with the top token logprobs; the
+              score is the probability-weighted mean over the tokens 1–5 at
+              the score's position (renormalized over those tokens)
+
+The last two give fine-grained scores with far fewer ties than the greedy
+integers. A sampled request is billed the prompt once and the completion
+tokens of every sample; a logprobs request costs the same as a greedy one.
 """
 
+import json
 import logging
-import time
-from openai import OpenAI
-from typing import Type, Optional
-from pydantic import BaseModel
-import os
-from dotenv import load_dotenv
-from g_eval.helpers.schemas import AnswerRewrite
-
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    logging.error("OPENAI_API_KEY not set in environment")
-    raise ValueError("OPENAI_API_KEY not set in environment")
-client = OpenAI(api_key=api_key)
+import math
+import re
+from typing import TYPE_CHECKING, Callable, Type, NamedTuple, Optional, Dict, List, Union
+from common import llm_cache, prompt_layout, retry
+from common.llm_backend import Completion, completion_text, get_backend, cached
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+SCORING_METHODS = ("greedy", "samples", "logprobs")
+DEFAULT_SCORING_METHOD = "greedy"
+DEFAULT_SAMPLES = 20
+DEFAULT_SAMPLE_TEMPERATURE = 1.0
+TOP_LOGPROBS = 5
+SCORE_TOKENS = {str(score): score for score in range(1, 6)}
+# how each method's response is kept in the LLM response cache (see llm_backend.completion_text)
+_CACHE_FIELDS = {"greedy": "content", "samples": "samples", "logprobs": "logprobs"}
+
+
+class Scoring(NamedTuple):
+    method: str = DEFAULT_SCORING_METHOD
+    samples: int = DEFAULT_SAMPLES                    # n, for "samples"
+    temperature: float = DEFAULT_SAMPLE_TEMPERATURE   # sampling temperature, for "samples"
+
+    @property
+    def label(self) -> str:
+        """
+        LLM trace label, so the stage table separates the methods' costs.
+        """
+        if self.method == "samples":
+            return f"G-Eval scoring ({self.samples} samples)"
+        if self.method == "logprobs":
+            return "G-Eval scoring (logprobs)"
+        return "G-Eval scoring"
+
+    @property
+    def description(self) -> str:
+        """
+        The method and its settings, as written to the results files.
+        """
+        if self.method == "samples":
+            return f"samples (n={self.samples}, temperature={self.temperature:g})"
+        if self.method == "logprobs":
+            return f"logprobs (top {TOP_LOGPROBS})"
+        return "greedy"
+
+    @property
+    def tag(self) -> str:
+        """
+        Suffix for checkpoint, results, mitigation output and batch names, so
+        scores of one method are never resumed, mitigated or reported as
+        another's; empty for greedy scoring, which keeps the existing names.
+        """
+        if self.method == "samples":
+            if self.temperature != DEFAULT_SAMPLE_TEMPERATURE:
+                return f"_samples{self.samples}_t{self.temperature:g}"
+            return f"_samples{self.samples}"
+        if self.method == "logprobs":
+            return "_logprobs"
+        return ""
+
+
+GREEDY = Scoring()
+
+
+def weighted_score(logprobs: List[Dict], field: str, fallback: float) -> float:
+    """
+    Probability-weighted mean of the 1–5 tokens where the value of `field`
+    is generated. Falls back to the greedy score when that position (a lone
+    digit token after `"field":`) is not found.
+    """
+    text = ""
+    for entry in logprobs:
+        token = entry["token"]
+        if token.strip() in SCORE_TOKENS and re.search(rf'"{re.escape(field)}"\s*:\s*$', text):
+            probs: Dict[int, float] = {}
+            for alt, logprob in entry["top_logprobs"].items():
+                if alt.strip() in SCORE_TOKENS:
+                    score = SCORE_TOKENS[alt.strip()]
+                    probs[score] = probs.get(score, 0.0) + math.exp(logprob)
+            total = sum(probs.values())
+            if total > 0:
+                return round(sum(score * p for score, p in probs.items()) / total, 4)
+            break
+        text += token
+    return fallback
+
+
+def parse_scores(text: str, schema: Type["BaseModel"], fields: List[str], scoring: Scoring = GREEDY) -> Dict[str, float]:
+    """
+    Scores for `fields` from a response in the form the response cache keeps
+    for `scoring`. Samples that do not fit the schema are left out.
+    """
+    if scoring.method == "samples":
+        parsed = []
+        for content in json.loads(text):
+            try:
+                parsed.append(schema.model_validate_json(content))
+            except ValueError:
+                continue
+        if not parsed:
+            raise ValueError("no sample matched the score schema")
+        return {field: round(sum(getattr(p, field) for p in parsed) / len(parsed), 4) for field in fields}
+    if scoring.method == "logprobs":
+        data = json.loads(text)
+        greedy = schema.model_validate_json(data["content"])
+        return {field: weighted_score(data["logprobs"], field, getattr(greedy, field)) for field in fields}
+    parsed = schema.model_validate_json(text)
+    return {field: getattr(parsed, field) for field in fields}
+
+
+def batch_extractor(scoring: Scoring = GREEDY) -> Callable[[Dict], str]:
+    """
+    Batch-response extractor matching `parse_scores` for `scoring`.
+    """
+    from common.batch import logprobs_content, message_content, sampled_content
+    return {"greedy": message_content, "samples": sampled_content, "logprobs": logprobs_content}[scoring.method]
+
+
+def _score_response(request: Dict, scoring: Scoring) -> str:
+    backend = get_backend()
+    if scoring.method == "samples":
+        samples = backend.sampled(request)
+        return completion_text(Completion(samples[0], None, samples), "samples")
+    if scoring.method == "logprobs":
+        return completion_text(backend.with_logprobs(request), "logprobs")
+    return backend.structured(request)
+
+def schema_response_format(schema: Type["BaseModel"]) -> Dict:
+    """
+    Strict `json_schema` response_format for a flat pydantic schema: every
+    property is required and no others are allowed, as strict mode demands.
+    """
+    json_schema = schema.model_json_schema()
+    json_schema["required"] = list(json_schema["properties"])
+    json_schema["additionalProperties"] = False
+    return {
+        "type": "json_schema",
+        "json_schema": {"schema": json_schema, "name": schema.__name__, "strict": True}
+    }
+
+def build_structured_request(
+    prompt: Union[str, prompt_layout.Prompt],
+    schema: Type["BaseModel"],
+    model: str = "gpt-4o",
+    temperature: float = 0.0,
+    scoring: Scoring = GREEDY
+) -> Dict:
+    """
+    Chat-completion request body for a structured 1–5 score. With sampled
+    scoring all samples come from this one request (n > 1).
+    """
+    request = {
+        "model": model,
+        "messages": prompt_layout.messages("You are a helpful evaluator.", prompt),
+        "response_format": schema_response_format(schema),
+        "temperature": temperature
+    }
+    if scoring.method == "samples":
+        request["n"] = scoring.samples
+        request["temperature"] = scoring.temperature
+    elif scoring.method == "logprobs":
+        request["logprobs"] = True
+        request["top_logprobs"] = TOP_LOGPROBS
+    return request
+
+def build_mitigation_request(prompt: Union[str, prompt_layout.Prompt], model: str = "gpt-4o", temperature: float = 0.0) -> Dict:
+    """
+    Chat-completion request body for a JSON answer rewrite.
+    """
+    return {
+        "model": model,
+        "messages": prompt_layout.messages("You are a helpful assistant.", prompt),
+        "temperature": temperature,
+        "response_format": {"type": "json_object"}
+    }
 
 def call_openai_structured(
-    prompt: str,
-    schema: Type[BaseModel],
+    prompt: Union[str, prompt_layout.Prompt],
+    schema: Type["BaseModel"],
     field: str,
     model: str = "gpt-4o",
     max_retries: int = 5,
-    temperature: float = 0.0
-) -> int:
+    temperature: float = 0.0,
+    scoring: Scoring = GREEDY
+) -> float:
     """
     Return a 1–5 score using OpenAI structured output mode.
     """
-    messages = [
-        {"role": "system", "content": "You are a helpful evaluator."},
-        {"role": "user", "content": prompt}
-    ]
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = client.beta.chat.completions.parse(
-                model=model,
-                messages=messages,
-                response_format=schema,
-                temperature=temperature
-            )
-            score = getattr(response.choices[0].message.parsed, field)
-            print(f"Response: {score} for prompt: {prompt}")
-            return score
-        except Exception as e:
-            wait = 2 ** attempt
-            logging.warning(
-                f"Attempt {attempt}/{max_retries} failed: {e}. Retrying in {wait}s…"
-            )
-            time.sleep(wait)
-    raise RuntimeError(f"OpenAI structured call failed after {max_retries} retries.")
-
-def call_openai_mitigation(prompt: str, model: str = "gpt-4o", temperature: float = 0.0, max_retries: int = 20) -> Optional[str]:
+    return call_openai_scores(prompt, schema, [field], model=model, max_retries=max_retries, temperature=temperature, scoring=scoring)[field]
+
+def call_openai_scores(
+    prompt: Union[str, prompt_layout.Prompt],
+    schema: Type["BaseModel"],
+    fields: List[str],
+    model: str = "gpt-4o",
+    max_retries: int = 5,
+    temperature: float = 0.0,
+    scoring: Scoring = GREEDY
+) -> Dict[str, float]:
+    """
+    Return the 1–5 scores for `fields` from a single structured-output request:
+    integers with greedy scoring, expected scores with sampled or logprob scoring.
+    """
+    request = build_structured_request(prompt, schema, model=model, temperature=temperature, scoring=scoring)
+    cache_key, hit = cached(request, field=_CACHE_FIELDS[scoring.method], label=scoring.label)
+    if hit is not None:
+        return parse_scores(hit, schema, fields, scoring)
+    def attempt():
+        content = _score_response(request, scoring)
+        return parse_scores(content, schema, fields, scoring), content
+    try:
+        scores, content = retry.call_with_retry(attempt, model, max_attempts=max_retries, request=request, label=scoring.label)
+    except Exception as e:
+        raise RuntimeError(f"OpenAI structured call failed after {max_retries} retries.") from e
+    logging.debug(f"G-Eval scores {scores}")
+    llm_cache.store(cache_key, content)
+    return scores
+
+def call_openai_mitigation(prompt: Union[str, prompt_layout.Prompt], model: str = "gpt-4o", temperature: float = 0.0, max_retries: int = 20) -> Optional[str]:
     """
     Calls OpenAI for mitigation and returns the revised answer string, or None if failed.
     """
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant."},
-        {"role": "user", "content": prompt}
-    ]
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content
-            parsed = AnswerRewrite.model_validate_json(content)
-            return parsed.answer.strip()
-        except Exception as e:
-            wait = 2 ** attempt
-            logging.warning(f"[Retry {attempt}/{max_retries}] OpenAI error: {e} — waiting {wait}s")
-            time.sleep(wait)
-    return None 
\ No newline at end of file
+    from g_eval.helpers.schemas import AnswerRewrite
+    request = build_mitigation_request(prompt, model=model, temperature=temperature)
+    cache_key, hit = cached(request, label="mitigation")
+    if hit is not None:
+        return AnswerRewrite.model_validate_json(hit).answer.strip()
+    def attempt():
+        content = get_backend().json_rewrite(request)
+        return AnswerRewrite.model_validate_json(content), content
+    try:
+        parsed, content = retry.call_with_retry(attempt, model, max_attempts=max_retries, request=request, label="mitigation")
+    except Exception:
+        return None
+    llm_cache.store(cache_key, content)
+    return parsed.answer.strip()
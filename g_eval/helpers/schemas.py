@@ -10,5 +10,8 @@ class FaithfulnessScore(BaseModel):
 class CompletenessScore(BaseModel):
     completeness: int  # integer 1‑5 
 
+class FaithfulnessCompletenessScore(FaithfulnessScore, CompletenessScore):
+    pass  # both integers 1‑5, scored in one response
+
 class AnswerRewrite(BaseModel):
     answer: str 
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Prompt and schema for each G-Eval scoring mode.
+"""
+
+from typing import Iterator, List, Mapping, Tuple, Type
+
+from g_eval.helpers.prompts import FAITH_PROMPT_TEMPLATE, COMP_PROMPT_TEMPLATE, FAITH_COMP_PROMPT_TEMPLATE
+from common import prompt_layout
+from common.table_pruning import render_for_query
+
+
+class _ScoringModes(Mapping):
+    """
+    mode -> (prompt template, response schema, score fields). Each field is also
+    the name of the per-metric mode whose checkpoints and results it fills.
+    The pydantic schemas are imported on the first lookup, so listing or
+    checking modes (e.g. for argparse choices) does not import pydantic.
+    """
+    _modes = {
+        "faithfulness": (FAITH_PROMPT_TEMPLATE, "FaithfulnessScore", ["faithfulness"]),
+        "completeness": (COMP_PROMPT_TEMPLATE, "CompletenessScore", ["completeness"]),
+        "both": (FAITH_COMP_PROMPT_TEMPLATE, "FaithfulnessCompletenessScore", ["faithfulness", "completeness"]),
+    }
+
+    def __getitem__(self, mode: str) -> Tuple[str, Type, List[str]]:
+        from g_eval.helpers import schemas
+        template, schema, fields = self._modes[mode]
+        return template, getattr(schemas, schema), fields
+
+    def __contains__(self, mode: object) -> bool:
+        return mode in self._modes
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._modes)
+
+    def __len__(self) -> int:
+        return len(self._modes)
+
+
+SCORING_MODES = _ScoringModes()
+
+
+def format_scoring_prompt(template: str, row: Mapping, answer: str) -> prompt_layout.Prompt:
+    """
+    Fill a scoring template for `answer` to the question of a dataset row.
+    The table and question form the shared part of the prompt, the answer the rest.
+    """
+    return prompt_layout.render(
+        template, "Table:\n", "Answer:\n",
+        table=render_for_query(row["serialized_table"], f"{row['question']} {answer}"),
+        question=row["question"],
+        gen_answer=answer
+    )
@@ -3,27 +3,27 @@ G-Eval mitigation logic: modular, using helpers for prompts, schemas, OpenAI cal
 """
 
 import os
+import sys
 import json
 import logging
 from pathlib import Path
 from typing import List, Dict, Optional
-from dotenv import load_dotenv
 
-from g_eval.helpers.mitigation_utils import build_mitigation_prompt, processed_ids
-from g_eval.helpers.schemas import AnswerRewrite
-from g_eval.helpers.openai_utils import call_openai_mitigation
+from g_eval.helpers.automated_eval_utils import checkpoint_scores
+from g_eval.helpers.mitigation_utils import build_mitigation_prompt, mitigation_path, needs_mitigation, processed_ids
+from g_eval.helpers.openai_utils import (
+    SCORING_METHODS, DEFAULT_SAMPLES, DEFAULT_SAMPLE_TEMPERATURE, GREEDY, Scoring, call_openai_mitigation
+)
+from common import rate_limit, llm_backend, llm_trace
+from common.dataset_store import load_dataset
+from common.table_serialization import serialize_table
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
-# Load environment variables
-load_dotenv()
-
 # Output directories
 MITIGATION_BASE_DIR = Path(__file__).parent / "mitigation_outputs"
 NORMAL_OUT_DIR = MITIGATION_BASE_DIR / "normal"
 ORACLE_OUT_DIR = MITIGATION_BASE_DIR / "oracle"
-NORMAL_OUT_DIR.mkdir(parents=True, exist_ok=True)
-ORACLE_OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # Data and checkpoint directories
 DATA_DIR = Path(__file__).parent.parent / "data" / "outputs"
@@ -31,91 +31,153 @@ FAITH_CKPT_DIR = Path(__file__).parent / "faithfulness_scores"
 COMP_CKPT_DIR = Path(__file__).parent / "completeness_scores"
 
 
-def load_examples(dataset: str, model: str, kind: str = "normal") -> List[Dict]:
+def load_examples(dataset: str, model: str, kind: str = "normal", scoring: Scoring = GREEDY) -> List[Dict]:
     """
-    Load examples needing mitigation (at least one score < 5.0).
+    Load examples needing mitigation (at least one score below 5, or below
+    4.5 for expected scores). Normal mitigation reads the detection
+    checkpoints written with `scoring`; oracle mitigation reads the human scores.
     """
     assert kind in {"normal", "oracle"}, "kind must be 'normal' or 'oracle'"
     data_file = DATA_DIR / f"model_outputs_with_scores_{dataset}.json"
-    with data_file.open() as f:
-        raw = json.load(f)
+    store = load_dataset(data_file)
+    raw = store.records()
     if kind == "normal":
-        ckpt_file_faith = FAITH_CKPT_DIR / f"{model}_{dataset}.json"
-        ckpt_file_comp  = COMP_CKPT_DIR  / f"{model}_{dataset}.json"
+        ckpt_file_faith = FAITH_CKPT_DIR / f"{model}_{dataset}{scoring.tag}.json"
+        ckpt_file_comp  = COMP_CKPT_DIR  / f"{model}_{dataset}{scoring.tag}.json"
         if not ckpt_file_faith.exists() or not ckpt_file_comp.exists():
-            raise FileNotFoundError("Checkpoint files for faithfulness or completeness not found.")
+            raise FileNotFoundError(f"Checkpoint files for faithfulness or completeness not found ({scoring.description} scoring).")
         with ckpt_file_faith.open() as f1, ckpt_file_comp.open() as f2:
             faith_ckpt = json.load(f1)
             comp_ckpt  = json.load(f2)
-        faith_scores = faith_ckpt.get("faithfulness_scores") or faith_ckpt.get("faith_scores")
-        comp_scores  = comp_ckpt.get("completeness_scores") or comp_ckpt.get("completeness_scores")
-        if faith_scores is None or comp_scores is None:
-            raise KeyError("One of the score keys is missing in checkpoint files.")
+        faith_scores = checkpoint_scores(faith_ckpt, "faithfulness", ckpt_file_faith)
+        comp_scores  = checkpoint_scores(comp_ckpt, "completeness", ckpt_file_comp)
         if len(faith_scores) != len(comp_scores) or len(faith_scores) != len(raw):
             raise ValueError("Length mismatch among scores or with data entries.")
     else:
-        faith_scores = [ex["faithfulness_score"] for ex in raw]
-        comp_scores  = [ex["completeness_score"] for ex in raw]
+        faith_scores = store.tolist("faithfulness_score")
+        comp_scores  = store.tolist("completeness_score")
+        scoring = GREEDY
     examples: List[Dict] = []
     for idx, (ex, fscore, cscore) in enumerate(zip(raw, faith_scores, comp_scores)):
-        if fscore >= 5.0 and cscore >= 5.0:
-            continue
-        examples.append({
-            "idx"                : idx,
-            "question"           : ex["question"],
-            "table"              : ex["serialized_table"],
-            "full_answer"        : ex["model_output"],
-            "faithfulness_score" : fscore,
-            "completeness_score" : cscore
-        })
+        example = make_example(idx, ex, fscore, cscore, scoring)
+        if example is not None:
+            examples.append(example)
     logging.info(f"{dataset.upper()} [{kind}] → {len(examples)} examples need mitigation.")
     return examples
 
 
-def run_mitigation(dataset: str, kind: str, model: str = "gpt-4o-mini", max_api_retries: int = 20):
+def make_example(idx: int, ex: Dict, fscore: float, cscore: float, scoring: Scoring = GREEDY) -> Optional[Dict]:
+    """
+    Build the mitigation example for one row, or None when neither score needs
+    mitigation (see mitigation_utils.needs_mitigation). `scoring` is the method
+    the scores were read with.
+    """
+    if not needs_mitigation(fscore, scoring) and not needs_mitigation(cscore, scoring):
+        return None
+    return {
+        "idx"                : idx,
+        "question"           : ex["question"],
+        "table"              : serialize_table(ex["serialized_table"]),
+        "full_answer"        : ex["model_output"],
+        "faithfulness_score" : fscore,
+        "completeness_score" : cscore,
+        "scoring"            : scoring
+    }
+
+
+def mitigate_example(ex: Dict, model: str, max_api_retries: int = 20) -> str:
+    """
+    Rewrite one example's answer; falls back to the original answer on failure.
+    """
+    prompt = build_mitigation_prompt(ex)
+    with llm_trace.scope(row=ex["idx"]):
+        revised_answer = call_openai_mitigation(
+            prompt,
+            model=model,
+            temperature=0.0,
+            max_retries=max_api_retries
+        )
+    if revised_answer is None:
+        logging.error(f"[idx {ex['idx']}] mitigation failed – keeping original.")
+        revised_answer = ex["full_answer"]
+    return revised_answer
+
+
+def write_mitigation(outf, idx: int, revised_answer: str):
+    json.dump(
+        {
+            "original_idx": idx,
+            "revised_answer": revised_answer
+        },
+        outf,
+        ensure_ascii=False
+    )
+    outf.write("\n")
+    outf.flush()
+
+
+def run_mitigation(
+    dataset: str,
+    kind: str,
+    model: str = "gpt-4o-mini",
+    max_api_retries: int = 20,
+    mitigation_model: Optional[str] = None,
+    scoring: Scoring = GREEDY
+):
     """
     Runs coarse-level mitigation for all examples in a dataset+model+kind combo
-    where either faithfulness or completeness score is < 5.
+    where either faithfulness or completeness score needs mitigation.
+    `mitigation_model` (default: `model`) is the model that writes the revisions.
+    Normal mitigation starts from the detection scores of `scoring`; the output
+    file is tagged with it and with the mitigation model (see mitigation_path).
     """
     assert kind in {"normal", "oracle"}, "kind must be 'normal' or 'oracle'"
     out_dir = NORMAL_OUT_DIR if kind == "normal" else ORACLE_OUT_DIR
-    out_path = out_dir / f"{model}_{dataset}.jsonl"
-    examples = load_examples(dataset, model, kind=kind)
-    done_ids = processed_ids(out_dir, dataset, model)
+    if kind == "oracle":
+        scoring = GREEDY
+    out_path = mitigation_path(out_dir, dataset, model, scoring, mitigation_model)
+    examples = load_examples(dataset, model, kind=kind, scoring=scoring)
+    done_ids = processed_ids(out_dir, dataset, model, scoring, mitigation_model)
+    out_dir.mkdir(parents=True, exist_ok=True)
     with out_path.open("a", encoding="utf-8") as outf:
         for ex in examples:
             if ex["idx"] in done_ids:
                 continue
             print(f"[{dataset}] mitigating idx {ex['idx']}  "
                   f"({len(done_ids)+1}/{len(examples)})")
-            prompt = build_mitigation_prompt(ex)
-            revised_answer = call_openai_mitigation(
-                prompt,
-                model=model,
-                temperature=0.0,
-                max_retries=max_api_retries
-            )
-            if revised_answer is None:
-                logging.error(f"[{dataset}] mitigation failed – keeping original.")
-                revised_answer = ex["full_answer"]
-            json.dump(
-                {
-                    "original_idx": ex["idx"],
-                    "revised_answer": revised_answer
-                },
-                outf,
-                ensure_ascii=False
-            )
-            outf.write("\n")
-            outf.flush()
+            revised_answer = mitigate_example(ex, mitigation_model or model, max_api_retries=max_api_retries)
+            write_mitigation(outf, ex["idx"], revised_answer)
             done_ids.add(ex["idx"])
     print(f"\nMitigation finished – total processed: {len(done_ids)}")
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
     import argparse
     parser = argparse.ArgumentParser(description="Run G-Eval mitigation pipeline.")
     parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
     parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
+    parser.add_argument('--mitigation_model', type=str, default=None, help="Model that rewrites the answers (default: --model)")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
     parser.add_argument('--kind', type=str, default='normal', choices=['normal', 'oracle'], help="Mitigation kind")
-    args = parser.parse_args()
-    run_mitigation(args.dataset, args.kind, model=args.model) 
\ No newline at end of file
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--scoring', type=str, default='greedy', choices=list(SCORING_METHODS), help="Scoring method of the detection checkpoints to mitigate from (normal kind)")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="Samples per row the detection run used with --scoring samples")
+    parser.add_argument('--sample_temperature', type=float, default=DEFAULT_SAMPLE_TEMPERATURE, help="Sampling temperature the detection run used with --scoring samples")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("g_eval.mitigation")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.mitigation_model or args.model, args.rpm, args.tpm)
+    try:
+        run_mitigation(
+            args.dataset, args.kind, model=args.model, mitigation_model=args.mitigation_model,
+            scoring=Scoring(args.scoring, args.samples, args.sample_temperature)
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; revised answers so far are saved, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
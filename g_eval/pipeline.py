@@ -0,0 +1,177 @@
+"""
+Streaming G-Eval pipeline: detection → mitigation → automated evaluation per row.
+
+Rows are scored for faithfulness and completeness in one request ("both"
+mode); a row with either score below 5 (below 4.5 for expected scores) is
+mitigated and re-scored while later rows are still being detected. The
+stages are connected by bounded queues and read and write the same
+checkpoints as the standalone scripts (normal mitigation), so a run resumes
+per row and per stage.
+"""
+
+import logging
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from g_eval import detection, mitigation
+from g_eval import automated_eval as ae
+from g_eval.helpers.mitigation_utils import mitigation_path, needs_mitigation, revised_answers
+from g_eval.helpers.openai_utils import (
+    SCORING_METHODS, DEFAULT_SAMPLES, DEFAULT_SAMPLE_TEMPERATURE, GREEDY, Scoring, call_openai_scores
+)
+from g_eval.helpers.scoring_modes import SCORING_MODES, format_scoring_prompt
+from common import rate_limit, llm_backend, llm_trace
+from common.dataset_store import load_dataset
+from common.streaming import Stage, run_stages, DEFAULT_QUEUE_SIZE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+MODE = "both"
+DETECTION_CKPT_DIRS = {"faithfulness": mitigation.FAITH_CKPT_DIR, "completeness": mitigation.COMP_CKPT_DIR}
+DETECTION_RESULTS_DIR = Path(__file__).parent.parent / "results"
+
+
+def run_pipeline(
+    dataset: str,
+    model: str = "gpt-4o-mini",
+    detect_workers: int = 4,
+    mitigate_workers: int = 2,
+    eval_workers: int = 2,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    max_api_retries: int = 20,
+    scoring: Scoring = GREEDY
+) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """
+    Run detection, mitigation and automated evaluation as overlapping stages.
+    Both scoring stages use `scoring`, and every checkpoint, output and
+    results file is named with its tag. Returns the detection correlation per
+    metric and the number of rows each stage handled.
+    """
+    prompt_template, schema, fields = SCORING_MODES[MODE]
+    tag = f"{model}_{dataset}{scoring.tag}"
+
+    df = load_dataset(mitigation.DATA_DIR / f"model_outputs_with_scores_{dataset}.json").frame()
+    total = len(df)
+    det_stores = {}
+    for m in fields:
+        os.makedirs(DETECTION_CKPT_DIRS[m], exist_ok=True)
+        det_stores[m] = detection.open_detection_store(str(DETECTION_CKPT_DIRS[m] / f"{tag}.json"), m)
+    mitigation.NORMAL_OUT_DIR.mkdir(parents=True, exist_ok=True)
+    mit_path = mitigation_path(mitigation.NORMAL_OUT_DIR, dataset, model, scoring)
+    revised = revised_answers(mitigation.NORMAL_OUT_DIR, dataset, model, scoring)
+    ae_stores = {m: ae.open_automated_eval_store(ae.AE_CKPT_DIRS[("normal", m)] / f"{tag}.json") for m in fields}
+
+    mit_lock = threading.Lock()
+
+    def detect(idx: int) -> Optional[Tuple[dict, Dict[str, float]]]:
+        row = df.iloc[idx]
+        if any(str(idx) not in det_stores[m] for m in fields):
+            with llm_trace.scope(stage="g_eval.detection"):
+                scores = detection.score_row(row, idx, total, MODE, model, scoring)
+            for m in fields:
+                if str(idx) not in det_stores[m]:
+                    det_stores[m].put(str(idx), scores[m])
+        old = {m: det_stores[m].get(str(idx)) for m in fields}
+        example = mitigation.make_example(idx, row, old["faithfulness"], old["completeness"], scoring)
+        return (example, old) if example is not None else None
+
+    def mitigate(item: Tuple[dict, Dict[str, float]]) -> Tuple[int, str, Dict[str, float]]:
+        example, old = item
+        idx = example["idx"]
+        with mit_lock:
+            revised_answer = revised.get(idx)
+        if revised_answer is None:
+            logging.info(f"[mitigate] idx={idx}")
+            with llm_trace.scope(stage="g_eval.mitigation"):
+                revised_answer = mitigation.mitigate_example(example, model, max_api_retries=max_api_retries)
+            with mit_lock, mit_path.open("a", encoding="utf-8") as outf:
+                mitigation.write_mitigation(outf, idx, revised_answer)
+                revised[idx] = revised_answer
+        return idx, revised_answer, old
+
+    def reevaluate(item: Tuple[int, str, Dict[str, float]]) -> None:
+        idx, revised_answer, old = item
+        # the last_line marker is left alone: rows finish out of file order here,
+        # and the standalone script skips rows that already have a score anyway
+        pending = [m for m in fields if needs_mitigation(old[m], scoring) and str(idx) not in ae_stores[m]]
+        if not pending:
+            return None
+        logging.info(f"[re-evaluate] idx={idx}")
+        prompt = format_scoring_prompt(prompt_template, df.iloc[idx], revised_answer.strip())
+        try:
+            with llm_trace.scope(stage="g_eval.automated_eval", row=idx):
+                new_scores = call_openai_scores(
+                    prompt, schema=schema, fields=fields, model=model,
+                    temperature=0.0, max_retries=ae.MAX_API_RETRY, scoring=scoring
+                )
+        except Exception as err:
+            logging.warning(f"{idx}: {err}; keeping old score")
+            new_scores = old
+        for m in pending:
+            ae_stores[m].put(str(idx), new_scores[m])
+        return None
+
+    try:
+        handled = run_stages(range(total), [
+            Stage("detect", detect, detect_workers),
+            Stage("mitigate", mitigate, mitigate_workers),
+            Stage("re-evaluate", reevaluate, eval_workers),
+        ], queue_size=queue_size)
+    finally:
+        for store in (*det_stores.values(), *ae_stores.values()):
+            store.close()
+
+    correlations = {}
+    for m in fields:
+        results_dir = DETECTION_RESULTS_DIR / f"g_eval_{m}_correlation"
+        os.makedirs(results_dir, exist_ok=True)
+        correlations[m] = detection.write_correlation(
+            df, df[f"{m}_score"].tolist(), det_stores[m], m, str(results_dir / f"{tag}.txt"), scoring
+        )
+        old_scores = [det_stores[m].get(str(i), 1.0) for i in range(total)]
+        new_scores = {k: v for k, v in ae_stores[m].entries.items() if k != ae.LAST_LINE_KEY}
+        ae.write_summary(dataset, m, old_scores, new_scores, ae.RESULTS_DIRS[("normal", m)] / f"{tag}.txt", scoring)
+    logging.info(f"[{dataset}] pipeline finished: {handled}")
+    return correlations, handled
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run G-Eval detection, mitigation and automated evaluation as one streaming pipeline.")
+    parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
+    parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--detect_workers', type=int, default=4, help="Rows scored concurrently")
+    parser.add_argument('--mitigate_workers', type=int, default=2, help="Rows mitigated concurrently")
+    parser.add_argument('--eval_workers', type=int, default=2, help="Rows re-scored concurrently")
+    parser.add_argument('--queue_size', type=int, default=DEFAULT_QUEUE_SIZE, help="Rows buffered between stages")
+    parser.add_argument('--scoring', type=str, default='greedy', choices=list(SCORING_METHODS), help="Score read-out: greedy integer, mean of sampled scores, or logprob-weighted expected score")
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help="Samples per answer with --scoring samples (one request with n samples)")
+    parser.add_argument('--sample_temperature', type=float, default=DEFAULT_SAMPLE_TEMPERATURE, help="Sampling temperature with --scoring samples")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("g_eval.pipeline")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.model, args.rpm, args.tpm)
+    try:
+        run_pipeline(
+            args.dataset, args.model,
+            detect_workers=args.detect_workers,
+            mitigate_workers=args.mitigate_workers,
+            eval_workers=args.eval_workers,
+            queue_size=args.queue_size,
+            scoring=Scoring(args.scoring, args.samples, args.sample_temperature)
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; finished rows are checkpointed, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,134 @@
 import os
+import sys
 import json
 import logging
 from pathlib import Path
 from mtraig.helpers.data_utils import load_human_faith_scores
-from mtraig.helpers.automated_eval_data_utils import load_faithfulness_scores_from_ckpt
-from mtraig.helpers.openai_utils import decompose_claims, verify_claims
+from mtraig.helpers.automated_eval_data_utils import load_faithfulness_scores_from_ckpt, load_detection_results_from_ckpt
+from mtraig.helpers.openai_utils import decompose_claims, verify_claims, DEFAULT_MAX_CONCURRENCY, VERIFICATION_STRATEGIES, DEFAULT_VERIFICATION_STRATEGY
 from mtraig.helpers.score_utils import calculate_faithfulness_score
+from mtraig.helpers.batch_utils import batch_decompose_and_verify
+from mtraig.helpers.answer_diff import plan_reuse, ReusePlan
+from mtraig.helpers.mitigation_data_utils import mitigation_tag
+from mtraig.helpers import claim_memo
+from common import rate_limit, llm_backend, llm_trace
+from common.checkpoint import CheckpointStore
+from common.batch import BatchBackend, get_backend
+from typing import List, Optional, Tuple
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 MITIG_DIR   = Path("mtraig/mitigation_outputs")
 AE_CKPT_DIR = Path("mtraig/automated_eval_checkpoints")
 RESULTS_DIR = Path("results/mtraig_automated_eval")
-for p in (AE_CKPT_DIR, RESULTS_DIR):
-    p.mkdir(exist_ok=True)
 
 CKPT_DIR = Path("mtraig/faithfulness_scores")
 
+# full: score every revised answer from scratch
+# diff: reuse the detection claims/verdicts of sentences the revision left unchanged
+REEVAL_MODES = ("full", "diff")
+DEFAULT_REEVAL_MODE = "full"
 
-def evaluate_mitigation(dataset: str, model: str):
-    mit_file     = MITIG_DIR   / f"{model}_{dataset}.jsonl"
-    ae_ck_file   = AE_CKPT_DIR / f"{model}_{dataset}.json"
-    summary_file = RESULTS_DIR / f"{model}_{dataset}.txt"
+
+def _revised_text(entry: dict) -> str:
+    revised = entry["revised_answer"]
+    return " ".join(revised).strip() if isinstance(revised, list) else str(revised).strip()
+
+
+def open_automated_eval_store(ae_ck_file: Path) -> CheckpointStore:
+    """
+    Entries are journaled one at a time and the JSON list of entries is
+    rewritten on compaction.
+    """
+    return CheckpointStore(
+        ae_ck_file,
+        load=lambda entries: {str(entry["original_idx"]): entry for entry in entries},
+        dump=lambda entries: list(entries.values()),
+        indent=2
+    )
+
+
+def reevaluate_row(
+    r,
+    idx: int,
+    revised_answer: str,
+    old: float,
+    model: str,
+    temperature: float = 0.0,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    verification_strategy: str = DEFAULT_VERIFICATION_STRATEGY,
+    previous: Optional[dict] = None,
+    reeval_mode: str = DEFAULT_REEVAL_MODE
+) -> Tuple[dict, bool]:
+    """
+    Checkpoint entry for one revised answer; keeps the old score if scoring fails.
+    With reeval_mode="diff" and the row's detection result in `previous`, only
+    the sentences the revision added or edited are decomposed and verified.
+    Also returns whether stored claims were reused.
+    """
+    plan = diff_plan(r, revised_answer, previous) if reeval_mode == "diff" else None
+    if plan is not None and not plan.changed_text:
+        # identical answer, or only sentences dropped: nothing to call the model for
+        return _entry(idx, old, plan.claims, plan.verifications), True
+    try:
+        insight = plan.changed_text if plan is not None else revised_answer
+        claims = decompose_claims(schema=r["schema"], insight=insight, temperature=temperature, model=model)
+        verifications = verify_claims(r["raw_table"], claims, temperature=temperature, model=model, max_concurrency=max_concurrency, strategy=verification_strategy)
+        if plan is not None:
+            claims = plan.claims + claims
+            verifications = plan.verifications + verifications
+        new_score = calculate_faithfulness_score(verifications)
+    except Exception as err:
+        logging.warning(f"{idx}: {err}; keep old score")
+        new_score = old
+        claims = []
+        verifications = []
+    return _entry(idx, old, claims, verifications, new_score), plan is not None
+
+
+def _entry(idx: int, old: float, claims: List[str], verifications: List[bool], new_score: Optional[float] = None) -> dict:
+    return {
+        "original_idx": idx,
+        "old_score": old,
+        "new_score": calculate_faithfulness_score(verifications) if new_score is None else new_score,
+        "claims": claims,
+        "verifications": verifications
+    }
+
+
+def diff_plan(r, revised_answer: str, previous: Optional[dict]) -> Optional[ReusePlan]:
+    """
+    What the row's detection result contributes to scoring `revised_answer`;
+    None when it has to be scored in full. An identical answer reuses every
+    stored claim, which reproduces the old score.
+    """
+    if not previous or previous.get("error"):
+        return None
+    return plan_reuse(
+        r.get("model_output") or "", revised_answer,
+        previous.get("claims", []), previous.get("claim_verifications", [])
+    )
+
+
+def evaluate_mitigation(
+    dataset: str,
+    model: str,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    batch_backend: Optional[BatchBackend] = None,
+    poll_interval: float = 60.0,
+    verification_strategy: str = DEFAULT_VERIFICATION_STRATEGY,
+    reeval_mode: str = DEFAULT_REEVAL_MODE,
+    mitigation_model: Optional[str] = None
+):
+    """
+    Re-score the revised answers `mitigation_model` (default: `model`) wrote
+    for `model`'s detection run; the checkpoint and summary carry the same
+    mitigation_tag as the outputs they score.
+    """
+    tag          = f"{model}_{dataset}{mitigation_tag(model, mitigation_model)}"
+    mit_file     = MITIG_DIR   / f"{tag}.jsonl"
+    ae_ck_file   = AE_CKPT_DIR / f"{tag}.json"
+    summary_file = RESULTS_DIR / f"{tag}.txt"
     temperature = 0.0
 
     if not mit_file.exists():
@@ -30,19 +137,58 @@ def evaluate_mitigation(dataset: str, model: str):
     # Load original scores and dataset
     df, _ = load_human_faith_scores(f"model_outputs_with_scores_{dataset}.json")
     old_scores = load_faithfulness_scores_from_ckpt(str(CKPT_DIR / f"{model}_{dataset}.json"))
+    previous = load_detection_results_from_ckpt(str(CKPT_DIR / f"{model}_{dataset}.json")) if reeval_mode == "diff" else None
+    reused_rows = 0
 
-    # Load or initialize checkpoint
-    revised_entries = []
-    seen_indices = set()
-    if ae_ck_file.exists():
-        with ae_ck_file.open() as f:
-            revised_entries = json.load(f)
-            seen_indices = {entry["original_idx"] for entry in revised_entries}
-        logging.info(f"[{dataset}] Resuming from checkpoint: {len(revised_entries)} entries loaded")
+    store = open_automated_eval_store(ae_ck_file)
+    seen_indices = {int(k) for k in store.entries}
+    if store.entries:
+        logging.info(f"[{dataset}] Resuming from checkpoint: {len(store.entries)} entries loaded")
 
     all_old_scores = []
     all_new_scores = []
 
+    # Resolve pending entries through offline batches first; anything left falls through to the loop below
+    if batch_backend is not None:
+        pending = {}
+        plans = {}
+        batch_entries = {}
+        with mit_file.open() as f:
+            for raw in f:
+                e = json.loads(raw)
+                idx = e["original_idx"]
+                if idx in seen_indices or old_scores[idx] >= 5:
+                    continue
+                r = df.iloc[idx]
+                revised_answer = _revised_text(e)
+                plan = diff_plan(r, revised_answer, previous[idx]) if previous is not None else None
+                if plan is not None and not plan.changed_text:
+                    batch_entries[str(idx)] = _entry(idx, old_scores[idx], plan.claims, plan.verifications)
+                    continue
+                if plan is not None:
+                    plans[idx] = plan
+                    revised_answer = plan.changed_text
+                pending[idx] = (r["schema"], revised_answer, r["raw_table"])
+        resolved = batch_decompose_and_verify(
+            pending, batch_backend, tag=f"mtraig_automated_eval_{tag}",
+            model=model, temperature=temperature, poll_interval=poll_interval,
+            strategy=verification_strategy
+        )
+        for idx, (claims, verifications) in resolved.items():
+            if idx in plans:
+                claims = plans[idx].claims + claims
+                verifications = plans[idx].verifications + verifications
+            batch_entries[str(idx)] = _entry(idx, old_scores[idx], claims, verifications)
+        for entry in batch_entries.values():
+            seen_indices.add(entry["original_idx"])
+            all_old_scores.append(entry["old_score"])
+            all_new_scores.append(entry["new_score"])
+        # rows settled without a request, plus diffed rows the batch resolved
+        reused_rows += len(batch_entries) - len(resolved) + len(plans.keys() & resolved.keys())
+        store.put_many(batch_entries)
+        if resolved:
+            logging.info(f"[{dataset}] merged {len(resolved)} batch results into {ae_ck_file}")
+
     # Recompute only for missing entries
     with mit_file.open() as f:
         for raw in f:
@@ -50,33 +196,32 @@ def evaluate_mitigation(dataset: str, model: str):
             idx = e["original_idx"]
             if idx in seen_indices:
                 continue
-            revised_answer = " ".join(e["revised_answer"]).strip() if isinstance(e["revised_answer"], list) else str(e["revised_answer"]).strip()
+            revised_answer = _revised_text(e)
             old = old_scores[idx]
             if old >= 5:
                 continue
-            r = df.iloc[idx]
-            try:
-                claims = decompose_claims(schema=r["schema"], insight=revised_answer, temperature=temperature, model=model)
-                verifications = verify_claims(r["serialized_table"], claims, temperature=temperature, model=model)
-                new_score = calculate_faithfulness_score(verifications)
-            except Exception as err:
-                logging.warning(f"{idx}: {err}; keep old score")
-                new_score = old
-                claims = []
-                verifications = []
-            entry = {
-                "original_idx": idx,
-                "old_score": old,
-                "new_score": new_score,
-                "claims": claims,
-                "verifications": verifications
-            }
-            revised_entries.append(entry)
-            # Save updated checkpoint
-            json.dump(revised_entries, ae_ck_file.open("w"), indent=2)
+            row_previous = previous[idx] if previous is not None else None
+            with llm_trace.scope(row=idx):
+                entry, reused = reevaluate_row(
+                    df.iloc[idx], idx, revised_answer, old, model, temperature=temperature,
+                    max_concurrency=max_concurrency, verification_strategy=verification_strategy,
+                    previous=row_previous, reeval_mode=reeval_mode
+                )
+            reused_rows += reused
+            store.put(str(idx), entry)
             all_old_scores.append(old)
-            all_new_scores.append(new_score)
+            all_new_scores.append(entry["new_score"])
+
+    store.close()
+    if reeval_mode == "diff":
+        logging.info(f"[{dataset}] diff re-evaluation reused stored claims for {reused_rows}/{len(all_new_scores)} rows")
+    write_summary(dataset, old_scores, list(store.entries.values()), all_old_scores, all_new_scores, summary_file)
 
+def write_summary(dataset: str, old_scores: List[float], revised_entries: List[dict], all_old_scores: List[float], all_new_scores: List[float], summary_file: Path):
+    """
+    Summarize the mitigation effect. `all_old_scores`/`all_new_scores` cover the
+    entries processed in this run; when empty, every checkpointed entry is used.
+    """
     # Recalculate summary regardless of whether new entries were processed
     if not revised_entries:
         logging.warning("No new examples processed. Using existing checkpoint for summary.")
@@ -92,6 +237,9 @@ def evaluate_mitigation(dataset: str, model: str):
     avg_old_all = sum(old_scores) / len(old_scores)
     avg_new_all = sum(full_new_scores) / len(full_new_scores)
     delta_all = (avg_new_all - avg_old_all) / 5 * 100
+    # numpy is only needed for the significance lines
+    from common.stats import significance_lines
+    summary_file.parent.mkdir(parents=True, exist_ok=True)
     with summary_file.open("w") as sf:
         sf.write(f"{dataset.upper()} – MT-RAIG Mitigation Summary\n")
         sf.write(f"examples revised     : {len(all_old_scores)}\n")
@@ -99,16 +247,53 @@ def evaluate_mitigation(dataset: str, model: str):
         sf.write(f"before               : {avg_old_updated:.3f}\n")
         sf.write(f"after                : {avg_new_updated:.3f}\n")
         sf.write(f"improvement          : {delta_updated:+.2f}%\n")
+        sf.write("".join(line + "\n" for line in significance_lines(all_old_scores, all_new_scores, width=21)))
         sf.write(f"\n--- On Full Dataset ---\n")
         sf.write(f"overall before       : {avg_old_all:.3f}\n")
         sf.write(f"overall after        : {avg_new_all:.3f}\n")
         sf.write(f"overall improvement  : {delta_all:+.2f}%\n")
+        sf.write("".join(line + "\n" for line in significance_lines(old_scores, full_new_scores, width=21)))
+        memo_lines = claim_memo.summary_lines()
+        if memo_lines:
+            sf.write(f"\n--- Claim Memo (this run) ---\n")
+            sf.write("".join(line + "\n" for line in memo_lines))
     logging.info(f"[{dataset}] summary -> {summary_file}")
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
     import argparse
     parser = argparse.ArgumentParser(description="Run MT-RAIG mitigation automated evaluation.")
     parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
     parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
-    args = parser.parse_args()
-    evaluate_mitigation(args.dataset, args.model)
+    parser.add_argument('--mitigation_model', type=str, default=None, help="Model that wrote the revised answers to score (default: --model)")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--max_concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY, help="Maximum claim verifications in flight per row")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--batch', action='store_true', help="Submit pending entries through the batch API before any synchronous calls")
+    parser.add_argument('--batch_backend', type=str, default='openai', choices=['openai', 'local'], help="Batch backend used with --batch")
+    parser.add_argument('--verification_strategy', type=str, default=DEFAULT_VERIFICATION_STRATEGY, choices=list(VERIFICATION_STRATEGIES), help="Verify claims one request each (per_claim) or all claims of a row in one request (single_pass)")
+    parser.add_argument('--poll_interval', type=float, default=60.0, help="Seconds between batch status polls")
+    parser.add_argument('--reeval_mode', type=str, default=DEFAULT_REEVAL_MODE, choices=list(REEVAL_MODES), help="Score revised answers in full, or only the sentences that differ from the original (diff)")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("mtraig.automated_eval")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.model, args.rpm, args.tpm)
+    try:
+        evaluate_mitigation(
+            args.dataset, args.model,
+            max_concurrency=args.max_concurrency,
+            batch_backend=get_backend(args.batch_backend) if args.batch else None,
+            poll_interval=args.poll_interval,
+            verification_strategy=args.verification_strategy,
+            reeval_mode=args.reeval_mode,
+            mitigation_model=args.mitigation_model
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; scored entries are checkpointed, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
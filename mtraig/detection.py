@@ -3,23 +3,119 @@ Detection logic for MTRAIG approach.
 """
 
 import os
-import json
+import sys
 import logging
 from mtraig.helpers.data_utils import load_human_faith_scores
-from mtraig.helpers.openai_utils import decompose_claims, verify_claims
+from mtraig.helpers.openai_utils import decompose_claims, verify_claims, DEFAULT_MAX_CONCURRENCY, VERIFICATION_STRATEGIES, DEFAULT_VERIFICATION_STRATEGY
 from mtraig.helpers.score_utils import calculate_faithfulness_score, calculate_correlation
+from mtraig.helpers.batch_utils import batch_decompose_and_verify
+from mtraig.helpers import claim_memo, claim_rules
+from common import rate_limit, llm_backend, llm_trace
+from common.checkpoint import CheckpointStore
+from common.batch import BatchBackend, get_backend
+from typing import List, Optional
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
-def evaluate(dataset: str, model_name: str = "gpt-4o-mini") -> float:
+CHECKPOINT_DIR = "mtraig/faithfulness_scores"
+RESULTS_DIR    = "results/mtraig_correlation"
+
+
+def open_detection_store(checkpoint_path: str, total: int) -> CheckpointStore:
+    """
+    Rows are journaled one at a time; the checkpoint JSON keeps the
+    {"last_idx", "detailed_results"} shape and is rewritten on compaction.
+    """
+    def load_results(ck: dict) -> dict:
+        return {str(i): r for i, r in enumerate(ck.get("detailed_results", [])) if r}
+
+    def dump_results(entries: dict) -> dict:
+        return {
+            "last_idx": total - 1,
+            "detailed_results": [entries.get(str(i), {}) for i in range(total)]
+        }
+
+    return CheckpointStore(checkpoint_path, load_results, dump_results, indent=2)
+
+
+def needs_redo(existing: Optional[dict]) -> bool:
+    return (
+        not existing or
+        (existing.get("claims") == [] and existing.get("claim_verifications") == [])
+    )
+
+
+def detect_row(
+    row,
+    human_score: float,
+    model_name: str,
+    temperature: float = 0.0,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    verification_strategy: str = DEFAULT_VERIFICATION_STRATEGY
+) -> dict:
+    """
+    Decompose and verify one row's answer; failures give an empty, error-tagged result.
+    """
+    example_id = row.get("example_id", "N/A")
+    try:
+        claims = decompose_claims(
+            schema=row["schema"],
+            insight=row.get("model_output"),
+            temperature=temperature,
+            model=model_name
+        )
+        verifications = verify_claims(row["raw_table"], claims, temperature=temperature, model=model_name, max_concurrency=max_concurrency, strategy=verification_strategy)
+        return {
+            "example_id": example_id,
+            "claims": claims,
+            "claim_verifications": verifications,
+            "faithfulness_score": calculate_faithfulness_score(verifications),
+            "human_score": human_score
+        }
+    except Exception as e:
+        logging.warning(f" → call failed for example_id={example_id}: {str(e)}")
+        return {
+            "example_id": example_id,
+            "claims": [],
+            "claim_verifications": [],
+            "faithfulness_score": 1.0,
+            "human_score": human_score,
+            "error": str(e)
+        }
+
+
+def write_correlation(df, human_faith: list, store: CheckpointStore, results_path: str) -> float:
+    df["score_metric"] = [store.get(str(i), {}).get("faithfulness_score", 1.0) for i in range(len(df))]
+    df["score_human"] = human_faith
+    instance_r = calculate_correlation(df)
+    from common.stats import correlation_report_lines
+    with open(results_path, "w") as rf:
+        rf.write(f"Instance-level Pearson r: {instance_r:.4f}\n")
+        rf.write("".join(line + "\n" for line in correlation_report_lines(df["score_metric"], df["score_human"], df["example_id"])))
+        rf.write("".join(line + "\n" for line in claim_memo.summary_lines()))
+    logging.info(f"Final results written to {results_path}")
+    return instance_r
+
+
+def evaluate(
+    dataset: str,
+    model_name: str = "gpt-4o-mini",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    batch_backend: Optional[BatchBackend] = None,
+    poll_interval: float = 60.0,
+    verification_strategy: str = DEFAULT_VERIFICATION_STRATEGY
+) -> float:
+    """
+    Run MT-RAIG detection. With `batch_backend`, every pending row is first
+    decomposed and verified through offline batches; rows the batch could not
+    resolve fall back to synchronous calls.
+    """
     data_filename   = f"model_outputs_with_scores_{dataset}.json"
     tag             = f"{model_name}_{dataset}"
     checkpoint_fname= f"{tag}.json"
     results_fname   = f"{tag}.txt"
     temperature     = 0.0
 
-    CHECKPOINT_DIR = "mtraig/faithfulness_scores"
-    RESULTS_DIR    = "results/mtraig_correlation"
     os.makedirs(CHECKPOINT_DIR, exist_ok=True)
     os.makedirs(RESULTS_DIR, exist_ok=True)
 
@@ -28,70 +124,79 @@ def evaluate(dataset: str, model_name: str = "gpt-4o-mini") -> float:
 
     df, human_faith = load_human_faith_scores(data_filename)
 
-    if os.path.exists(checkpoint_path):
-        logging.info(f"Loading checkpoint from {checkpoint_path}")
-        with open(checkpoint_path, "r") as ckf:
-            ck = json.load(ckf)
-        detailed_results = ck.get("detailed_results", [])
-        logging.info(f"Loaded {len(detailed_results)} entries from checkpoint")
-    else:
-        detailed_results = [{} for _ in range(len(df))]
+    logging.info(f"Loading checkpoint from {checkpoint_path}")
+    store = open_detection_store(checkpoint_path, len(df))
+    logging.info(f"Loaded {len(store.entries)} entries from checkpoint")
 
-    for idx, row in df.iterrows():
-        example_id = row.get("example_id", "N/A")
-        existing = detailed_results[idx] if idx < len(detailed_results) else {}
-        needs_redo = (
-            not existing or
-            (existing.get("claims") == [] and existing.get("claim_verifications") == [])
+    if batch_backend is not None:
+        pending = {
+            idx: (row["schema"], row.get("model_output"), row["raw_table"])
+            for idx, row in df.iterrows() if needs_redo(store.get(str(idx)))
+        }
+        resolved = batch_decompose_and_verify(
+            pending, batch_backend, tag=f"mtraig_detection_{tag}",
+            model=model_name, temperature=temperature, poll_interval=poll_interval,
+            strategy=verification_strategy
         )
-        if not needs_redo:
-            continue
-        logging.info(f"Re-evaluating idx={idx}, example_id={example_id}")
-        try:
-            claims = decompose_claims(
-                schema=row["schema"],
-                insight=row.get("model_output"),
-                temperature=temperature,
-                model=model_name
-            )
-            verifications = verify_claims(row["serialized_table"], claims, temperature=temperature, model=model_name)
-            pred_f = calculate_faithfulness_score(verifications)
-            datapoint_result = {
-                "example_id": example_id,
+        store.put_many({
+            str(idx): {
+                "example_id": df.iloc[idx].get("example_id", "N/A"),
                 "claims": claims,
                 "claim_verifications": verifications,
-                "faithfulness_score": pred_f,
+                "faithfulness_score": calculate_faithfulness_score(verifications),
                 "human_score": human_faith[idx]
             }
-        except Exception as e:
-            logging.warning(f" → call failed at idx={idx}: {str(e)}")
-            datapoint_result = {
-                "example_id": example_id,
-                "claims": [],
-                "claim_verifications": [],
-                "faithfulness_score": 1.0,
-                "human_score": human_faith[idx],
-                "error": str(e)
-            }
-        detailed_results[idx] = datapoint_result
-        with open(checkpoint_path, "w") as ckf:
-            json.dump({
-                "last_idx": len(detailed_results) - 1,
-                "detailed_results": detailed_results
-            }, ckf, indent=2)
+            for idx, (claims, verifications) in resolved.items()
+        })
+        if resolved:
+            logging.info(f"Merged {len(resolved)} batch results into {checkpoint_path}")
+
+    for idx, row in df.iterrows():
+        if not needs_redo(store.get(str(idx))):
+            continue
+        logging.info(f"Re-evaluating idx={idx}, example_id={row.get('example_id', 'N/A')}")
+        with llm_trace.scope(row=idx):
+            store.put(str(idx), detect_row(
+                row, human_faith[idx], model_name, temperature=temperature,
+                max_concurrency=max_concurrency, verification_strategy=verification_strategy
+            ))
         logging.info(f"Checkpoint saved at idx {idx}")
-    df["score_metric"] = [r.get("faithfulness_score", 1.0) for r in detailed_results]
-    df["score_human"] = human_faith
-    instance_r = calculate_correlation(df)
-    with open(results_path, "w") as rf:
-        rf.write(f"Instance-level Pearson r: {instance_r:.4f}\n")
-    logging.info(f"Final results written to {results_path}")
-    return instance_r
+    store.close()
+    if claim_rules.pre_verify_mode() != "off":
+        claim_rules.write_report(os.path.join(RESULTS_DIR, f"{tag}_pre_verification.json"))
+    return write_correlation(df, human_faith, store, results_path)
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
     import argparse
     parser = argparse.ArgumentParser(description="Run MT-RAIG detection pipeline.")
     parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
     parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
-    args = parser.parse_args()
-    evaluate(args.dataset, args.model) 
\ No newline at end of file
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--max_concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY, help="Maximum claim verifications in flight per row")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--batch', action='store_true', help="Submit pending rows through the batch API before any synchronous calls")
+    parser.add_argument('--batch_backend', type=str, default='openai', choices=['openai', 'local'], help="Batch backend used with --batch")
+    parser.add_argument('--verification_strategy', type=str, default=DEFAULT_VERIFICATION_STRATEGY, choices=list(VERIFICATION_STRATEGIES), help="Verify claims one request each (per_claim) or all claims of a row in one request (single_pass)")
+    parser.add_argument('--poll_interval', type=float, default=60.0, help="Seconds between batch status polls")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("mtraig.detection")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.model, args.rpm, args.tpm)
+    try:
+        evaluate(
+            args.dataset, args.model,
+            max_concurrency=args.max_concurrency,
+            batch_backend=get_backend(args.batch_backend) if args.batch else None,
+            poll_interval=args.poll_interval,
+            verification_strategy=args.verification_strategy
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; scored rows are checkpointed, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Sentence-level diff between an original answer and its revision.
+
+Mitigation usually rewrites one or two sentences and copies the rest. The
+revised answer is aligned with the original sentence by sentence, the claims
+stored by detection are attributed to the original sentence they came from,
+and claims of sentences that survive unchanged keep their stored verdicts.
+Only the new or edited sentences need to be decomposed and verified again.
+
+The plan is conservative: when a claim cannot be attributed to one sentence,
+or most of the answer changed, no plan is returned and the caller scores the
+whole revision.
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import List, NamedTuple, Optional, Sequence
+
+from common.table_pruning import tokenize
+
+# a sentence ends at . ! or ? followed by whitespace and an upper-case letter,
+# digit or quote; "3.5", "e.g. the" and "U.S. team" stay inside one sentence
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+_SPACE_RE = re.compile(r"\s+")
+
+# share of revised sentences allowed to be new before the diff is not worth it
+MAX_CHANGED_FRACTION = 0.6
+
+
+class ReusePlan(NamedTuple):
+    claims: List[str]          # stored claims of unchanged sentences
+    verifications: List[bool]  # their stored verdicts
+    changed_text: str          # new or edited sentences, joined; "" if none
+
+
+def normalize_text(text: str) -> str:
+    return _SPACE_RE.sub(" ", str(text)).strip()
+
+
+def split_sentences(text: str) -> List[str]:
+    text = normalize_text(text)
+    return [s for s in _SENTENCE_END_RE.split(text) if s] if text else []
+
+
+def align(original: List[str], revised: List[str]) -> List[Optional[int]]:
+    """
+    For every revised sentence, the index of the identical original sentence
+    it was copied from, or None if it is new or edited.
+    """
+    matcher = SequenceMatcher(a=[s.lower() for s in original], b=[s.lower() for s in revised], autojunk=False)
+    mapping: List[Optional[int]] = [None] * len(revised)
+    for block in matcher.get_matching_blocks():
+        for k in range(block.size):
+            mapping[block.b + k] = block.a + k
+    return mapping
+
+
+def attribute_claims(sentences: List[str], claims: Sequence[str]) -> Optional[List[int]]:
+    """
+    The source sentence of each claim, by content-word overlap. None when any
+    claim shares no word with the answer or ties between sentences.
+    """
+    sentence_tokens = [tokenize(s) for s in sentences]
+    sources = []
+    for claim in claims:
+        tokens = tokenize(claim)
+        overlaps = [len(tokens & st) for st in sentence_tokens]
+        best = max(overlaps, default=0)
+        if best == 0 or overlaps.count(best) > 1:
+            return None
+        sources.append(overlaps.index(best))
+    return sources
+
+
+def plan_reuse(
+    original_answer: str,
+    revised_answer: str,
+    claims: Sequence[str],
+    verifications: Sequence[bool]
+) -> Optional[ReusePlan]:
+    """
+    Which stored claims and verdicts carry over to the revision, and which text
+    still needs scoring. None means: score the whole revision.
+    """
+    if len(claims) != len(verifications):
+        return None
+    if normalize_text(original_answer) == normalize_text(revised_answer):
+        return ReusePlan(list(claims), list(verifications), "")
+    if not claims:
+        # nothing stored to reuse (or detection failed on this row)
+        return None
+    original = split_sentences(original_answer)
+    revised = split_sentences(revised_answer)
+    mapping = align(original, revised)
+    changed = [s for s, src in zip(revised, mapping) if src is None]
+    if not revised or len(changed) > MAX_CHANGED_FRACTION * len(revised):
+        return None
+    sources = attribute_claims(original, claims)
+    if sources is None:
+        return None
+    kept = {src for src in mapping if src is not None}
+    reused = [(c, v) for c, v, src in zip(claims, verifications, sources) if src in kept]
+    return ReusePlan(
+        [c for c, _ in reused],
+        [bool(v) for _, v in reused],
+        " ".join(changed)
+    )
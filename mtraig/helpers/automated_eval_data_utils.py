@@ -1,4 +1,6 @@
 import json
+import logging
+from common.checkpoint import has_pending_journal
 
 def load_faithfulness_scores_from_ckpt(filepath: str) -> list[float]:
     """
@@ -12,6 +14,8 @@ def load_faithfulness_scores_from_ckpt(filepath: str) -> list[float]:
     }
     Returns a list of faithfulness scores aligned with dataset indices.
     """
+    if has_pending_journal(filepath):
+        logging.warning(f"{filepath} has uncompacted journal updates; rerun detection to fold them in")
     with open(filepath, 'r', encoding='utf-8') as f:
         data = json.load(f)
     if "detailed_results" not in data:
@@ -21,4 +25,17 @@ def load_faithfulness_scores_from_ckpt(filepath: str) -> list[float]:
         if "faithfulness_score" not in entry:
             raise ValueError("Missing 'faithfulness_score' in an entry.")
         scores.append(entry["faithfulness_score"])
-    return scores 
\ No newline at end of file
+    return scores 
+
+def load_detection_results_from_ckpt(filepath: str) -> list[dict]:
+    """
+    The per-row detection results (claims, claim_verifications, faithfulness_score, ...)
+    from the same checkpoint, aligned with dataset indices.
+    """
+    if has_pending_journal(filepath):
+        logging.warning(f"{filepath} has uncompacted journal updates; rerun detection to fold them in")
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if "detailed_results" not in data:
+        raise ValueError("Missing 'detailed_results' key in checkpoint file.")
+    return data["detailed_results"]
@@ -0,0 +1,122 @@
+import logging
+from typing import Dict, List, Tuple
+from common.batch import BatchBackend, run_cached_batch, function_arguments
+from mtraig.helpers.openai_utils import build_decomposition_request, build_verification_request, build_multi_verification_request, claim_table_renderer, verification_config, DEFAULT_VERIFICATION_STRATEGY
+from mtraig.helpers.claim_rules import split_claims, merge_verdicts
+from mtraig.helpers import claim_memo
+
+
+def batch_decompose_and_verify(
+    items: Dict[int, Tuple[str, str, str]],
+    backend: BatchBackend,
+    tag: str,
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.0,
+    poll_interval: float = 60.0,
+    strategy: str = DEFAULT_VERIFICATION_STRATEGY
+) -> Dict[int, Tuple[List[str], List[bool]]]:
+    """
+    Decompose and verify many answers through two batches: one with every
+    decomposition, then one with every claim verification.
+    `items` maps row idx -> (schema, insight, table), with the table as text or a dict.
+    With strategy="single_pass" the second batch holds one request per row;
+    rows whose verdict count does not match their claims are left unresolved.
+    Returns row idx -> (claims, verifications) for rows whose every request succeeded.
+    """
+    from mtraig.helpers.schemas import ClaimDecompositionResult, ClaimVerificationResult, MultiClaimVerificationResult
+    decomposition_requests = {
+        str(idx): build_decomposition_request(schema, insight, temperature=temperature, model=model)
+        for idx, (schema, insight, _) in items.items()
+    }
+    claims_by_idx = run_cached_batch(
+        decomposition_requests,
+        extract=function_arguments,
+        parse=lambda raw: ClaimDecompositionResult.model_validate_json(raw).claims,
+        backend=backend,
+        tag=f"{tag}_decompose",
+        poll_interval=poll_interval
+    )
+    # claims the rule-based checker decides (CLAIM_PRE_VERIFY=on) or the claim
+    # memo already knows stay out of the batch
+    pre_verified = {idx_str: split_claims(items[int(idx_str)][2], claims) for idx_str, claims in claims_by_idx.items()}
+    memo_config = verification_config(model, temperature, strategy)
+    memoized = {
+        idx_str: claim_memo.lookup(items[int(idx_str)][2], claims, pre_verified[idx_str][1], memo_config)
+        for idx_str, claims in claims_by_idx.items()
+    }
+    if strategy == "single_pass":
+        return _batch_verify_single_pass(items, claims_by_idx, pre_verified, memoized, backend, tag, model, temperature, poll_interval, memo_config)
+    verification_requests = {}
+    for idx_str, claims in claims_by_idx.items():
+        table_for = claim_table_renderer(items[int(idx_str)][2])
+        for j in memoized[idx_str][1]:
+            verification_requests[f"{idx_str}-{j}"] = build_verification_request(table_for(claims[j]), claims[j], temperature=temperature, model=model)
+    verdicts = run_cached_batch(
+        verification_requests,
+        extract=function_arguments,
+        parse=lambda raw: ClaimVerificationResult.model_validate_json(raw).faithfulness == 1,
+        backend=backend,
+        tag=f"{tag}_verify",
+        poll_interval=poll_interval
+    )
+    results: Dict[int, Tuple[List[str], List[bool]]] = {}
+    for idx_str, claims in claims_by_idx.items():
+        decisions, pending = pre_verified[idx_str]
+        found, missing = memoized[idx_str]
+        ids = [f"{idx_str}-{j}" for j in missing]
+        if all(cid in verdicts for cid in ids):
+            fresh = [verdicts[cid] for cid in ids]
+            claim_memo.record(items[int(idx_str)][2], [claims[j] for j in missing], fresh, memo_config)
+            by_idx = {**found, **dict(zip(missing, fresh))}
+            results[int(idx_str)] = (claims, merge_verdicts(claims, decisions, pending, [by_idx[j] for j in pending]))
+    logging.info(f"[batch] {tag}: {len(results)}/{len(items)} rows fully resolved")
+    return results
+
+
+def _batch_verify_single_pass(
+    items: Dict[int, Tuple[str, str, str]],
+    claims_by_idx: Dict[str, List[str]],
+    pre_verified: Dict[str, Tuple[List, List[int]]],
+    memoized: Dict[str, Tuple[Dict[int, bool], List[int]]],
+    backend: BatchBackend,
+    tag: str,
+    model: str,
+    temperature: float,
+    poll_interval: float,
+    memo_config: str
+) -> Dict[int, Tuple[List[str], List[bool]]]:
+    pending_claims = {
+        idx_str: [claims[j] for j in memoized[idx_str][1]] for idx_str, claims in claims_by_idx.items()
+    }
+
+    def resolve(idx_str: str, fresh: List[bool]) -> Tuple[List[str], List[bool]]:
+        claims = claims_by_idx[idx_str]
+        decisions, pending = pre_verified[idx_str]
+        found, missing = memoized[idx_str]
+        claim_memo.record(items[int(idx_str)][2], pending_claims[idx_str], fresh, memo_config)
+        by_idx = {**found, **dict(zip(missing, fresh))}
+        return claims, merge_verdicts(claims, decisions, pending, [by_idx[j] for j in pending])
+
+    results: Dict[int, Tuple[List[str], List[bool]]] = {
+        int(idx_str): resolve(idx_str, []) for idx_str, claims in pending_claims.items() if not claims
+    }
+    verification_requests = {
+        idx_str: build_multi_verification_request(claim_table_renderer(items[int(idx_str)][2])(" ".join(claims)), claims, temperature=temperature, model=model)
+        for idx_str, claims in pending_claims.items() if claims
+    }
+    verdicts = run_cached_batch(
+        verification_requests,
+        extract=function_arguments,
+        parse=lambda raw: [v == 1 for v in MultiClaimVerificationResult.model_validate_json(raw).verdicts],
+        backend=backend,
+        tag=f"{tag}_verify_single_pass",
+        poll_interval=poll_interval
+    )
+    for idx_str, row_verdicts in verdicts.items():
+        claims = pending_claims[idx_str]
+        if len(row_verdicts) == len(claims):
+            results[int(idx_str)] = resolve(idx_str, row_verdicts)
+        else:
+            logging.warning(f"[batch] {tag} row {idx_str}: {len(row_verdicts)} verdicts for {len(claims)} claims; leaving for synchronous fallback")
+    logging.info(f"[batch] {tag}: {len(results)}/{len(items)} rows fully resolved")
+    return results
@@ -0,0 +1,258 @@
+"""
+Claim verification memo shared across rows and stages.
+
+Rows with the same example_id share a table, and answers from different
+systems often decompose into the same atomic claims. Verdicts are stored in
+SQLite keyed by (table hash, normalized claim, verification config), so a
+claim is verified once per table across detection, automated evaluation,
+re-runs and parallel processes. The table hash covers the table content; the
+config (`openai_utils.verification_config`) covers everything else that
+shapes the request: model, temperature, verification strategy, prompt and
+function schema, prompt layout and table serialization/pruning settings.
+
+Near-duplicate claims (reworded, reordered) can reuse a verdict too: each claim
+gets a MinHash signature over word shingles, and a memo entry on the same table
+matches when the estimated Jaccard similarity reaches CLAIM_MEMO_NEAR_DUP and
+both claims carry the same numbers and negations. This is off by default;
+each reuse is logged and listed in the results with the claim it came from.
+
+Environment variables:
+    CLAIM_MEMO_PATH      SQLite file (default: .llm_cache/claim_memo.sqlite)
+    CLAIM_MEMO_DISABLE   set to 1 to verify every claim
+    CLAIM_MEMO_NEAR_DUP  similarity threshold for near-duplicate reuse, e.g. 0.9
+                         (default: exact matches only)
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+DEFAULT_MEMO_PATH = ".llm_cache/claim_memo.sqlite"
+NUM_PERM = 64
+SHINGLE_SIZE = 2
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(20240601)
+_PERMS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+_NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_WORD_RE = re.compile(r"[a-z0-9]+(?:\.[0-9]+|'[a-z]+)?")
+NEGATIONS = frozenset("not no never none neither nor without".split())
+FILLER = frozenset("a an the".split())
+
+
+def normalize_claim(claim: str) -> str:
+    """
+    Case-, whitespace-, punctuation- and thousands-separator-insensitive form of a claim.
+    """
+    text = unicodedata.normalize("NFKC", claim).lower()
+    text = _NUMBER_RE.sub(lambda m: m.group(0).replace(",", ""), text)
+    return " ".join(w for w in _WORD_RE.findall(text) if w not in FILLER)
+
+
+def table_hash(table: Any) -> str:
+    payload = table if isinstance(table, str) else json.dumps(table, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _shingles(norm: str) -> Set[str]:
+    words = norm.split()
+    if len(words) < SHINGLE_SIZE:
+        return {norm}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(norm: str) -> List[int]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in _shingles(norm)
+    ]
+    return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS]
+
+
+def similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """
+    Estimated Jaccard similarity of the shingle sets behind two signatures.
+    """
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def _guard(norm: str) -> Tuple[frozenset, frozenset]:
+    # near-duplicates must agree on every number and negation ("20" vs "21", "not")
+    words = norm.split()
+    return frozenset(w for w in words if w[0].isdigit()), frozenset(w for w in words if w in NEGATIONS)
+
+
+class ClaimMemo:
+    def __init__(self, path: str, near_dup: Optional[float] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.near_dup = near_dup
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # (claim, claim whose verdict it reused, similarity) for every near-duplicate hit
+        self.near_matches: List[Tuple[str, str, float]] = []
+        self._lock = threading.Lock()
+        # (table hash, config) -> [(normalized claim, signature, verdict)], loaded on first near-dup lookup
+        self._by_table: Dict[Tuple[str, str], List[Tuple[str, List[int], bool]]] = {}
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # verdicts of the earlier claim_verdicts table were keyed by model only and are not read
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " table_hash TEXT NOT NULL,"
+            " config TEXT NOT NULL,"
+            " claim TEXT NOT NULL,"
+            " verdict INTEGER NOT NULL,"
+            " signature TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (table_hash, config, claim))"
+        )
+        self._conn.commit()
+
+    def _table_entries(self, th: str, config: str) -> List[Tuple[str, List[int], bool]]:
+        key = (th, config)
+        if key not in self._by_table:
+            rows = self._conn.execute(
+                "SELECT claim, signature, verdict FROM verdicts WHERE table_hash = ? AND config = ?",
+                (th, config)
+            ).fetchall()
+            self._by_table[key] = [(c, json.loads(s), bool(v)) for c, s, v in rows]
+        return self._by_table[key]
+
+    def get(self, th: str, claim: str, config: str) -> Optional[bool]:
+        norm = normalize_claim(claim)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT verdict FROM verdicts WHERE table_hash = ? AND config = ? AND claim = ?",
+                (th, config, norm)
+            ).fetchone()
+            if row is not None:
+                self.exact_hits += 1
+                return bool(row[0])
+            if self.near_dup is not None:
+                sig, guard = minhash(norm), _guard(norm)
+                best, verdict, source = 0.0, None, None
+                for other, other_sig, other_verdict in self._table_entries(th, config):
+                    score = similarity(sig, other_sig)
+                    if score >= self.near_dup and score > best and _guard(other) == guard:
+                        best, verdict, source = score, other_verdict, other
+                if verdict is not None:
+                    self.near_hits += 1
+                    self.near_matches.append((norm, source, best))
+                    logging.info(f"Claim memo: reused the verdict of {source!r} for {norm!r} (similarity {best:.2f})")
+                    return verdict
+            self.misses += 1
+            return None
+
+    def put(self, th: str, claim: str, config: str, verdict: bool):
+        norm = normalize_claim(claim)
+        sig = minhash(norm)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (table_hash, config, claim, verdict, signature, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (th, config, norm, int(verdict), json.dumps(sig), time.time())
+            )
+            self._conn.commit()
+            if (th, config) in self._by_table:
+                self._by_table[(th, config)].append((norm, sig, verdict))
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            total = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "near_dup_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+    def log_stats(self):
+        s = self.stats()
+        if s["exact_hits"] or s["near_dup_hits"] or s["misses"]:
+            logging.info(
+                f"Claim memo: {s['exact_hits']} exact and {s['near_dup_hits']} near-duplicate hits, "
+                f"{s['misses']} misses ({s['hit_rate']:.1%} hit rate)"
+            )
+
+
+_memo: Optional[ClaimMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_memo() -> Optional[ClaimMemo]:
+    """
+    Return the process-wide claim memo, or None when disabled.
+    """
+    global _memo
+    if os.getenv("CLAIM_MEMO_DISABLE", "0") == "1":
+        return None
+    with _memo_lock:
+        if _memo is None:
+            near_dup = os.getenv("CLAIM_MEMO_NEAR_DUP")
+            _memo = ClaimMemo(
+                os.getenv("CLAIM_MEMO_PATH", DEFAULT_MEMO_PATH),
+                near_dup=float(near_dup) if near_dup else None
+            )
+            atexit.register(_memo.log_stats)
+        return _memo
+
+
+def stats() -> Optional[dict]:
+    """
+    Hit and miss counts of this process, or None if the memo was not used.
+    """
+    return _memo.stats() if _memo is not None else None
+
+
+def summary_lines() -> List[str]:
+    s = stats()
+    if not s or not (s["exact_hits"] or s["near_dup_hits"] or s["misses"]):
+        return []
+    reused = [f"  {claim!r} <- {source!r} ({score:.2f})" for claim, source, score in list(_memo.near_matches)]
+    return [
+        f"claim memo hits     : {s['exact_hits']} exact, {s['near_dup_hits']} near-duplicate",
+        f"claim memo misses   : {s['misses']}",
+        f"claim memo hit rate : {s['hit_rate']:.1%}",
+        *(["claim memo near-duplicate reuse (claim <- verdict source, similarity):"] + reused if reused else []),
+    ]
+
+
+def lookup(table: Any, claims: List[str], pending: List[int], config: str) -> Tuple[Dict[int, bool], List[int]]:
+    """
+    Memoized verdicts for the `pending` claim indices under the verification
+    `config`, and the indices still needing verification.
+    """
+    memo = get_memo()
+    if memo is None:
+        return {}, list(pending)
+    th = table_hash(table)
+    found, missing = {}, []
+    for j in pending:
+        verdict = memo.get(th, claims[j], config)
+        if verdict is None:
+            missing.append(j)
+        else:
+            found[j] = verdict
+    return found, missing
+
+
+def record(table: Any, claims: List[str], verdicts: List[bool], config: str):
+    memo = get_memo()
+    if memo is None:
+        return
+    th = table_hash(table)
+    for claim, verdict in zip(claims, verdicts):
+        memo.put(th, claim, config, verdict)
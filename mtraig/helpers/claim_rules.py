@@ -0,0 +1,401 @@
+"""
+Rule-based pre-verification of simple claims against the table.
+
+Three kinds of atomic claims are checked without an LLM:
+    lookup       "X scored 20 goals in 2005": the entity's row holds the numbers
+                 and the named column holds the claimed value
+    count        "There are 12 teams": the claimed number of rows, when each row
+                 is a distinct entity
+    superlative  "X had the highest attendance": the entity's value in the named
+                 column is (or is not) the column's max/min
+
+Each rule returns a verdict only when the claim parses cleanly. Claims with
+negation, comparisons, approximations, unit scaling or proper nouns missing
+from the table are deferred (None) and verified by the LLM as before, and so
+are claims that name table values from other rows than the entity's ("X
+scored 20 goals for <another row's team>") or narrow the rows a superlative
+compares ("the highest goals for Leeds", "in the league").
+
+Environment variables:
+    CLAIM_PRE_VERIFY  off (default), on (decided claims skip the LLM) or audit
+                      (every claim still goes to the LLM; local verdicts are
+                      only compared against it)
+"""
+
+import atexit
+import difflib
+import json
+import logging
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from common.table_pruning import tokenize
+
+PRE_VERIFY_MODES = ("off", "on", "audit")
+
+Decision = Tuple[Optional[bool], Optional[str]]  # (verdict or None to defer, rule)
+
+RISKY_WORDS = frozenset("""
+not no never none neither nor without than more less fewer greater higher lower
+before after between approximately about around nearly almost roughly over under
+only first last second third both either increase increased decrease decreased
+rose fell compared difference percent percentage ratio times twice half average
+mean total sum combined respectively until since each every per
+""".split())
+SCALE_WORDS = frozenset("thousand thousands million millions billion billions bn k m".split())
+HIGH_WORDS = frozenset("highest most largest biggest greatest maximum".split())
+LOW_WORDS = frozenset("lowest least fewest smallest minimum".split())
+# columns where a high value is not "the most" of something
+ORDINAL_HEADERS = frozenset("rank ranking position pos place seed no".split())
+SUMMARY_ROW_WORDS = frozenset("total totals average overall sum".split())
+# a superlative followed by one of these may be restricted to some of the rows
+QUALIFIER_WORDS = frozenset("for in at among amongst within during from excluding including except with by".split())
+ARTICLES = frozenset("the a an".split())
+NUMBER_WORDS = {
+    w: i for i, w in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve thirteen "
+        "fourteen fifteen sixteen seventeen eighteen nineteen twenty".split()
+    )
+}
+_COUNT_RE = re.compile(
+    r"\b(?:there\s+(?:are|were)|(?:the\s+)?table\s+(?:lists|shows|contains|includes|has))\s+([a-z0-9]+)\s+[a-z]+",
+    re.I
+)
+_RAW_WORD_RE = re.compile(r"[a-z]+")
+_KEY_WORD_RE = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_PROPER_RE = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][a-z]+(?:'[a-z]+)?")
+
+
+def pre_verify_mode() -> str:
+    mode = os.getenv("CLAIM_PRE_VERIFY", "off")
+    if mode not in PRE_VERIFY_MODES:
+        raise ValueError(f"CLAIM_PRE_VERIFY must be one of {', '.join(PRE_VERIFY_MODES)}, got '{mode}'")
+    return mode
+
+
+def _tokens(text: Any) -> Set[str]:
+    return {t[:-2] if t.endswith("'s") else t for t in tokenize(text)}
+
+
+def _numbers(tokens: Set[str]) -> Set[float]:
+    return {float(t) for t in tokens if t[0].isdigit()}
+
+
+def _words(tokens: Set[str]) -> Set[str]:
+    return {t for t in tokens if not t[0].isdigit()}
+
+
+def _cell_value(cell: Any) -> Optional[float]:
+    numbers = _numbers(_tokens(cell))
+    return next(iter(numbers)) if len(numbers) == 1 else None
+
+
+def _decimals(token: str) -> int:
+    return len(token.split(".")[1]) if "." in token else 0
+
+
+class ClaimChecker:
+    """
+    Token index over one {title, header, rows} table, built once and reused
+    for every claim checked against it.
+    """
+
+    def __init__(self, table: Dict):
+        self.header: List = list(table.get("header", []))
+        self.rows: List = [list(r) for r in table.get("rows", [])]
+        self.header_tokens = [_words(_tokens(h)) for h in self.header]
+        self.row_tokens = [_tokens(" ".join(map(str, r))) for r in self.rows]
+        self.row_numbers = [_numbers(t) for t in self.row_tokens]
+        self.key_tokens = [_words(_tokens(r[0])) if r else set() for r in self.rows]
+        self.key_vocab = set().union(*self.key_tokens) if self.key_tokens else set()
+        self.vocab = set().union(_tokens(table.get("title", "")), *self.header_tokens, *self.row_tokens)
+        self.header_vocab = set().union(*self.header_tokens) if self.header_tokens else set()
+        # words of the cell values, which name rows rather than columns
+        self.body_vocab = set().union(*map(_words, self.row_tokens)) - self.header_vocab if self.row_tokens else set()
+        self.summary_rows = {i for i, t in enumerate(self.key_tokens) if t & SUMMARY_ROW_WORDS}
+
+    # --- claim parsing ---
+
+    def _claim_words(self, claim: str) -> Set[str]:
+        words = _words(_tokens(claim))
+        # fuzzy match entity spellings against the row keys
+        for w in list(words):
+            if w not in self.vocab and len(w) >= 5:
+                close = difflib.get_close_matches(w, self.key_vocab, n=1, cutoff=0.85)
+                if close:
+                    words.add(close[0])
+        return words
+
+    def _unexplained_proper_nouns(self, claim: str) -> bool:
+        for name in _PROPER_RE.findall(claim):
+            t = name.lower()
+            if t not in self.vocab and not difflib.get_close_matches(t, self.vocab, n=1, cutoff=0.85):
+                return True
+        return False
+
+    def _entity_rows(self, words: Set[str]) -> List[int]:
+        """
+        Rows whose key cell (first column) is named in the claim: all of its
+        tokens, or at least its last one (surnames).
+        """
+        rows = []
+        for i, key in enumerate(self.key_tokens):
+            if key and (key <= words or (len(key) > 1 and _last_key_token(self.rows[i][0]) in words)):
+                rows.append(i)
+        return rows
+
+    def _mentioned_columns(self, words: Set[str]) -> List[int]:
+        cols = []
+        for j, tokens in enumerate(self.header_tokens):
+            if j == 0 or not tokens:
+                continue
+            if 2 * len(tokens & words) >= len(tokens) and tokens & words:
+                cols.append(j)
+        return cols
+
+    def _foreign_words(self, words: Set[str], i: int) -> Set[str]:
+        """
+        Table values named in the claim that are not in row `i`: the claim
+        then mixes rows, or qualifies the entity by another row's value.
+        """
+        return (words & self.body_vocab) - self.row_tokens[i]
+
+    def _restricted(self, claim: str) -> bool:
+        """
+        Whether a qualifier ("for Leeds", "in the league") follows a word that
+        is not a column name, so the superlative may compare only some rows.
+        """
+        raw = _RAW_WORD_RE.findall(claim.lower())
+        for k, w in enumerate(raw):
+            if w not in QUALIFIER_WORDS:
+                continue
+            rest = [t for t in raw[k + 1:] if t not in ARTICLES]
+            if not rest or rest[0] not in self.header_vocab:
+                return True
+        return False
+
+    def _cell(self, i: int, j: int) -> Any:
+        return self.rows[i][j] if j < len(self.rows[i]) else None
+
+    # --- rules ---
+
+    def check(self, claim: str) -> Decision:
+        raw_words = set(_RAW_WORD_RE.findall(claim.lower()))
+        if not self.rows or raw_words & SCALE_WORDS or self._unexplained_proper_nouns(claim):
+            return None, None
+        count = _COUNT_RE.search(claim)
+        if count:
+            return self._check_count(claim, count.group(1).lower(), raw_words), "count"
+        if raw_words & RISKY_WORDS:
+            return None, None
+        if raw_words & (HIGH_WORDS | LOW_WORDS):
+            return self._check_superlative(claim, raw_words), "superlative"
+        return self._check_lookup(claim), "lookup"
+
+    def _check_count(self, claim: str, number: str, raw_words: Set[str]) -> Optional[bool]:
+        if raw_words & (RISKY_WORDS - {"total"}):
+            return None
+        n = NUMBER_WORDS.get(number, float(number) if number.replace(".", "").isdigit() else None)
+        if n is None:
+            return None
+        # anything the claim names from the table body filters the rows being counted
+        words = self._claim_words(claim)
+        if any(words & t for t in self.row_tokens):
+            return None
+        data_rows = [i for i in range(len(self.rows)) if i not in self.summary_rows]
+        # only when every row is a distinct entity, so rows and entities count alike
+        if len({str(self.rows[i][0]).strip().lower() for i in data_rows if self.rows[i]}) != len(data_rows):
+            return None
+        return True if n == len(data_rows) else None
+
+    def _check_superlative(self, claim: str, raw_words: Set[str]) -> Optional[bool]:
+        tokens = _tokens(claim)
+        if _numbers(tokens) or (raw_words & HIGH_WORDS and raw_words & LOW_WORDS):
+            return None
+        words = self._claim_words(claim)
+        entity = [i for i in self._entity_rows(words) if i not in self.summary_rows]
+        cols = self._mentioned_columns(words)
+        if len(entity) != 1 or len(cols) != 1 or self.header_tokens[cols[0]] & ORDINAL_HEADERS:
+            return None
+        # any table value besides the entity's name, even one from its own row,
+        # may restrict the compared rows ("the highest goals for Leeds")
+        if (words & self.body_vocab) - self.key_tokens[entity[0]] or self._restricted(claim):
+            return None
+        c = cols[0]
+        values = {
+            i: v for i in range(len(self.rows)) if i not in self.summary_rows
+            for v in [_cell_value(self._cell(i, c))] if v is not None
+        }
+        if entity[0] not in values or len(values) < 0.8 * (len(self.rows) - len(self.summary_rows)):
+            return None
+        best = max(values.values()) if raw_words & HIGH_WORDS else min(values.values())
+        return values[entity[0]] == best
+
+    def _check_lookup(self, claim: str) -> Optional[bool]:
+        tokens = _tokens(claim)
+        numbers = _numbers(tokens)
+        if not numbers:
+            return None
+        words = self._claim_words(claim)
+        # only rows that account for every table value the claim names
+        entity = [i for i in self._entity_rows(words) if not self._foreign_words(words, i)]
+        cols = [
+            j for j in self._mentioned_columns(words)
+            if any(_cell_value(self._cell(i, j)) is not None for i in entity)
+        ]
+        if not entity or not cols:
+            return None
+
+        # supported: some entity row holds every claimed number, and each named
+        # numeric column of that row holds one of them
+        for i in entity:
+            if numbers <= self.row_numbers[i] and all(
+                _cell_value(self._cell(i, j)) in numbers for j in cols
+                if _cell_value(self._cell(i, j)) is not None
+            ):
+                return True
+
+        # refuted: the numbers that are in the table pin down one row, the one
+        # remaining number is the claimed value, and the named column disagrees
+        in_table = {n for n in numbers if any(n in self.row_numbers[i] for i in entity)}
+        asserted = numbers - in_table
+        rows = [i for i in entity if in_table <= self.row_numbers[i]]
+        if len(asserted) != 1 or len(rows) != 1 or len(cols) != 1:
+            return None
+        v = _cell_value(self._cell(rows[0], cols[0]))
+        n = next(iter(asserted))
+        if v is None or v in numbers or _same_up_to_rounding(n, v, tokens) or n * 100 == v or v * 100 == n:
+            return None
+        return False
+
+
+def _last_key_token(cell: Any) -> Optional[str]:
+    words = [t[:-2] if t.endswith("'s") else t for t in _KEY_WORD_RE.findall(str(cell).lower())]
+    return words[-1] if words else None
+
+
+def _same_up_to_rounding(n: float, v: float, tokens: Set[str]) -> bool:
+    token = next((t for t in tokens if t[0].isdigit() and float(t) == n), "")
+    return round(v, _decimals(token)) == n
+
+
+def pre_verify(table: Any, claims: List[str]) -> List[Decision]:
+    """
+    Local verdict and rule for each claim; a verdict of None defers the claim.
+    Only {title, header, rows} dict tables are checked.
+    """
+    if not isinstance(table, dict) or not table.get("rows"):
+        return [(None, None)] * len(claims)
+    checker = ClaimChecker(table)
+    decisions = []
+    for claim in claims:
+        try:
+            decisions.append(checker.check(claim))
+        except Exception as err:  # a malformed table cell must never fail the row
+            logging.debug(f"pre-verification skipped '{claim}': {err}")
+            decisions.append((None, None))
+    return decisions
+
+
+class PreVerifyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.claims = 0
+        self.deferred = 0
+        self.decided: Dict[str, Dict[str, int]] = defaultdict(lambda: {"true": 0, "false": 0})
+        self.audit: Dict[str, Dict[str, int]] = defaultdict(lambda: {"agree": 0, "disagree": 0})
+        self.disagreements: List[Dict] = []
+
+    def record(self, decisions: List[Decision]):
+        with self._lock:
+            self.claims += len(decisions)
+            for verdict, rule in decisions:
+                if verdict is None:
+                    self.deferred += 1
+                else:
+                    self.decided[rule]["true" if verdict else "false"] += 1
+
+    def record_audit(self, claims: List[str], decisions: List[Decision], llm_verdicts: List[bool]):
+        with self._lock:
+            for claim, (verdict, rule), llm in zip(claims, decisions, llm_verdicts):
+                if verdict is None:
+                    continue
+                if verdict == llm:
+                    self.audit[rule]["agree"] += 1
+                else:
+                    self.audit[rule]["disagree"] += 1
+                    if len(self.disagreements) < 100:
+                        self.disagreements.append({"claim": claim, "rule": rule, "local": verdict, "llm": llm})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            decided = sum(d["true"] + d["false"] for d in self.decided.values())
+            audited = {rule: dict(a) for rule, a in self.audit.items()}
+            checked = sum(a["agree"] + a["disagree"] for a in audited.values())
+            agreed = sum(a["agree"] for a in audited.values())
+            return {
+                "claims": self.claims,
+                "decided_locally": decided,
+                "deferred": self.deferred,
+                "decided_by_rule": {rule: dict(d) for rule, d in self.decided.items()},
+                "audited": checked,
+                "agreement": agreed / checked if checked else None,
+                "audit_by_rule": audited,
+                "disagreements": list(self.disagreements),
+            }
+
+    def log_stats(self):
+        s = self.snapshot()
+        if not s["claims"]:
+            return
+        msg = f"Claim pre-verification: {s['decided_locally']}/{s['claims']} claims decided locally"
+        if s["audited"]:
+            msg += f", {s['agreement']:.1%} agreement with the LLM over {s['audited']} audited"
+        logging.info(msg)
+
+
+_stats = PreVerifyStats()
+atexit.register(_stats.log_stats)
+
+
+def stats() -> dict:
+    """
+    Process-wide pre-verification counts, per-rule verdicts and, in audit
+    mode, agreement with the LLM verdicts.
+    """
+    return _stats.snapshot()
+
+
+def write_report(path: str):
+    with open(path, "w") as f:
+        json.dump(stats(), f, indent=2)
+    logging.info(f"Pre-verification report written to {path}")
+
+
+def split_claims(table: Any, claims: List[str]) -> Tuple[List[Decision], List[int]]:
+    """
+    Pre-verify `claims` under CLAIM_PRE_VERIFY. Returns the local decisions and
+    the indices of the claims that still need LLM verification.
+    """
+    mode = pre_verify_mode()
+    if mode == "off":
+        return [(None, None)] * len(claims), list(range(len(claims)))
+    decisions = pre_verify(table, claims)
+    _stats.record(decisions)
+    if mode == "audit":
+        return decisions, list(range(len(claims)))
+    return decisions, [j for j, (verdict, _) in enumerate(decisions) if verdict is None]
+
+
+def merge_verdicts(claims: List[str], decisions: List[Decision], pending: List[int], llm_verdicts: List[bool]) -> List[bool]:
+    """
+    Verdict per claim from the local decisions and the LLM verdicts of the
+    `pending` claims. In audit mode the LLM verdicts win and are compared.
+    """
+    by_idx = dict(zip(pending, llm_verdicts))
+    if len(pending) == len(claims) and any(verdict is not None for verdict, _ in decisions):
+        _stats.record_audit(claims, decisions, [by_idx[j] for j in range(len(claims))])
+    return [by_idx[j] if j in by_idx else bool(decisions[j][0]) for j in range(len(claims))]
@@ -1,7 +1,21 @@
 import os
-import json
 import logging
-import pandas as pd
+from common.dataset_store import load_dataset
+from common.table_serialization import serialize_table
+
+def _fetaqa_table(metadata):
+    return {
+        'title': f"{metadata['table_page_title']} - {metadata['table_section_title']}",
+        'header': metadata['table_array'][0],
+        'rows': metadata['table_array'][1:]
+    }
+
+def _qtsumm_table(metadata):
+    return {
+        'title': metadata['table']['title'],
+        'header': metadata['table']['header'],
+        'rows': metadata['table']['rows']
+    }
 
 def load_human_faith_scores(filename: str):
     DATA_DIR = "data/outputs"
@@ -10,25 +24,16 @@ def load_human_faith_scores(filename: str):
         logging.error(f"Data file not found at {DATA_PATH}")
         raise FileNotFoundError(f"Data file not found: {DATA_PATH}")
     logging.info(f"Loading data from {DATA_PATH}")
-    with open(DATA_PATH, "r") as f:
-        data = json.load(f)
-    df = pd.DataFrame(data)
-    logging.info(f"Dataset contains {len(df)} entries")
-    if 'faithfulness_score' not in df.columns:
+    store = load_dataset(DATA_PATH)
+    logging.info(f"Dataset contains {len(store)} entries")
+    if 'faithfulness_score' not in store:
         raise KeyError("'faithfulness_score' column not found in the dataset.")
-    if 'fetaqa' in filename:
-        df['schema'] = df['metadata'].apply(lambda x: x['table_array'][0])
-        df['serialized_table'] = df['metadata'].apply(lambda x: {
-            'title': f"{x['table_page_title']} - {x['table_section_title']}",
-            'header': x['table_array'][0],
-            'rows': x['table_array'][1:]
-        })
-    else:
-        df['schema'] = df['metadata'].apply(lambda x: x['table']['header'])
-        df['serialized_table'] = df['metadata'].apply(lambda x: {
-            'title': x['table']['title'],
-            'header': x['table']['header'],
-            'rows': x['table']['rows']
-        })
+    df = store.frame()
+    # the table dicts are cached with the dataset; only the serialization is redone,
+    # since it depends on the TABLE_* settings
+    raw_tables = store.derived_column('raw_table', _fetaqa_table if 'fetaqa' in filename else _qtsumm_table)
+    df['schema'] = [t['header'] for t in raw_tables]
+    df['raw_table'] = raw_tables
+    df['serialized_table'] = [serialize_table(t) for t in raw_tables]
     human_faith = df['faithfulness_score'].tolist()
-    return df, human_faith 
\ No newline at end of file
+    return df, human_faith
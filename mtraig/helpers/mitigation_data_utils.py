@@ -2,8 +2,11 @@ import os
 import json
 import logging
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set
 from .prompts import MTRAIG_MITIGATION_PROMPT_TEMPLATE
+from common import prompt_layout
+from common.dataset_store import load_dataset
+from common.table_serialization import serialize_table
 def load_examples(dataset: str, model: str) -> List[Dict]:
     """
     Loads examples needing mitigation from faithfulness scores and model outputs.
@@ -21,8 +24,7 @@ def load_examples(dataset: str, model: str) -> List[Dict]:
         ckpt_obj = json.load(f)
     detailed_results = ckpt_obj["detailed_results"]
 
-    with data_file.open() as f:
-        raw = json.load(f)
+    raw = load_dataset(data_file).records()
 
     if len(detailed_results) != len(raw):
         raise ValueError(
@@ -31,45 +33,61 @@ def load_examples(dataset: str, model: str) -> List[Dict]:
 
     keep: List[Dict] = []
     for idx, (ex, result) in enumerate(zip(raw, detailed_results)):
-        false_claims = [
-            claim for claim, is_true in zip(result["claims"], result["claim_verifications"])
-            if not is_true
-        ]
-        if not false_claims:
-            continue
-        # Use serialized_table directly if present
-        serialized_table = ex.get("serialized_table")
-        if not serialized_table:
-            metadata = ex.get("metadata", {})
-            if dataset == "fetaqa":
-                serialized_table = {
-                    'title': f"{metadata.get('table_page_title', '')} - {metadata.get('table_section_title', '')}",
-                    'header': metadata.get('table_array', [[]])[0],
-                    'rows': metadata.get('table_array', [[]])[1:]
-                }
-            else:  # qtsumm
-                serialized_table = {
-                    'title': metadata.get('table', {}).get('title', []),
-                    'header': metadata.get('table', {}).get('header', []),
-                    'rows': metadata.get('table', {}).get('rows', [])
-                }
-        keep.append({
-            "idx": idx,
-            "question": ex["question"],
-            "table": serialized_table,
-            "full_answer": ex["model_output"],
-            "false_claims": false_claims
-        })
+        example = make_example(idx, ex, result, dataset)
+        if example is not None:
+            keep.append(example)
     logging.info(f"{dataset.upper()}: {len(keep)} / {len(raw)} examples need mitigation.")
     return keep
 
-def processed_ids(dataset: str, model: str) -> Set[int]:
+def make_example(idx: int, ex: Dict, result: Dict, dataset: str) -> Optional[Dict]:
     """
-    Reads {model}_{dataset}.jsonl (if it exists) in mitigation_outputs and returns the set of original_idx values already mitigated.
+    Mitigation example for one data entry and its detection result, or None
+    when the detection found no false claims.
+    """
+    false_claims = [
+        claim for claim, is_true in zip(result["claims"], result["claim_verifications"])
+        if not is_true
+    ]
+    if not false_claims:
+        return None
+    # Use serialized_table directly if present
+    serialized_table = ex.get("serialized_table")
+    if not serialized_table:
+        metadata = ex.get("metadata", {})
+        if dataset == "fetaqa":
+            serialized_table = {
+                'title': f"{metadata.get('table_page_title', '')} - {metadata.get('table_section_title', '')}",
+                'header': metadata.get('table_array', [[]])[0],
+                'rows': metadata.get('table_array', [[]])[1:]
+            }
+        else:  # qtsumm
+            serialized_table = {
+                'title': metadata.get('table', {}).get('title', []),
+                'header': metadata.get('table', {}).get('header', []),
+                'rows': metadata.get('table', {}).get('rows', [])
+            }
+    return {
+        "idx": idx,
+        "question": ex["question"],
+        "table": serialize_table(serialized_table),
+        "full_answer": ex["model_output"],
+        "false_claims": false_claims
+    }
+
+def mitigation_tag(model: str, mitigation_model: Optional[str] = None) -> str:
+    """
+    Suffix for the mitigation outputs and their automated-eval files when the
+    revisions come from another model than the detection run's.
+    """
+    return f"_by_{mitigation_model}" if mitigation_model and mitigation_model != model else ""
+
+def processed_ids(dataset: str, model: str, mitigation_model: Optional[str] = None) -> Set[int]:
+    """
+    Reads {model}_{dataset}.jsonl (if it exists, with the mitigation_tag) in mitigation_outputs and returns the set of original_idx values already mitigated.
     """
     OUT_DIR = Path("mtraig/mitigation_outputs")
     done = set()
-    out_path = OUT_DIR / f"{model}_{dataset}.jsonl"
+    out_path = OUT_DIR / f"{model}_{dataset}{mitigation_tag(model, mitigation_model)}.jsonl"
     if not out_path.exists():
         return done
     with out_path.open() as f:
@@ -82,14 +100,33 @@ def processed_ids(dataset: str, model: str) -> Set[int]:
     logging.info(f"[{dataset}] Found {len(done)} examples already mitigated.")
     return done 
 
+def revised_answers(dataset: str, model: str, mitigation_model: Optional[str] = None) -> Dict[int, str]:
+    """
+    Like processed_ids, but maps each already mitigated original_idx to its revised answer.
+    """
+    OUT_DIR = Path("mtraig/mitigation_outputs")
+    revised = {}
+    out_path = OUT_DIR / f"{model}_{dataset}{mitigation_tag(model, mitigation_model)}.jsonl"
+    if not out_path.exists():
+        return revised
+    with out_path.open() as f:
+        for line in f:
+            try:
+                obj = json.loads(line)
+                revised[obj["original_idx"]] = obj["revised_answer"]
+            except Exception:
+                continue  # ignore malformed lines
+    return revised
+
 def build_mitigation_prompt(example):
     """
-    Takes one example dict from load_examples() → formatted coarse-level prompt.
+    Takes one example dict from load_examples() → formatted coarse-level prompt
+    (a prompt_layout.Prompt, sent as written or table-first per PROMPT_LAYOUT).
     """
-    prompt = MTRAIG_MITIGATION_PROMPT_TEMPLATE.format(
+    return prompt_layout.render(
+        MTRAIG_MITIGATION_PROMPT_TEMPLATE, "### Table\n", "### Original Answer\n",
         false_claims=example["false_claims"],
-        table=example["table"],
+        table=serialize_table(example["table"]),
         question=example["question"],
         model_answer=example["full_answer"]
-    )
-    return prompt 
\ No newline at end of file
+    ) 
\ No newline at end of file
@@ -1,97 +1,227 @@
-import os
-from openai import OpenAI
-from typing import List, Optional, Dict
-from mtraig.helpers.prompts import CLAIM_DECOMPOSITION_PROMPT, CLAIM_VERIFICATION_PROMPT
-from mtraig.helpers.schemas import ClaimDecompositionResult, ClaimVerificationResult, AnswerRewrite
-from dotenv import load_dotenv
-import time
+import hashlib
+import json
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Dict, Tuple, Type, Union
+from mtraig.helpers.prompts import CLAIM_DECOMPOSITION_PROMPT, CLAIM_VERIFICATION_PROMPT, MULTI_CLAIM_VERIFICATION_PROMPT
+from mtraig.helpers.claim_rules import split_claims, merge_verdicts
+from mtraig.helpers import claim_memo
 import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from common import llm_cache, prompt_layout, retry
+from common.llm_backend import LLMBackend, get_backend, cached
+from common.table_pruning import TableIndex, pruning_enabled, render_for_query
+from common.table_serialization import serialize_table, table_settings
 
-load_dotenv()
+# the pydantic schemas are imported where requests are built or parsed, so
+# importing this module (and the CLIs) stays cheap
+if TYPE_CHECKING:
+    from pydantic import BaseModel
 
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_ATTEMPTS = 5
+VERIFICATION_STRATEGIES = ("per_claim", "single_pass")
+DEFAULT_VERIFICATION_STRATEGY = "per_claim"
 
-def decompose_claims(schema: str, insight: str, temperature: float = 0.0, model: str = "gpt-4o-mini") -> List[str]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-    user_content = CLAIM_DECOMPOSITION_PROMPT.format(schema=schema, insight=insight)
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant that breaks down insights into verifiable atomic-level claims, and returns a function call to 'decompose_claims'."},
-        {"role": "user", "content": user_content}
-    ]
+
+def build_decomposition_request(schema: str, insight: str, temperature: float = 0.0, model: str = "gpt-4o-mini") -> Dict:
+    from mtraig.helpers.schemas import ClaimDecompositionResult
+    prompt = prompt_layout.render(CLAIM_DECOMPOSITION_PROMPT, "Table Schema:\n", "Insight:\n", schema=schema, insight=insight)
+    messages = prompt_layout.messages(
+        "You are a helpful assistant that breaks down insights into verifiable atomic-level claims, and returns a function call to 'decompose_claims'.",
+        prompt
+    )
     function_definition = {
         "name": "decompose_claims",
         "description": "Decomposes the given insight into atomic-level claims based on a provided table schema. Returns a JSON object with a single key 'claims' mapping to a list of strings.",
         "parameters": ClaimDecompositionResult.model_json_schema()
     }
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        functions=[function_definition],
-        temperature=temperature,
-        function_call={"name": "decompose_claims"},
+    return {
+        "model": model,
+        "messages": messages,
+        "functions": [function_definition],
+        "temperature": temperature,
+        "function_call": {"name": "decompose_claims"},
+    }
+
+def build_verification_request(table: str, claim: str, temperature: float = 0.0, model: str = "gpt-4o-mini") -> Dict:
+    from mtraig.helpers.schemas import ClaimVerificationResult
+    prompt = prompt_layout.render(CLAIM_VERIFICATION_PROMPT, "Table:\n", "Claim:\n", table=table, claim=claim)
+    messages = prompt_layout.messages(
+        "You are a helpful assistant that verifies claims against table data. Return your response by calling the function 'verify_claim' with a JSON object that has exactly one key 'faithfulness' (0 or 1).",
+        prompt
     )
-    function_call = response.choices[0].message.function_call
-    arguments_json = function_call.arguments
-    result = ClaimDecompositionResult.model_validate_json(arguments_json)
-    return result.claims
-
-def verify_claims(table: str, claims: List[str], temperature: float = 0.0, model: str = "gpt-4o-mini") -> List[bool]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    client = OpenAI(api_key=api_key)
-    verifications: List[bool] = []
-    function_definition2 = {
+    function_definition = {
         "name": "verify_claim",
         "description": "Given a table and a claim, returns {\"faithfulness\": 0 or 1} where 1 means the claim is faithful to the table data, 0 otherwise.",
         "parameters": ClaimVerificationResult.model_json_schema()
     }
-    for claim in claims:
-        prompt = CLAIM_VERIFICATION_PROMPT.format(table=table, claim=claim)
-        messages = [
-            {"role": "system", "content": "You are a helpful assistant that verifies claims against table data. Return your response by calling the function 'verify_claim' with a JSON object that has exactly one key 'faithfulness' (0 or 1)."},
-            {"role": "user", "content": prompt}
-        ]
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            functions=[function_definition2],
-            function_call={"name": "verify_claim"},
-            temperature=temperature,
-        )
-        func_call = response.choices[0].message.function_call
-        arguments_json = func_call.arguments
-        result = ClaimVerificationResult.model_validate_json(arguments_json)
-        verifications.append(result.faithfulness == 1)
-    return verifications
-
-def call_openai_mitigation(prompt: str, model: str = "gpt-4", temperature: float = 0.0, max_retries: int = 20) -> Optional[Dict[str, str]]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        logging.error("OPENAI_API_KEY not set in environment")
-        raise ValueError("OPENAI_API_KEY not set in environment")
-    client = OpenAI(api_key=api_key)
-    messages = [
-        {"role": "system", "content": "You are a helpful assistant."},
-        {"role": "user", "content": prompt}
-    ]
-    for attempt in range(1, max_retries + 1):
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                response_format={"type": "json_object"}
-            )
-            content = response.choices[0].message.content
-            parsed = AnswerRewrite.model_validate_json(content)
-            return {"answer": parsed.answer}
-        except Exception as e:
-            wait = 2 ** attempt
-            logging.warning(f"OpenAI error {attempt}/{max_retries}: {e} – waiting {wait}s")
-            time.sleep(wait)
-    return None
-
-def get_mitigated_output(prompt: str, model: str = "gpt-4", temperature: float = 0.0, max_api_retries: int = 20) -> Optional[str]:
+    return {
+        "model": model,
+        "messages": messages,
+        "functions": [function_definition],
+        "function_call": {"name": "verify_claim"},
+        "temperature": temperature,
+    }
+
+def build_multi_verification_request(table: str, claims: List[str], temperature: float = 0.0, model: str = "gpt-4o-mini") -> Dict:
+    from mtraig.helpers.schemas import MultiClaimVerificationResult
+    numbered_claims = "\n".join(f"{i}. {claim}" for i, claim in enumerate(claims, start=1))
+    prompt = prompt_layout.render(MULTI_CLAIM_VERIFICATION_PROMPT, "Table:\n", "Claims:\n", table=table, claims=numbered_claims)
+    messages = prompt_layout.messages(
+        "You are a helpful assistant that verifies claims against table data. Return your response by calling the function 'verify_claims' with a JSON object that has exactly one key 'verdicts': a list with one 0 or 1 per claim, in claim order.",
+        prompt
+    )
+    function_definition = {
+        "name": "verify_claims",
+        "description": "Given a table and a numbered list of claims, returns {\"verdicts\": [0 or 1, ...]} with one entry per claim in order, where 1 means the claim is faithful to the table data, 0 otherwise.",
+        "parameters": MultiClaimVerificationResult.model_json_schema()
+    }
+    return {
+        "model": model,
+        "messages": messages,
+        "functions": [function_definition],
+        "function_call": {"name": "verify_claims"},
+        "temperature": temperature,
+    }
+
+def build_mitigation_request(prompt: Union[str, prompt_layout.Prompt], temperature: float = 0.0, model: str = "gpt-4") -> Dict:
+    return {
+        "model": model,
+        "messages": prompt_layout.messages("You are a helpful assistant.", prompt),
+        "temperature": temperature,
+        "response_format": {"type": "json_object"}
+    }
+
+def _call_function(backend: LLMBackend, request: Dict, schema: Type["BaseModel"], label: str, cacheable: Callable[["BaseModel"], bool] = lambda result: True) -> "BaseModel":
+    """
+    Cached, retried function-calling request parsed into `schema`. Results
+    rejected by `cacheable` are returned but not stored.
+    """
+    cache_key, hit = cached(request, field="function_arguments", label=label)
+    if hit is not None:
+        return schema.model_validate_json(hit)
+    def attempt():
+        arguments_json = backend.function_call(request)
+        return schema.model_validate_json(arguments_json), arguments_json
+    result, arguments_json = retry.call_with_retry(attempt, request["model"], max_attempts=DEFAULT_MAX_ATTEMPTS, request=request, label=label)
+    if cacheable(result):
+        llm_cache.store(cache_key, arguments_json)
+    return result
+
+def decompose_claims(schema: str, insight: str, temperature: float = 0.0, model: str = "gpt-4o-mini") -> List[str]:
+    from mtraig.helpers.schemas import ClaimDecompositionResult
+    request = build_decomposition_request(schema, insight, temperature=temperature, model=model)
+    return _call_function(get_backend(), request, ClaimDecompositionResult, "claim decomposition").claims
+
+def _verify_claim(backend: LLMBackend, table: str, claim: str, temperature: float, model: str) -> bool:
+    from mtraig.helpers.schemas import ClaimVerificationResult
+    request = build_verification_request(table, claim, temperature=temperature, model=model)
+    return _call_function(backend, request, ClaimVerificationResult, "claim verification").faithfulness == 1
+
+def _verify_claims_single_pass(backend: LLMBackend, table: str, claims: List[str], temperature: float, model: str) -> Optional[List[bool]]:
+    """
+    Verify all claims in one request. Returns None when the model does not
+    return exactly one verdict per claim, so the caller can fall back.
+    """
+    from mtraig.helpers.schemas import MultiClaimVerificationResult
+    request = build_multi_verification_request(table, claims, temperature=temperature, model=model)
+    result = _call_function(
+        backend, request, MultiClaimVerificationResult, "single-pass verification",
+        cacheable=lambda r: len(r.verdicts) == len(claims)
+    )
+    if len(result.verdicts) != len(claims):
+        logging.warning(f"single-pass verification returned {len(result.verdicts)} verdicts for {len(claims)} claims; falling back to per-claim calls")
+        return None
+    return [verdict == 1 for verdict in result.verdicts]
+
+def claim_table_renderer(table: Any):
+    """
+    Return claim -> table text. A dict table is serialized once, or pruned to
+    each claim's rows and columns (from one shared index) when TABLE_PRUNE is on.
+    """
+    if isinstance(table, dict) and pruning_enabled():
+        index = TableIndex(table)
+        return lambda claim: render_for_query(table, claim, index, prune=True)
+    table_text = serialize_table(table)
+    return lambda claim: table_text
+
+def verification_config(model: str, temperature: float, strategy: str) -> str:
+    """
+    Claim memo key for verdicts obtained with these settings: the model,
+    temperature and strategy, a hash of the request apart from table and claim
+    (system text, prompt template and layout, function schema), and the table
+    serialization and pruning settings.
+    """
+    if strategy == "per_claim":
+        probe = build_verification_request("", "", temperature=temperature, model=model)
+    else:
+        probe = build_multi_verification_request("", [""], temperature=temperature, model=model)
+    request = hashlib.sha256(json.dumps(probe, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{model}|{strategy}|temperature={temperature}|request={request}|table={table_settings()},prune={int(pruning_enabled())}"
+
+def verify_claims(table: Any, claims: List[str], temperature: float = 0.0, model: str = "gpt-4o-mini", max_concurrency: int = DEFAULT_MAX_CONCURRENCY, strategy: str = DEFAULT_VERIFICATION_STRATEGY) -> List[bool]:
+    """
+    Verify every claim against the table, with up to `max_concurrency` requests in flight.
+    `table` is serialized text or a {title, header, rows} dict; a dict may be pruned per claim.
+    With strategy="single_pass" all claims are checked in one request, falling back
+    to per-claim requests if the verdict list does not line up with `claims`.
+    With CLAIM_PRE_VERIFY=on, claims the rule-based checker decides skip the LLM,
+    and claims already verified against the same table come from the claim memo.
+    The returned verdicts are in the same order as `claims`.
+    """
+    if strategy not in VERIFICATION_STRATEGIES:
+        raise ValueError(f"Unknown verification strategy: {strategy}")
+    if not claims:
+        return []
+    decisions, pending = split_claims(table, claims)
+    memoized, missing = claim_memo.lookup(table, claims, pending, verification_config(model, temperature, strategy))
+    llm_verdicts, used = _verify_claims_llm(table, [claims[j] for j in missing], temperature, model, max_concurrency, strategy)
+    claim_memo.record(table, [claims[j] for j in missing], llm_verdicts, verification_config(model, temperature, used))
+    memoized.update(zip(missing, llm_verdicts))
+    return merge_verdicts(claims, decisions, pending, [memoized[j] for j in pending])
+
+def _verify_claims_llm(table: Any, claims: List[str], temperature: float, model: str, max_concurrency: int, strategy: str) -> Tuple[List[bool], str]:
+    """
+    Verdicts for `claims` and the strategy that produced them (per_claim after
+    a single-pass fallback).
+    """
+    if not claims:
+        return [], strategy
+    backend = get_backend()
+    table_for = claim_table_renderer(table)
+    if strategy == "single_pass":
+        verifications = _verify_claims_single_pass(backend, table_for(" ".join(claims)), claims, temperature, model)
+        if verifications is not None:
+            return verifications, strategy
+    workers = max(1, min(max_concurrency, len(claims)))
+    # pool threads start with an empty context; carry over the trace stage and row
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        verifications: List[bool] = list(pool.map(
+            lambda claim: context.copy().run(_verify_claim, backend, table_for(claim), claim, temperature, model),
+            claims
+        ))
+    return verifications, "per_claim"
+
+def call_openai_mitigation(prompt: Union[str, prompt_layout.Prompt], model: str = "gpt-4", temperature: float = 0.0, max_retries: int = 20) -> Optional[Dict[str, str]]:
+    from mtraig.helpers.schemas import AnswerRewrite
+    backend = get_backend()
+    request = build_mitigation_request(prompt, temperature=temperature, model=model)
+    cache_key, hit = cached(request, label="mitigation")
+    if hit is not None:
+        return {"answer": AnswerRewrite.model_validate_json(hit).answer}
+    def attempt():
+        content = backend.json_rewrite(request)
+        return AnswerRewrite.model_validate_json(content), content
+    try:
+        parsed, content = retry.call_with_retry(attempt, model, max_attempts=max_retries, request=request, label="mitigation")
+    except Exception:
+        return None
+    llm_cache.store(cache_key, content)
+    return {"answer": parsed.answer}
+
+def get_mitigated_output(prompt: Union[str, prompt_layout.Prompt], model: str = "gpt-4", temperature: float = 0.0, max_api_retries: int = 20) -> Optional[str]:
     parsed = call_openai_mitigation(prompt, model=model, temperature=temperature, max_retries=max_api_retries)
     if parsed is None:
         return None
-    return parsed.get("answer", "").strip() or None 
\ No newline at end of file
+    return parsed.get("answer", "").strip() or None
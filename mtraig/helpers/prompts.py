@@ -49,6 +49,34 @@ Claim:
 Evaluation Form (scores ONLY):
 - Faithfulness:'''
 
+MULTI_CLAIM_VERIFICATION_PROMPT = '''You will be given a table and a numbered list of claims.
+
+Your task is to verify whether each claim is faithful to the data in the given table.
+
+Please read and follow these instructions carefully.
+
+Evaluation Criteria
+
+Faithfulness (0 or 1), judged separately for every claim
+- 0: Claim contains contradictions, inaccuracies, or information that is not explicitly supported by the table.
+- 1: Claim adheres to the table data and contains no contradictions or unsupported elements.
+
+Evaluation Steps:
+
+1. Examine the table: Identify the essential data relevant to each claim.
+2. Compare each claim: Check for contradictions, inaccuracies, or any details not supported by the table.
+3. Decide Faithfulness: For each claim, assign 1 if it fully aligns with the table data; otherwise, assign 0.
+4. Return exactly one verdict per claim, in the same order as the claims are numbered.
+
+Table:
+{table}
+
+Claims:
+{claims}
+
+Evaluation Form (scores ONLY):
+- Faithfulness verdicts:'''
+
 # ------------------------------------------------------------------------------
 # ② COARSE‑LEVEL MITIGATION PROMPT
 # ------------------------------------------------------------------------------
@@ -7,5 +7,8 @@ class ClaimDecompositionResult(BaseModel):
 class ClaimVerificationResult(BaseModel):
     faithfulness: int = Field(description="0 if the claim is unfaithful, 1 if it is faithful")
 
+class MultiClaimVerificationResult(BaseModel):
+    verdicts: List[int] = Field(description="One entry per claim, in claim order: 0 if the claim is unfaithful, 1 if it is faithful")
+
 class AnswerRewrite(BaseModel):
     answer: str 
\ No newline at end of file
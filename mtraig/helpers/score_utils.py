@@ -1,6 +1,7 @@
-import numpy as np
-import pandas as pd
-from typing import List
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 def calculate_faithfulness_score(verifications: List[bool]) -> float:
     if not verifications:
@@ -9,15 +10,6 @@ def calculate_faithfulness_score(verifications: List[bool]) -> float:
     score = 1 + (ratio * 4)
     return score
 
-def calculate_correlation(df: pd.DataFrame) -> float:
-    taus = []
-    for example_id, group in df.groupby("example_id"):
-        if len(group) < 2:
-            continue
-        from scipy.stats import pearsonr
-        r, _ = pearsonr(group["score_metric"], group["score_human"])
-        if not np.isnan(r):
-            taus.append(r)
-    if not taus:
-        return float("nan")
-    return float(np.mean(taus)) 
\ No newline at end of file
+def calculate_correlation(df: "pd.DataFrame", method: str = "pearson") -> float:
+    from common.stats import instance_correlation
+    return instance_correlation(df["score_metric"], df["score_human"], df["example_id"], method)
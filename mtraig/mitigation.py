@@ -3,45 +3,80 @@ Mitigation logic for MTRAIG approach.
 """
 
 import os
+import sys
 import json
 import logging
 from pathlib import Path
-from mtraig.helpers.mitigation_data_utils import build_mitigation_prompt, load_examples, processed_ids
+from typing import List, Optional
+from mtraig.helpers.mitigation_data_utils import build_mitigation_prompt, load_examples, mitigation_tag, processed_ids
 from mtraig.helpers.openai_utils import get_mitigated_output
+from common import rate_limit, llm_backend, llm_trace
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
 
 OUT_DIR = Path("mtraig/mitigation_outputs")
-OUT_DIR.mkdir(exist_ok=True)
 
-def run_mitigation(dataset: str, model: str = "gpt-4o-mini", max_api_retries: int = 20):
+def mitigate_example(ex: dict, model: str, max_api_retries: int = 20) -> str:
+    """
+    Revised answer for one example; the original answer if mitigation fails.
+    """
+    prompt = build_mitigation_prompt(ex)
+    with llm_trace.scope(row=ex["idx"]):
+        revised_answer = get_mitigated_output(prompt, model=model, temperature=0.0, max_api_retries=max_api_retries)
+    if revised_answer is None:
+        logging.error(f"mitigation failed for idx {ex['idx']} – keeping original.")
+        revised_answer = ex["full_answer"]
+    return revised_answer
+
+def write_mitigation(outf, idx: int, revised_answer: str):
+    json.dump({
+        "original_idx": idx,
+        "revised_answer": revised_answer
+    }, outf, ensure_ascii=False)
+    outf.write("\n")
+    outf.flush()
+
+def run_mitigation(dataset: str, model: str = "gpt-4o-mini", max_api_retries: int = 20, mitigation_model: Optional[str] = None):
+    """
+    Rewrites the flagged answers of `model`'s detection run; `mitigation_model`
+    (default: `model`) is the model that writes the revisions, and another
+    model's revisions go to their own file (see mitigation_tag).
+    """
     examples  = load_examples(dataset, model)
-    out_path  = OUT_DIR / f"{model}_{dataset}.jsonl"
-    done_ids  = processed_ids(dataset, model)
+    out_path  = OUT_DIR / f"{model}_{dataset}{mitigation_tag(model, mitigation_model)}.jsonl"
+    done_ids  = processed_ids(dataset, model, mitigation_model)
 
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
     with out_path.open("a", encoding="utf-8") as outf:
         for ex in examples:
             if ex["idx"] in done_ids:
                 continue
             logging.info(f"[{dataset}] mitigating idx {ex['idx']}  ({len(done_ids)+1}/{len(examples)})")
-            prompt = build_mitigation_prompt(ex)
-            revised_answer = get_mitigated_output(prompt, model=model, temperature=0.0, max_api_retries=max_api_retries)
-            if revised_answer is None:
-                logging.error(f"[{dataset}] mitigation failed – keeping original.")
-                revised_answer = ex["full_answer"]
-            json.dump({
-                "original_idx": ex["idx"],
-                "revised_answer": revised_answer
-            }, outf, ensure_ascii=False)
-            outf.write("\n")
-            outf.flush()
+            write_mitigation(outf, ex["idx"], mitigate_example(ex, mitigation_model or model, max_api_retries=max_api_retries))
             done_ids.add(ex["idx"])
     logging.info(f"Mitigation finished – total processed: {len(done_ids)}")
 
-if __name__ == "__main__":
+def main(argv: Optional[List[str]] = None):
     import argparse
     parser = argparse.ArgumentParser(description="Run MT-RAIG mitigation pipeline.")
     parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
     parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
-    args = parser.parse_args()
-    run_mitigation(args.dataset, args.model) 
\ No newline at end of file
+    parser.add_argument('--mitigation_model', type=str, default=None, help="Model that rewrites the answers (default: --model)")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("mtraig.mitigation")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.mitigation_model or args.model, args.rpm, args.tpm)
+    try:
+        run_mitigation(args.dataset, args.model, mitigation_model=args.mitigation_model)
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; revised answers so far are saved, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Streaming MT-RAIG pipeline: detection → mitigation → automated evaluation per row.
+
+Rows flow through the three stages over bounded queues, so a row with false
+claims is mitigated and re-evaluated while later rows are still being
+detected. Every stage reads and writes the same checkpoints as the standalone
+scripts, so a run resumes per row and per stage, and the standalone scripts
+can pick up where it stopped.
+"""
+
+import logging
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from mtraig import detection, mitigation
+from mtraig import automated_eval as ae
+from mtraig.helpers.data_utils import load_human_faith_scores
+from mtraig.helpers.mitigation_data_utils import make_example, revised_answers
+from mtraig.helpers.openai_utils import DEFAULT_MAX_CONCURRENCY, VERIFICATION_STRATEGIES, DEFAULT_VERIFICATION_STRATEGY
+from common import rate_limit, llm_backend, llm_trace
+from common.streaming import Stage, run_stages, DEFAULT_QUEUE_SIZE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+
+
+def run_pipeline(
+    dataset: str,
+    model: str = "gpt-4o-mini",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    verification_strategy: str = DEFAULT_VERIFICATION_STRATEGY,
+    detect_workers: int = 2,
+    mitigate_workers: int = 2,
+    eval_workers: int = 2,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    max_api_retries: int = 20,
+    reeval_mode: str = ae.DEFAULT_REEVAL_MODE
+) -> Tuple[float, Dict[str, int]]:
+    """
+    Run detection, mitigation and automated evaluation as overlapping stages.
+    Returns the detection correlation and the number of rows each stage handled.
+    """
+    tag = f"{model}_{dataset}"
+    temperature = 0.0
+    os.makedirs(detection.CHECKPOINT_DIR, exist_ok=True)
+    os.makedirs(detection.RESULTS_DIR, exist_ok=True)
+
+    df, human_faith = load_human_faith_scores(f"model_outputs_with_scores_{dataset}.json")
+    total = len(df)
+    det_store = detection.open_detection_store(os.path.join(detection.CHECKPOINT_DIR, f"{tag}.json"), total)
+    mitigation.OUT_DIR.mkdir(parents=True, exist_ok=True)
+    mit_path = mitigation.OUT_DIR / f"{tag}.jsonl"
+    revised = revised_answers(dataset, model)
+    ae_store = ae.open_automated_eval_store(ae.AE_CKPT_DIR / f"{tag}.json")
+    logging.info(
+        f"[{dataset}] resuming with {len(det_store.entries)} detected, "
+        f"{len(revised)} mitigated, {len(ae_store.entries)} re-evaluated rows"
+    )
+
+    mit_lock = threading.Lock()
+    run_old_scores, run_new_scores = [], []
+
+    def detect(idx: int) -> Optional[Tuple[dict, dict]]:
+        result = det_store.get(str(idx))
+        if detection.needs_redo(result):
+            logging.info(f"[detect] idx={idx}")
+            with llm_trace.scope(stage="mtraig.detection", row=idx):
+                result = detection.detect_row(
+                    df.iloc[idx], human_faith[idx], model, temperature=temperature,
+                    max_concurrency=max_concurrency, verification_strategy=verification_strategy
+                )
+            det_store.put(str(idx), result)
+        example = make_example(idx, df.iloc[idx], result, dataset)
+        return (example, result) if example is not None else None
+
+    def mitigate(item: Tuple[dict, dict]) -> Tuple[int, str, dict]:
+        example, result = item
+        idx = example["idx"]
+        with mit_lock:
+            revised_answer = revised.get(idx)
+        if revised_answer is None:
+            logging.info(f"[mitigate] idx={idx}")
+            with llm_trace.scope(stage="mtraig.mitigation"):
+                revised_answer = mitigation.mitigate_example(example, model, max_api_retries=max_api_retries)
+            with mit_lock, mit_path.open("a", encoding="utf-8") as outf:
+                mitigation.write_mitigation(outf, idx, revised_answer)
+                revised[idx] = revised_answer
+        return idx, revised_answer, result
+
+    def reevaluate(item: Tuple[int, str, dict]) -> None:
+        idx, revised_answer, result = item
+        old = result["faithfulness_score"]
+        if old >= 5 or str(idx) in ae_store:
+            return None
+        logging.info(f"[re-evaluate] idx={idx}")
+        with llm_trace.scope(stage="mtraig.automated_eval", row=idx):
+            entry, _ = ae.reevaluate_row(
+                df.iloc[idx], idx, ae._revised_text({"revised_answer": revised_answer}), old, model,
+                temperature=temperature, max_concurrency=max_concurrency,
+                verification_strategy=verification_strategy,
+                previous=result, reeval_mode=reeval_mode
+            )
+        ae_store.put(str(idx), entry)
+        with mit_lock:
+            run_old_scores.append(old)
+            run_new_scores.append(entry["new_score"])
+        return None
+
+    try:
+        handled = run_stages(range(total), [
+            Stage("detect", detect, detect_workers),
+            Stage("mitigate", mitigate, mitigate_workers),
+            Stage("re-evaluate", reevaluate, eval_workers),
+        ], queue_size=queue_size)
+    finally:
+        det_store.close()
+        ae_store.close()
+
+    instance_r = detection.write_correlation(
+        df, human_faith, det_store, os.path.join(detection.RESULTS_DIR, f"{tag}.txt")
+    )
+    old_scores = [det_store.get(str(i), {}).get("faithfulness_score", 1.0) for i in range(total)]
+    if ae_store.entries:
+        ae.write_summary(
+            dataset, old_scores, list(ae_store.entries.values()),
+            run_old_scores, run_new_scores, ae.RESULTS_DIR / f"{tag}.txt"
+        )
+    logging.info(f"[{dataset}] pipeline finished: {handled}")
+    return instance_r, handled
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Run MT-RAIG detection, mitigation and automated evaluation as one streaming pipeline.")
+    parser.add_argument('--dataset', type=str, default='fetaqa', help="Dataset name (fetaqa or qtsumm)")
+    parser.add_argument('--model', type=str, default='gpt-4o-mini', help="Model name (e.g., gpt-4o-mini)")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--max_concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY, help="Maximum claim verifications in flight per row")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute limit for the model (default: unlimited)")
+    parser.add_argument('--verification_strategy', type=str, default=DEFAULT_VERIFICATION_STRATEGY, choices=list(VERIFICATION_STRATEGIES), help="Verify claims one request each (per_claim) or all claims of a row in one request (single_pass)")
+    parser.add_argument('--detect_workers', type=int, default=2, help="Rows detected concurrently")
+    parser.add_argument('--mitigate_workers', type=int, default=2, help="Rows mitigated concurrently")
+    parser.add_argument('--eval_workers', type=int, default=2, help="Rows re-evaluated concurrently")
+    parser.add_argument('--queue_size', type=int, default=DEFAULT_QUEUE_SIZE, help="Rows buffered between stages")
+    parser.add_argument('--reeval_mode', type=str, default=ae.DEFAULT_REEVAL_MODE, choices=list(ae.REEVAL_MODES), help="Score revised answers in full, or only the sentences that differ from the original (diff)")
+    parser.add_argument('--max_cost', type=float, default=None, help="Stop once the run's estimated LLM cost reaches this many USD (default: $LLM_COST_BUDGET or unlimited)")
+    args = parser.parse_args(argv)
+    llm_backend.set_backend(args.llm_backend)
+    llm_trace.start_run("mtraig.pipeline")
+    llm_trace.set_cost_budget(args.max_cost)
+    rate_limit.set_rate_limit(args.model, args.rpm, args.tpm)
+    try:
+        run_pipeline(
+            args.dataset, args.model,
+            max_concurrency=args.max_concurrency,
+            verification_strategy=args.verification_strategy,
+            detect_workers=args.detect_workers,
+            mitigate_workers=args.mitigate_workers,
+            eval_workers=args.eval_workers,
+            queue_size=args.queue_size,
+            reeval_mode=args.reeval_mode
+        )
+    except llm_trace.CostBudgetExceeded as err:
+        logging.error(f"{err}; finished rows are checkpointed, rerun with a higher --max_cost to continue")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+Run every detection, mitigation and automated-evaluation job for the results table.
+
+Jobs form a DAG per (dataset, model):
+
+    mtraig.detection → mtraig.mitigation → mtraig.automated_eval
+    g_eval.detection (faithfulness, completeness) → g_eval.mitigation normal
+        → g_eval.automated_eval normal (faithfulness, completeness)
+    g_eval.mitigation oracle → g_eval.automated_eval oracle (faithfulness, completeness)
+
+Independent jobs run in parallel subprocesses (`python -m <module> ...`), at most
+`--jobs` at a time. `--rpm`/`--tpm` are budgets per model shared by all jobs
+calling that model: every job gets the full budget and RATE_LIMIT_DIR pointing
+at `.driver_state/rate_limits`, so they draw from one file-locked bucket per
+model (see common/rate_limit.py). Mitigation jobs run with `--mitigation_model`
+draw from that model's bucket. Where file locks are unavailable, the budget is
+instead split statically over the job slots each model can occupy. Each job's
+output goes to `.driver_state/logs/<job>.log`.
+
+With `--mitigation_model`, mitigation outputs and the automated evaluations of
+them are kept in files (and jobs) of their own, named `..._by_<model>`.
+
+A job records its command line and LLM backend in `.driver_state/<job>.json`
+when it starts, and the size and mtime of its inputs and outputs when it
+finishes successfully. On the next run it is skipped while all of those are
+unchanged; when an upstream job rewrites its outputs, the jobs after it run
+again (and resume from their own checkpoints). When the command line or
+backend changed (e.g. a `--llm_backend mock` run before a real one), the
+outputs left by the old configuration are moved to `.driver_state/stale/`
+first, so the job starts fresh instead of resuming them. `--force` reruns
+everything. While jobs run, a table with each job's state, elapsed time and
+rows per minute (checkpoint journal and mitigation lines written) is printed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from common.checkpoint import journal_path
+
+REPO_ROOT = Path(__file__).resolve().parent
+STATE_DIR = REPO_ROOT / ".driver_state"
+DATASETS = ["fetaqa", "qtsumm"]
+MODELS = ["gpt-4o-mini", "gpt-4o"]
+PIPELINES = ["mtraig", "g_eval"]
+METRICS = ["faithfulness", "completeness"]
+
+
+@dataclass
+class Job:
+    name: str
+    module: str
+    args: List[str]
+    model: str  # the model the job calls, whose rate budget it draws from
+    inputs: List[Path]
+    outputs: List[Path]
+    deps: List[str] = field(default_factory=list)
+    state: str = "pending"  # pending, skipped, running, done, failed, blocked
+    process: Optional[subprocess.Popen] = None
+    started: float = 0.0
+    finished: float = 0.0
+    rows: int = 0
+    _line_counts: Dict[str, int] = field(default_factory=dict)
+
+
+def build_jobs(
+    datasets: List[str],
+    models: List[str],
+    pipelines: List[str],
+    mitigation_model: Optional[str] = None
+) -> Dict[str, Job]:
+    jobs: List[Job] = []
+    for dataset in datasets:
+        data_file = REPO_ROOT / "data" / "outputs" / f"model_outputs_with_scores_{dataset}.json"
+        for model in models:
+            tag = f"{model}_{dataset}"
+            base = ["--dataset", dataset, "--model", model]
+            mit_model = mitigation_model or model
+            # another model's revisions get files of their own (see mitigation_utils.mitigation_tag)
+            mit_tag = tag + (f"_by_{mitigation_model}" if mitigation_model and mitigation_model != model else "")
+            mit_base = base + (["--mitigation_model", mitigation_model] if mitigation_model else [])
+            if "mtraig" in pipelines:
+                jobs += [
+                    Job(f"mtraig.detection:{tag}", "mtraig.detection", base, model,
+                        inputs=[data_file],
+                        outputs=[REPO_ROOT / "mtraig" / "faithfulness_scores" / f"{tag}.json",
+                                 REPO_ROOT / "results" / "mtraig_correlation" / f"{tag}.txt"]),
+                    Job(f"mtraig.mitigation:{mit_tag}", "mtraig.mitigation", mit_base, mit_model,
+                        inputs=[data_file],
+                        outputs=[REPO_ROOT / "mtraig" / "mitigation_outputs" / f"{mit_tag}.jsonl"],
+                        deps=[f"mtraig.detection:{tag}"]),
+                    Job(f"mtraig.automated_eval:{mit_tag}", "mtraig.automated_eval", mit_base, model,
+                        inputs=[data_file],
+                        outputs=[REPO_ROOT / "mtraig" / "automated_eval_checkpoints" / f"{mit_tag}.json",
+                                 REPO_ROOT / "results" / "mtraig_automated_eval" / f"{mit_tag}.txt"],
+                        deps=[f"mtraig.mitigation:{mit_tag}", f"mtraig.detection:{tag}"]),
+                ]
+            if "g_eval" in pipelines:
+                detections = [f"g_eval.detection:{m}:{tag}" for m in METRICS]
+                jobs += [
+                    Job(f"g_eval.detection:{m}:{tag}", "g_eval.detection", base + ["--mode", m], model,
+                        inputs=[data_file],
+                        outputs=[REPO_ROOT / "g_eval" / f"{m}_scores" / f"{tag}.json",
+                                 REPO_ROOT / "results" / f"g_eval_{m}_correlation" / f"{tag}.txt"])
+                    for m in METRICS
+                ]
+                for kind in ["normal", "oracle"]:
+                    mitigation = f"g_eval.mitigation:{kind}:{mit_tag}"
+                    # oracle mitigation starts from the human scores, not from detection
+                    upstream = detections if kind == "normal" else []
+                    jobs.append(Job(mitigation, "g_eval.mitigation", mit_base + ["--kind", kind], mit_model,
+                                    inputs=[data_file],
+                                    outputs=[REPO_ROOT / "g_eval" / "mitigation_outputs" / kind / f"{mit_tag}.jsonl"],
+                                    deps=upstream))
+                    jobs += [
+                        Job(f"g_eval.automated_eval:{kind}:{m}:{mit_tag}", "g_eval.automated_eval",
+                            mit_base + ["--type", kind, "--mode", m], model,
+                            inputs=[data_file],
+                            outputs=[REPO_ROOT / "g_eval" / "automated_eval_checkpoints" / kind / m / f"{mit_tag}.json",
+                                     REPO_ROOT / "results" / "geval_automated_eval" / kind / m / f"{mit_tag}.txt"],
+                            deps=[mitigation] + upstream)
+                        for m in METRICS
+                    ]
+    return {job.name: job for job in jobs}
+
+
+# --- up-to-date checks ---
+
+def _fingerprint(paths: List[Path]) -> Dict[str, Optional[List[int]]]:
+    prints = {}
+    for p in paths:
+        try:
+            st = p.stat()
+            prints[str(p.relative_to(REPO_ROOT))] = [st.st_mtime_ns, st.st_size]
+        except FileNotFoundError:
+            prints[str(p.relative_to(REPO_ROOT))] = None
+    return prints
+
+
+def _stamp_path(job: Job) -> Path:
+    return STATE_DIR / f"{job.name.replace(':', '__')}.json"
+
+
+def _watched(job: Job, jobs: Dict[str, Job]) -> List[Path]:
+    return job.inputs + [p for dep in job.deps for p in jobs[dep].outputs]
+
+
+def job_config(job: Job) -> str:
+    """
+    Hash of what decides a job's outputs besides its inputs: the command line
+    (rate limits aside) and the LLM backend its process will use.
+    """
+    from common.llm_backend import backend_name
+    config = {"command": [job.module, *job.args], "backend": backend_name()}
+    if config["backend"] == "record":
+        config["record_from"] = os.getenv("LLM_RECORD_FROM")
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _read_stamp(job: Job) -> dict:
+    try:
+        with _stamp_path(job).open() as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def up_to_date(job: Job, jobs: Dict[str, Job]) -> bool:
+    stamp = _read_stamp(job)
+    outputs = _fingerprint(job.outputs)
+    return (
+        stamp.get("config") == job_config(job) and
+        all(v is not None for v in outputs.values()) and
+        stamp.get("inputs") == _fingerprint(_watched(job, jobs)) and
+        stamp.get("outputs") == outputs
+    )
+
+
+def _write_stamp_file(job: Job, stamp: dict):
+    STATE_DIR.mkdir(exist_ok=True)
+    tmp = _stamp_path(job).with_suffix(".tmp")
+    with tmp.open("w") as f:
+        json.dump(stamp, f, indent=2)
+    os.replace(tmp, _stamp_path(job))
+
+
+def write_stamp(job: Job, jobs: Dict[str, Job]):
+    _write_stamp_file(job, {
+        "config": job_config(job),
+        "inputs": _fingerprint(_watched(job, jobs)),
+        "outputs": _fingerprint(job.outputs),
+        "seconds": round(job.finished - job.started, 1),
+    })
+
+
+def set_aside_stale_outputs(job: Job) -> List[Path]:
+    """
+    Move the outputs (and checkpoint journals) a job left under another
+    configuration to `.driver_state/stale/`, so the job does not resume them.
+    Outputs of a job never run by this driver are left alone.
+    """
+    config = _read_stamp(job).get("config")
+    if config is None or config == job_config(job):
+        return []
+    stale_dir = STATE_DIR / "stale" / f"{job.name.replace(':', '__')}.{config}.{time.strftime('%Y%m%d-%H%M%S')}"
+    moved = []
+    for p in job.outputs:
+        for f in (p, journal_path(p)):
+            if f.exists():
+                dest = stale_dir / f.relative_to(REPO_ROOT)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(f), str(dest))
+                moved.append(dest)
+    return moved
+
+
+# --- progress ---
+
+def _count_lines(path: Path) -> int:
+    try:
+        with path.open("rb") as f:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    except FileNotFoundError:
+        return 0
+
+
+def _progress_files(job: Job) -> List[Path]:
+    # rows land in the checkpoint journal (or, for mitigation, the output JSONL)
+    return [p if p.suffix == ".jsonl" else journal_path(p) for p in job.outputs if p.suffix in {".json", ".jsonl"}]
+
+
+def update_rows(job: Job):
+    for p in _progress_files(job):
+        n = _count_lines(p)
+        last = job._line_counts.get(str(p))
+        if last is not None:
+            # a compaction truncates the journal; whatever is in it now is new
+            job.rows += n - last if n >= last else n
+        job._line_counts[str(p)] = n
+
+
+def print_table(jobs: Dict[str, Job], clear: bool):
+    now = time.monotonic()
+    lines = [f"{'job':<62} {'state':<8} {'elapsed':>8} {'rows':>6} {'rows/min':>9}"]
+    for job in jobs.values():
+        if job.state == "pending":
+            continue
+        end = job.finished or now
+        elapsed = end - job.started if job.started else 0.0
+        rate = job.rows / elapsed * 60 if elapsed > 0 else 0.0
+        lines.append(
+            f"{job.name:<62} {job.state:<8} {elapsed:>7.0f}s {job.rows:>6} {rate:>9.1f}"
+        )
+    counts = {s: sum(j.state == s for j in jobs.values()) for s in ("pending", "running", "done", "skipped", "failed", "blocked")}
+    lines.append(" ".join(f"{s}={n}" for s, n in counts.items()))
+    if clear:
+        sys.stdout.write("\x1b[2J\x1b[H")
+    sys.stdout.write("\n".join(lines) + "\n\n")
+    sys.stdout.flush()
+
+
+# --- scheduling ---
+
+def rate_shares(
+    jobs: Dict[str, Job],
+    max_jobs: int,
+    rpm: Optional[float],
+    tpm: Optional[float],
+    shared: bool = True
+) -> Dict[str, List[str]]:
+    """
+    Extra CLI arguments per model. With `shared` buckets every job gets the
+    full budget, which its processes then draw from together; otherwise the
+    budget is divided by the number of job slots the model can hold at once,
+    i.e. min(--jobs, jobs calling it), a static split.
+    """
+    shares = {}
+    for model in {job.model for job in jobs.values()}:
+        slots = 1 if shared else min(max_jobs, sum(job.model == model for job in jobs.values()))
+        extra = []
+        if rpm is not None:
+            extra += ["--rpm", f"{rpm / slots:g}"]
+        if tpm is not None:
+            extra += ["--tpm", f"{tpm / slots:g}"]
+        shares[model] = extra
+    return shares
+
+
+def start(job: Job, extra: List[str], env: Optional[Dict[str, str]] = None):
+    log_dir = STATE_DIR / "logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log = (log_dir / f"{job.name.replace(':', '__')}.log").open("a")
+    for moved in set_aside_stale_outputs(job):
+        log.write(f"# moved output of a different configuration to {moved.relative_to(REPO_ROOT)}\n")
+    # recorded before the run, so a failed run's partial outputs are known too
+    _write_stamp_file(job, {"config": job_config(job)})
+    cmd = [sys.executable, "-m", job.module, *job.args, *extra]
+    log.write(f"$ {' '.join(cmd)}\n")
+    log.flush()
+    job.process = subprocess.Popen(cmd, cwd=REPO_ROOT, stdout=log, stderr=subprocess.STDOUT, env=env)
+    log.close()
+    job.state = "running"
+    job.started = time.monotonic()
+    update_rows(job)
+
+
+def run(
+    jobs: Dict[str, Job],
+    max_jobs: int = 4,
+    rpm: Optional[float] = None,
+    tpm: Optional[float] = None,
+    force: bool = False,
+    refresh: float = 5.0
+) -> bool:
+    """
+    Run the DAG to completion. Returns True if no job failed.
+    """
+    from common import rate_limit
+    shared = rate_limit.shared_limits_supported()
+    shares = rate_shares(jobs, max_jobs, rpm, tpm, shared)
+    env = None
+    if shared and (rpm is not None or tpm is not None):
+        limits_dir = STATE_DIR / "rate_limits"
+        # leftover bucket state from an earlier run holds no budget worth keeping
+        shutil.rmtree(limits_dir, ignore_errors=True)
+        env = {**os.environ, "RATE_LIMIT_DIR": str(limits_dir)}
+    clear = sys.stdout.isatty()
+    last_print = 0.0
+    try:
+        while True:
+            for job in jobs.values():
+                if job.state != "pending":
+                    continue
+                dep_states = {jobs[d].state for d in job.deps}
+                if dep_states & {"failed", "blocked"}:
+                    job.state = "blocked"
+                elif dep_states <= {"done", "skipped"}:
+                    if not force and up_to_date(job, jobs):
+                        job.state = "skipped"
+                    elif sum(j.state == "running" for j in jobs.values()) < max_jobs:
+                        start(job, shares[job.model], env)
+            for job in jobs.values():
+                if job.state != "running":
+                    continue
+                update_rows(job)
+                code = job.process.poll()
+                if code is not None:
+                    job.finished = time.monotonic()
+                    job.state = "done" if code == 0 else "failed"
+                    if code == 0:
+                        write_stamp(job, jobs)
+            active = any(j.state in ("pending", "running") for j in jobs.values())
+            if not active or time.monotonic() - last_print >= refresh:
+                print_table(jobs, clear)
+                last_print = time.monotonic()
+            if not active:
+                break
+            time.sleep(0.5)
+    finally:
+        for job in jobs.values():
+            if job.state == "running" and job.process.poll() is None:
+                job.process.terminate()
+    return not any(j.state in ("failed", "blocked") for j in jobs.values())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run all detection, mitigation and automated evaluation jobs as a parallel DAG.")
+    parser.add_argument('--datasets', nargs='+', default=DATASETS, choices=DATASETS, help="Datasets to run")
+    parser.add_argument('--models', nargs='+', default=MODELS, help="Models to run")
+    parser.add_argument('--pipelines', nargs='+', default=PIPELINES, choices=PIPELINES, help="Pipelines to run")
+    parser.add_argument('--llm_backend', type=str, default=None, help="LLM backend: openai, local, replay, record, mock or module:factory (default: $LLM_BACKEND or openai)")
+    parser.add_argument('--jobs', type=int, default=4, help="Jobs run in parallel")
+    parser.add_argument('--mitigation_model', type=str, default=None, help="Model that rewrites the answers in mitigation jobs (default: the job's --model)")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute budget per model, shared by all its running jobs through one file-locked bucket (default: unlimited)")
+    parser.add_argument('--tpm', type=float, default=None, help="Prompt-tokens-per-minute budget per model, shared like --rpm (default: unlimited)")
+    parser.add_argument('--force', action='store_true', help="Rerun jobs even when their outputs are up to date")
+    parser.add_argument('--refresh', type=float, default=5.0, help="Seconds between progress table updates")
+    parser.add_argument('--dry_run', action='store_true', help="List the jobs and whether they are up to date, without running anything")
+    args = parser.parse_args(argv)
+    # imported here so `python -m cli summary` (which reads DATASETS/MODELS) stays light
+    from common import llm_backend
+    llm_backend.set_backend(args.llm_backend)
+    jobs = build_jobs(args.datasets, args.models, args.pipelines, args.mitigation_model)
+    if args.dry_run:
+        for job in jobs.values():
+            status = "up to date" if up_to_date(job, jobs) else "to run"
+            deps = f"  (after {', '.join(job.deps)})" if job.deps else ""
+            print(f"{job.name:<62} {status}{deps}")
+        return 0
+    return 0 if run(jobs, args.jobs, args.rpm, args.tpm, args.force, args.refresh) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
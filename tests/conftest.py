@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from common import llm_backend, llm_cache
+
+
+@pytest.fixture(autouse=True)
+def offline(tmp_path, monkeypatch):
+    """
+    Every test runs on the mock LLM backend with its own response cache and
+    no dataset cache or trace files.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite"))
+    monkeypatch.setenv("LLM_TRACE_DISABLE", "1")
+    monkeypatch.setenv("DATASET_CACHE_DISABLE", "1")
+    monkeypatch.delenv("LLM_CACHE_DISABLE", raising=False)
+    monkeypatch.setattr(llm_cache, "_cache", None)
+    monkeypatch.setattr(llm_backend, "_backend", None)
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """
+    A six-row fetaqa-style dataset file in data/outputs.
+    """
+    rows = [
+        {
+            "example_id": f"ex{i // 2}",
+            "question": f"Which team scored most in {2000 + i}?",
+            "model_output": f"In {2000 + i}, Team{i} scored {10 + i} goals.",
+            "faithfulness_score": 1 + i % 5,
+            "completeness_score": 5 - i % 5,
+            "serialized_table": {
+                "title": "Goals",
+                "header": ["Year", "Team", "Goals"],
+                "rows": [[str(2000 + j), f"Team{j}", str(10 + j)] for j in range(6)]
+            }
+        }
+        for i in range(6)
+    ]
+    data_dir = tmp_path / "data" / "outputs"
+    data_dir.mkdir(parents=True)
+    (data_dir / "model_outputs_with_scores_fetaqa.json").write_text(json.dumps(rows))
+    return data_dir
@@ -0,0 +1,101 @@
+import json
+import threading
+import time
+
+import pytest
+
+from common import llm_backend, llm_cache
+from common.batch import (
+    LocalBatchBackend, batch_cache_key, get_backend, llm_responder, message_content, run_batch, run_cached_batch
+)
+from g_eval import detection
+from g_eval.helpers.scoring_modes import SCORING_MODES
+
+
+def score_request(text: str):
+    from g_eval.helpers.openai_utils import build_structured_request
+    _, schema, _ = SCORING_MODES["faithfulness"]
+    return build_structured_request(f"Table:\nT\nAnswer:\n{text}", schema, model="gpt-4o-mini")
+
+
+def test_local_backend_polls_until_output_is_written(tmp_path):
+    backend = LocalBatchBackend(root=tmp_path / "local")
+    requests = {"0": score_request("a"), "1": score_request("b")}
+
+    def provider():
+        # an external process answering the batch a little later
+        while not list((tmp_path / "local").glob("*/input.jsonl")):
+            time.sleep(0.01)
+        batch_dir = next((tmp_path / "local").iterdir())
+        time.sleep(0.1)
+        with open(batch_dir / "input.jsonl") as fin, open(batch_dir / "output.jsonl.tmp", "w") as fout:
+            for line in fin:
+                req = json.loads(line)
+                fout.write(json.dumps({"custom_id": req["custom_id"], "response": {"status_code": 200, "body": llm_responder(req["body"])}}) + "\n")
+        (batch_dir / "output.jsonl.tmp").rename(batch_dir / "output.jsonl")
+
+    writer = threading.Thread(target=provider)
+    writer.start()
+    results = run_batch(requests, backend, "poll", poll_interval=0.02, work_dir=tmp_path / "jobs")
+    writer.join()
+    assert set(results) == {"0", "1"}
+    assert json.loads(message_content(results["0"]))["faithfulness"] in range(1, 6)
+    # the batch is consumed: the next run submits a new one
+    assert not (tmp_path / "jobs" / "poll.batch_id").exists()
+
+
+def test_local_backend_without_output_expires(tmp_path):
+    backend = LocalBatchBackend(root=tmp_path / "local", expire_after=0.05)
+    results = run_batch({"0": score_request("a")}, backend, "expire", poll_interval=0.02, work_dir=tmp_path / "jobs")
+    assert results == {}
+    assert not (tmp_path / "jobs" / "expire.batch_id").exists()
+
+
+def test_cli_local_backend_answers_through_llm_backend():
+    backend = get_backend("local")
+    assert backend.responder is llm_responder
+    results = run_cached_batch(
+        {"0": score_request("a")}, extract=message_content, parse=json.loads,
+        backend=backend, tag="cli", poll_interval=0
+    )
+    assert set(results) == {"0"}
+
+
+def test_local_responses_stay_out_of_the_api_cache(tmp_path):
+    request = score_request("a")
+    backend = LocalBatchBackend(root=tmp_path / "local", responder=llm_responder)
+    run_cached_batch({"0": request}, extract=message_content, parse=json.loads, backend=backend, tag="cache", poll_interval=0)
+    assert llm_cache.lookup(batch_cache_key(request, backend)) is not None
+    assert llm_cache.lookup(llm_cache.make_key(**request)) is None
+    assert llm_cache.lookup(llm_backend.cache_key(request)) is None
+
+
+def test_partial_failure_falls_back_to_synchronous_calls(tmp_path, dataset_dir):
+    submitted = []
+
+    def flaky(body):
+        submitted.append(body)
+        if len(submitted) % 2 == 0:
+            raise RuntimeError("server error")
+        return llm_responder(body)
+
+    backend = LocalBatchBackend(root=tmp_path / "local", responder=flaky)
+    correlations = detection.evaluate(
+        "fetaqa", mode="both", data_dir=str(dataset_dir),
+        checkpoint_dir=str(tmp_path / "ck"), results_dir=str(tmp_path / "res"),
+        batch_backend=backend, poll_interval=0
+    )
+    assert len(submitted) == 6
+    assert set(correlations) == {"faithfulness", "completeness"}
+    # every row is scored: half by the batch, the failed half synchronously
+    for metric in ("faithfulness", "completeness"):
+        ck = json.loads((tmp_path / "ck" / metric / "gpt-4o-mini_fetaqa.json").read_text())
+        assert ck["last_idx"] == 5
+        assert all(score in range(1, 6) for score in ck[f"{metric}_scores"])
+
+    # a greedy run from scratch scores the same
+    sync = detection.evaluate(
+        "fetaqa", mode="both", data_dir=str(dataset_dir),
+        checkpoint_dir=str(tmp_path / "ck_sync"), results_dir=str(tmp_path / "res_sync")
+    )
+    assert sync == pytest.approx(correlations, nan_ok=True)
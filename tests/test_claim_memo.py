@@ -0,0 +1,35 @@
+import pytest
+
+from mtraig.helpers import claim_memo
+from mtraig.helpers.openai_utils import verify_claims
+
+TABLE = {"title": "Goals", "header": ["Year", "Team", "Goals"], "rows": [["2000", "Team0", "27"], ["2001", "Team1", "12"]]}
+CLAIMS = ["Team0 scored 27 goals in 2000.", "Team1 scored 12 goals in 2001."]
+
+
+@pytest.fixture
+def memo(tmp_path, monkeypatch):
+    monkeypatch.setenv("CLAIM_MEMO_PATH", str(tmp_path / "memo.sqlite"))
+    monkeypatch.delenv("CLAIM_MEMO_DISABLE", raising=False)
+    monkeypatch.delenv("CLAIM_MEMO_NEAR_DUP", raising=False)
+    monkeypatch.setattr(claim_memo, "_memo", None)
+    yield lambda: claim_memo.get_memo()
+
+
+def test_verdicts_are_reused_only_under_the_same_settings(memo):
+    verify_claims(TABLE, CLAIMS, strategy="per_claim")
+    assert memo().stats()["misses"] == 2
+    for strategy, temperature in (("single_pass", 0.0), ("per_claim", 0.7)):
+        verify_claims(TABLE, CLAIMS, strategy=strategy, temperature=temperature)
+    assert memo().stats()["exact_hits"] == 0
+    verify_claims(TABLE, CLAIMS, strategy="per_claim")
+    assert memo().stats()["exact_hits"] == 2
+
+
+def test_near_duplicate_reuse_is_listed(memo, monkeypatch):
+    monkeypatch.setenv("CLAIM_MEMO_NEAR_DUP", "0.5")
+    verify_claims(TABLE, CLAIMS[:1])
+    verify_claims(TABLE, ["In 2000, Team0 scored 27 goals."])
+    assert memo().stats()["near_dup_hits"] == 1
+    lines = claim_memo.summary_lines()
+    assert any("team0 scored 27 goals in 2000" in line for line in lines)
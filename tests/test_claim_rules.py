@@ -0,0 +1,80 @@
+import pytest
+
+from mtraig.helpers import claim_rules
+from mtraig.helpers.claim_rules import ClaimChecker, PreVerifyStats, merge_verdicts, split_claims
+
+TABLE = {
+    "title": "Goals",
+    "header": ["Player", "Goals", "Year", "Club"],
+    "rows": [
+        ["John Smith", "20", "2005", "Arsenal"],
+        ["Mike Jones", "15", "2005", "Chelsea"],
+        ["Bob Lee", "7", "2006", "Leeds"],
+    ]
+}
+
+
+@pytest.fixture
+def checker():
+    return ClaimChecker(TABLE)
+
+
+@pytest.mark.parametrize("claim, verdict", [
+    ("John Smith scored 20 goals", True),
+    ("John Smith scored 20 goals for Arsenal", True),
+    ("Mike Jones scored 15 goals in 2005", True),
+    ("John Smith scored 25 goals in 2005", False),
+    # values from another row: the claim may be about either row
+    ("John Smith scored 20 goals for Chelsea", None),
+    ("Mike Jones, who plays for Leeds, scored 15 goals", None),
+])
+def test_lookup(checker, claim, verdict):
+    assert checker.check(claim) == (verdict, "lookup")
+
+
+@pytest.mark.parametrize("claim, verdict", [
+    ("John Smith had the highest goals", True),
+    ("Bob Lee had the highest goals", False),
+    ("Bob Lee had the lowest goals", True),
+    # qualifiers narrow the compared rows
+    ("Bob Lee had the highest goals for Leeds", None),
+    ("Bob Lee had the highest goals in the league", None),
+])
+def test_superlative(checker, claim, verdict):
+    assert checker.check(claim) == (verdict, "superlative")
+
+
+def test_risky_claims_are_deferred(checker):
+    assert checker.check("John Smith scored more goals than Bob Lee") == (None, None)
+    assert checker.check("John Smith scored 20 goals for Barcelona") == (None, None)
+
+
+def test_on_mode_skips_the_llm_for_decided_claims(monkeypatch):
+    monkeypatch.setenv("CLAIM_PRE_VERIFY", "on")
+    monkeypatch.setattr(claim_rules, "_stats", PreVerifyStats())
+    claims = ["John Smith scored 20 goals", "John Smith scored 20 goals for Chelsea"]
+    decisions, pending = split_claims(TABLE, claims)
+    assert pending == [1]
+    assert merge_verdicts(claims, decisions, pending, [False]) == [True, False]
+
+
+def test_audit_mode_sends_every_claim_and_reports_agreement(monkeypatch):
+    monkeypatch.setenv("CLAIM_PRE_VERIFY", "audit")
+    monkeypatch.setattr(claim_rules, "_stats", PreVerifyStats())
+    claims = ["John Smith scored 20 goals", "Bob Lee had the highest goals", "Bob Lee had the highest goals for Leeds"]
+    decisions, pending = split_claims(TABLE, claims)
+    assert pending == [0, 1, 2]
+    # the LLM verdicts win; the second disagrees with the local one
+    assert merge_verdicts(claims, decisions, pending, [True, True, True]) == [True, True, True]
+    stats = claim_rules.stats()
+    assert stats["claims"] == 3 and stats["decided_locally"] == 2 and stats["deferred"] == 1
+    assert stats["audited"] == 2 and stats["agreement"] == 0.5
+    assert stats["disagreements"] == [
+        {"claim": "Bob Lee had the highest goals", "rule": "superlative", "local": False, "llm": True}
+    ]
+
+
+def test_unknown_mode_is_rejected(monkeypatch):
+    monkeypatch.setenv("CLAIM_PRE_VERIFY", "maybe")
+    with pytest.raises(ValueError):
+        split_claims(TABLE, ["John Smith scored 20 goals"])
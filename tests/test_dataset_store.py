@@ -0,0 +1,55 @@
+import json
+import multiprocessing
+
+from common import dataset_store
+from common.dataset_store import DatasetStore
+
+
+def _load_all(path, cache_dir, rounds, errors):
+    import os
+    os.environ["DATASET_CACHE_DIR"] = cache_dir
+    os.environ.pop("DATASET_CACHE_DISABLE", None)
+    try:
+        for _ in range(rounds):
+            store = DatasetStore(path)
+            for name in store.columns:
+                store.tolist(name)
+            store.derived_column("width", len, source="serialized_table")
+    except Exception as err:
+        errors.put(repr(err))
+
+
+def test_parallel_builds_keep_every_column(tmp_path, dataset_dir):
+    path = dataset_dir / "model_outputs_with_scores_fetaqa.json"
+    cache_dir = str(tmp_path / "cache")
+    ctx = multiprocessing.get_context("spawn")
+    errors = ctx.Queue()
+    workers = [ctx.Process(target=_load_all, args=(str(path), cache_dir, 5, errors)) for _ in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert errors.empty(), errors.get()
+    (store_dir,) = [d for d in (tmp_path / "cache").iterdir() if d.is_dir()]
+    manifest = json.loads((store_dir / dataset_store.MANIFEST).read_text())
+    files = [spec["file"] for spec in (*manifest["columns"].values(), *manifest["derived"].values())]
+    assert all((store_dir / f).exists() for f in files)
+
+
+def _derivation(body: str):
+    namespace = {"__name__": "tests.derivations"}
+    exec(f"def table_title(table):\n    return {body}\n", namespace)
+    return namespace["table_title"]
+
+
+def test_edited_derivation_is_recomputed(tmp_path, dataset_dir, monkeypatch):
+    monkeypatch.setenv("DATASET_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("DATASET_CACHE_DISABLE")
+    path = dataset_dir / "model_outputs_with_scores_fetaqa.json"
+    before = DatasetStore(path).derived_column("title", _derivation("table['title']"), source="serialized_table")
+    after = DatasetStore(path).derived_column("title", _derivation("table['title'].upper()"), source="serialized_table")
+    assert before[0] == "Goals" and after[0] == "GOALS"
+    # the reloaded store serves the new version from disk, and only that one is kept
+    store = DatasetStore(path)
+    assert store.derived_column("title", _derivation("table['title'].upper()"), source="serialized_table")[0] == "GOALS"
+    assert len(store._manifest["derived"]) == 1
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from common import openai_client
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def finish(self):
+        super().finish()
+        with self.server.lock:
+            self.server.closed += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.requests += 1
+        body = json.dumps({
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ChatHandler)
+    httpd.lock = threading.Lock()
+    httpd.connections = 0
+    httpd.closed = 0
+    httpd.requests = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{httpd.server_address[1]}/v1")
+    openai_client.reset_clients()
+    yield httpd
+    openai_client.reset_clients()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_get_client_reuses_one_connection(server):
+    for _ in range(5):
+        response = openai_client.get_client().chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}]
+        )
+        assert response.choices[0].message.content == "ok"
+    assert openai_client.get_client() is openai_client.get_client()
+    assert server.requests == 5
+    assert server.connections == 1
+
+
+def test_reset_clients_builds_a_new_client(server):
+    first = openai_client.get_client()
+    first.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+    openai_client.reset_clients()
+    second = openai_client.get_client()
+    assert second is not first
+    second.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}])
+    assert server.connections == 2
+
+
+async def _ask_async(n):
+    clients = set()
+    for _ in range(n):
+        client = openai_client.get_async_client()
+        clients.add(client)
+        response = await client.chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}]
+        )
+        assert response.choices[0].message.content == "ok"
+    return clients
+
+
+def _wait_closed(server, count):
+    deadline = time.monotonic() + 5
+    while server.closed < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return server.closed
+
+
+def test_get_async_client_reuses_one_connection(server):
+    loop = asyncio.new_event_loop()
+    try:
+        assert len(loop.run_until_complete(_ask_async(5))) == 1
+        assert server.requests == 5
+        assert server.connections == 1
+        clients = loop.run_until_complete(_ask_async(1))
+        assert server.connections == 1
+        openai_client.reset_clients()
+        assert _wait_closed(server, 1) == 1
+        assert loop.run_until_complete(_ask_async(1)).isdisjoint(clients)
+        assert server.connections == 2
+    finally:
+        openai_client.reset_clients()
+        loop.close()
+
+
+def test_reset_clients_closes_async_client_on_a_running_loop(server):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        asyncio.run_coroutine_threadsafe(_ask_async(3), loop).result(timeout=10)
+        assert server.connections == 1
+        openai_client.reset_clients()
+        assert _wait_closed(server, 1) == 1
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+def test_get_async_client_builds_one_client_per_loop(server):
+    first = asyncio.run(_ask_async(2))
+    second = asyncio.run(_ask_async(2))
+    assert first.isdisjoint(second)
+    assert server.connections == 2
@@ -0,0 +1,15 @@
+from g_eval.helpers.openai_utils import build_structured_request
+from g_eval.helpers.scoring_modes import SCORING_MODES
+
+
+def test_structured_request_uses_a_strict_json_schema():
+    _, schema, fields = SCORING_MODES["both"]
+    request = build_structured_request("prompt", schema, model="gpt-4o-mini")
+    response_format = request["response_format"]
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["name"] == "FaithfulnessCompletenessScore"
+    assert response_format["json_schema"]["strict"] is True
+    body = response_format["json_schema"]["schema"]
+    assert sorted(body["required"]) == sorted(fields)
+    assert body["additionalProperties"] is False
+    assert all(prop["type"] == "integer" for prop in body["properties"].values())
@@ -0,0 +1,36 @@
+import multiprocessing
+import time
+
+import pytest
+
+from common import rate_limit
+
+
+def _draw(limits_dir: str, n: int):
+    import os
+    os.environ["RATE_LIMIT_DIR"] = limits_dir
+    rate_limit.set_rate_limit("gpt-4o-mini", 600)
+    for _ in range(n):
+        rate_limit.acquire("gpt-4o-mini")
+
+
+@pytest.mark.skipif(not rate_limit.shared_limits_supported(), reason="needs fcntl")
+def test_processes_share_one_budget(tmp_path):
+    # 600 rpm = 10 per second with a burst of 10: 30 requests over two
+    # processes need about 2 s together, but only 0.5 s each if not shared
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_draw, args=(str(tmp_path / "limits"), 15)) for _ in range(2)]
+    started = time.monotonic()
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert all(p.exitcode == 0 for p in procs)
+    assert time.monotonic() - started >= 1.8
+
+
+def test_without_dir_buckets_stay_in_process(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_DIR", raising=False)
+    rate_limit.set_rate_limit("gpt-4o-mini", 600)
+    assert isinstance(rate_limit._buckets["gpt-4o-mini"], rate_limit.TokenBucket)
+    rate_limit.set_rate_limit("gpt-4o-mini", None)
@@ -0,0 +1,68 @@
+import pytest
+
+from common import llm_trace, retry
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    monkeypatch.setenv("RETRY_BASE_DELAY", "0")
+    monkeypatch.setattr(retry, "PARSE_RETRY_DELAY", 0.0)
+    monkeypatch.setattr(llm_trace, "_budget", None)
+    return llm_trace.start_run("test")
+
+
+def _billed_call(failures, error=ValueError):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        llm_trace.report_usage(100, 10, 20)
+        if len(calls) <= failures:
+            raise error("unparseable")
+        return "ok"
+    return fn
+
+
+def test_usage_of_failed_attempts_is_recorded(trace):
+    assert retry.call_with_retry(_billed_call(2), "gpt-4o-mini", label="call") == "ok"
+    total = trace.summary()["total"]
+    assert (total["calls"], total["retries"], total["failed"]) == (1, 2, 0)
+    assert (total["tokens_in"], total["tokens_out"], total["tokens_cached"]) == (300, 30, 60)
+    assert total["estimated_tokens"] is False
+    assert total["cost_usd"] == round(llm_trace.call_cost("gpt-4o-mini", 300, 30, 60), 4)
+
+
+def test_give_up_is_charged_for_its_attempts(trace):
+    with pytest.raises(ValueError):
+        retry.call_with_retry(_billed_call(5), "gpt-4o-mini", label="call")
+    total = trace.summary()["total"]
+    assert (total["failed"], total["tokens_in"], total["tokens_out"]) == (1, 300, 30)
+    assert trace.spent == pytest.approx(llm_trace.call_cost("gpt-4o-mini", 300, 30, 60))
+
+
+def test_failed_calls_count_toward_the_budget(trace):
+    llm_trace.set_cost_budget(trace.spent + 1e-9)
+    with pytest.raises(ValueError):
+        retry.call_with_retry(_billed_call(5), "gpt-4o-mini", label="call")
+    with pytest.raises(llm_trace.CostBudgetExceeded):
+        retry.call_with_retry(_billed_call(0), "gpt-4o-mini", label="call")
+
+
+def test_usage_left_by_an_earlier_call_is_not_charged(trace):
+    llm_trace.report_usage(1000, 1000)
+    retry.call_with_retry(lambda: "ok", "gpt-4o-mini", label="call")
+    total = trace.summary()["total"]
+    assert total["tokens_out"] == 0
+    assert total["estimated_tokens"] is True
+
+
+def test_detection_exits_cleanly_on_the_budget(dataset_dir, monkeypatch):
+    from mtraig import detection
+
+    def over_budget(*args, **kwargs):
+        raise llm_trace.CostBudgetExceeded("estimated LLM spend $1.0000 reached the budget of $1.0000")
+    monkeypatch.setattr(detection, "evaluate", over_budget)
+    monkeypatch.setattr(llm_trace, "_budget", None)
+    with pytest.raises(SystemExit) as exit_info:
+        detection.main(["--llm_backend", "mock", "--max_cost", "1"])
+    assert exit_info.value.code == 1
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+import run_all
+from run_all import Job
+
+
+@pytest.fixture
+def job(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_all, "REPO_ROOT", tmp_path)
+    monkeypatch.setattr(run_all, "STATE_DIR", tmp_path / ".driver_state")
+    out = tmp_path / "g_eval" / "faithfulness_scores" / "gpt-4o-mini_fetaqa.json"
+    out.parent.mkdir(parents=True)
+    data = tmp_path / "data.json"
+    data.write_text("[]")
+    return Job("g_eval.detection:faithfulness:gpt-4o-mini_fetaqa", "g_eval.detection",
+               ["--dataset", "fetaqa", "--model", "gpt-4o-mini"], "gpt-4o-mini", inputs=[data], outputs=[out])
+
+
+def finish(job, jobs):
+    job.outputs[0].write_text(json.dumps({"last_idx": 0, "faithfulness_scores": [3]}))
+    run_all.write_stamp(job, jobs)
+
+
+def test_backend_and_arguments_are_part_of_the_stamp(job, monkeypatch):
+    jobs = {job.name: job}
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    finish(job, jobs)
+    assert run_all.up_to_date(job, jobs)
+    monkeypatch.setenv("LLM_BACKEND", "openai")
+    assert not run_all.up_to_date(job, jobs)
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    job.args = job.args + ["--scoring", "logprobs"]
+    assert not run_all.up_to_date(job, jobs)
+
+
+def test_outputs_of_another_backend_are_set_aside(job, monkeypatch):
+    jobs = {job.name: job}
+    monkeypatch.setenv("LLM_BACKEND", "mock")
+    finish(job, jobs)
+    assert run_all.set_aside_stale_outputs(job) == []
+    monkeypatch.setenv("LLM_BACKEND", "openai")
+    moved = run_all.set_aside_stale_outputs(job)
+    assert len(moved) == 1 and moved[0].name == "gpt-4o-mini_fetaqa.json"
+    assert not job.outputs[0].exists()
+
+
+def test_mitigation_model_gets_its_own_jobs_and_files():
+    jobs = run_all.build_jobs(["fetaqa"], ["gpt-4o-mini"], ["mtraig"], mitigation_model="gpt-4o")
+    mitigation = jobs["mtraig.mitigation:gpt-4o-mini_fetaqa_by_gpt-4o"]
+    assert mitigation.model == "gpt-4o"
+    assert mitigation.outputs[0].name == "gpt-4o-mini_fetaqa_by_gpt-4o.jsonl"
+    evaluation = jobs["mtraig.automated_eval:gpt-4o-mini_fetaqa_by_gpt-4o"]
+    assert "--mitigation_model" in evaluation.args and evaluation.model == "gpt-4o-mini"
+    shares = run_all.rate_shares(jobs, 4, 600, None)
+    assert shares == {"gpt-4o-mini": ["--rpm", "600"], "gpt-4o": ["--rpm", "600"]}
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from g_eval import automated_eval, detection, mitigation
+from g_eval.helpers import automated_eval_utils
+from g_eval.helpers.mitigation_utils import needs_mitigation
+from g_eval.helpers.openai_utils import GREEDY, Scoring
+
+LOGPROBS = Scoring("logprobs")
+
+
+def test_thresholds_keep_greedy_semantics():
+    # human (oracle) scores may be fractional averages; they keep "below 5"
+    assert needs_mitigation(4.67)
+    assert not needs_mitigation(5.0)
+    assert not needs_mitigation(4.67, LOGPROBS)
+    assert needs_mitigation(4.4, Scoring("samples"))
+
+
+def test_scoring_methods_keep_separate_checkpoints(tmp_path, dataset_dir):
+    run = dict(mode="both", data_dir=str(dataset_dir), checkpoint_dir=str(tmp_path / "ck"), results_dir=str(tmp_path / "res"))
+    detection.evaluate("fetaqa", **run)
+    greedy_ck = tmp_path / "ck" / "faithfulness" / "gpt-4o-mini_fetaqa.json"
+    before = greedy_ck.read_text()
+
+    # a complete greedy checkpoint does not stand in for logprob scores
+    detection.evaluate("fetaqa", scoring=LOGPROBS, **run)
+    assert greedy_ck.read_text() == before
+    for metric in ("faithfulness", "completeness"):
+        ck = json.loads((tmp_path / "ck" / metric / "gpt-4o-mini_fetaqa_logprobs.json").read_text())
+        assert ck["last_idx"] == 5
+        results = (tmp_path / "res" / metric / "gpt-4o-mini_fetaqa_logprobs.txt").read_text()
+        assert "Scoring: logprobs (top 5)" in results
+        assert "Scoring:" not in (tmp_path / "res" / metric / "gpt-4o-mini_fetaqa.txt").read_text()
+
+
+def test_mitigation_and_automated_eval_follow_the_method(tmp_path, dataset_dir, monkeypatch):
+    for name, metric in (("FAITH_CKPT_DIR", "faithfulness"), ("COMP_CKPT_DIR", "completeness")):
+        monkeypatch.setattr(mitigation, name, tmp_path / "ck" / metric)
+    monkeypatch.setattr(mitigation, "DATA_DIR", dataset_dir)
+    monkeypatch.setattr(mitigation, "NORMAL_OUT_DIR", tmp_path / "mit")
+    monkeypatch.setattr(automated_eval_utils, "CKPT_DIR_FAITH", tmp_path / "ck" / "faithfulness")
+    monkeypatch.setattr(automated_eval_utils, "CKPT_DIR_COMP", tmp_path / "ck" / "completeness")
+    monkeypatch.setattr(automated_eval_utils, "DATA_DIR", dataset_dir)
+    monkeypatch.setattr(automated_eval, "MITIG_DIR", tmp_path / "mit")
+    for key in list(automated_eval.AE_CKPT_DIRS):
+        monkeypatch.setitem(automated_eval.AE_CKPT_DIRS, key, tmp_path / "ae" / key[0] / key[1])
+        monkeypatch.setitem(automated_eval.RESULTS_DIRS, key, tmp_path / "ae_res" / key[0] / key[1])
+
+    detection.evaluate(
+        "fetaqa", mode="both", data_dir=str(dataset_dir), checkpoint_dir=str(tmp_path / "ck"),
+        results_dir=str(tmp_path / "res"), scoring=LOGPROBS
+    )
+    examples = mitigation.load_examples("fetaqa", "gpt-4o-mini", scoring=LOGPROBS)
+    assert examples and all(ex["scoring"] == LOGPROBS for ex in examples)
+    mitigation.run_mitigation("fetaqa", "normal", scoring=LOGPROBS)
+    assert (tmp_path / "mit" / "gpt-4o-mini_fetaqa_logprobs.jsonl").exists()
+    assert not (tmp_path / "mit" / "gpt-4o-mini_fetaqa.jsonl").exists()
+
+    automated_eval.evaluate_mitigation("fetaqa", "gpt-4o-mini", "normal", "both", scoring=LOGPROBS)
+    assert (tmp_path / "ae" / "normal" / "faithfulness" / "gpt-4o-mini_fetaqa_logprobs.json").exists()
+    # the greedy steps find no greedy detection run to start from
+    with pytest.raises(FileNotFoundError):
+        mitigation.load_examples("fetaqa", "gpt-4o-mini", scoring=GREEDY)